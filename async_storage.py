@@ -0,0 +1,40 @@
+"""
+Async Storage
+asyncio variant of the storage backend API for async Flask views
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+class AsyncStorage:
+    """Wraps a StorageBackend so every method returns an awaitable
+
+    Backend calls are blocking network or disk I/O, so each one runs on a
+    shared thread pool; independent reads started together with
+    asyncio.gather overlap, and a page waits only for the slowest of them.
+    """
+
+    def __init__(self, backend, max_workers=16):
+        self.backend = backend
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='async-storage')
+        self.methods = {}
+
+    def __getattr__(self, name):
+        method = getattr(self.backend, name)
+        if not callable(method):
+            return method
+
+        wrapper = self.methods.get(name)
+        if wrapper is None:
+            @functools.wraps(method)
+            async def wrapper(*args, **kwargs):
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+            self.methods[name] = wrapper
+        return wrapper
+
+def create_async_storage(backend):
+    """Create the async view of a backend, sized by ASYNC_STORAGE_WORKERS"""
+    return AsyncStorage(backend, max_workers=int(os.getenv('ASYNC_STORAGE_WORKERS', '16')))
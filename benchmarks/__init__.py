@@ -0,0 +1,4 @@
+"""
+Benchmarks
+Micro-benchmarks for scoring and data-access hot paths, run against a local backend
+"""
@@ -0,0 +1,156 @@
+"""
+Benchmark Runner
+Times scoring and data-access hot paths against the SQLite backend and emits JSON
+
+Usage:
+    python -m benchmarks.run_benchmarks --sizes 1000,10000 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from firebase_paths import generate_push_id
+from matching import CandidateBlock, calculate_compatibility_score, calculate_location_score, score_candidates
+from sqlite_service import SQLiteService
+from benchmarks.synthetic import SyntheticData
+
+def summarize(durations_ns):
+    """Latency summary in microseconds"""
+    durations = sorted(duration / 1000 for duration in durations_ns)
+    if len(durations) > 1:
+        percentiles = statistics.quantiles(durations, n=100, method='inclusive')
+    else:
+        percentiles = durations * 99
+    return {
+        'calls': len(durations),
+        'mean_us': statistics.fmean(durations),
+        'min_us': durations[0],
+        'p50_us': percentiles[49],
+        'p95_us': percentiles[94],
+        'p99_us': percentiles[98],
+        'max_us': durations[-1]
+    }
+
+def time_calls(function, calls):
+    """Time function(*args) for every args tuple in calls"""
+    durations = []
+    for args in calls:
+        start = time.perf_counter_ns()
+        function(*args)
+        durations.append(time.perf_counter_ns() - start)
+    return summarize(durations)
+
+def dataset_path(database_path, size, seed):
+    """SQLite file for one dataset size and seed, so every run loads into an empty database"""
+    if database_path == ':memory:':
+        return database_path
+    root, extension = os.path.splitext(database_path)
+    path = f"{root}-{size}-{seed}{extension or '.db'}"
+    for stale in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(stale):
+            os.remove(stale)
+    return path
+
+def build_dataset(size, seed, database_path, swipers, swipes_per_user):
+    """Load size synthetic users plus swipe histories into a fresh SQLite backend"""
+    data = SyntheticData(seed)
+    service = SQLiteService(dataset_path(database_path, size, seed))
+
+    user_ids = []
+    batch = []
+    for user in data.users(size):
+        batch.append(user)
+        if len(batch) == 10000:
+            user_ids.extend(service.bulk_load(batch))
+            batch = []
+    if batch:
+        user_ids.extend(service.bulk_load(batch))
+
+    swipes = list(data.swipes(user_ids, swipers, swipes_per_user))
+    # Batched so every swipe keeps its synthetic created_at
+    for start in range(0, len(swipes), 10000):
+        service.record_swipes([
+            {'swipe_id': generate_push_id(), 'swiper_id': swiper_id, 'swiped_id': swiped_id,
+             'action': action, 'created_at': created_at}
+            for swiper_id, swiped_id, action, created_at in swipes[start:start + 10000]
+        ])
+    return service, user_ids, swipes
+
+def run_size(size, args):
+    """Run every benchmark against one dataset size"""
+    rng = random.Random(args.seed)
+    load_start = time.perf_counter()
+    # Keep service status messages out of the JSON report
+    with redirect_stdout(sys.stderr):
+        service, user_ids, swipes = build_dataset(size, args.seed, args.database, args.swipers, args.swipes_per_user)
+    load_seconds = time.perf_counter() - load_start
+
+    profiles = service.get_all_profiles()
+    samples = args.samples
+    pairs = [(rng.choice(profiles), rng.choice(profiles)) for _ in range(samples)]
+    swipers = sorted({swiper_id for swiper_id, swiped_id, action, created_at in swipes})
+    active = [rng.choice(swipers) for _ in range(samples)] if swipers else []
+    liked = [(swiper_id, swiped_id) for swiper_id, swiped_id, action, created_at in swipes if action == 'like']
+    like_pairs = [rng.choice(liked) for _ in range(samples)] if liked else []
+
+    block_start = time.perf_counter_ns()
+    block = CandidateBlock(profiles)
+    block_ns = time.perf_counter_ns() - block_start
+    deck_users = [(rng.choice(profiles), block) for _ in range(max(1, samples // 100))]
+
+    results = {
+        'calculate_compatibility_score': time_calls(calculate_compatibility_score, pairs),
+        'calculate_location_score': time_calls(
+            calculate_location_score, [(user['location'], match['location']) for user, match in pairs]
+        ),
+        'score_candidates': time_calls(score_candidates, deck_users),
+        'get_swiped_users': time_calls(service.get_swiped_users, [(user_id,) for user_id in active]),
+        'check_mutual_like': time_calls(service.check_mutual_like, like_pairs),
+        'get_user_matches': time_calls(service.get_user_matches, [(user_id,) for user_id in active]),
+    }
+    results['score_candidates']['candidates'] = len(block)
+    results['candidate_block_build_us'] = block_ns / 1000
+
+    return {
+        'profiles': size,
+        'swipes': len(swipes),
+        'load_seconds': load_seconds,
+        'results': results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Run scoring and data-access micro-benchmarks")
+    parser.add_argument('--sizes', default='1000,10000', help="comma-separated profile counts, e.g. 1000,100000,1000000")
+    parser.add_argument('--samples', type=int, default=2000, help="timed calls per benchmark")
+    parser.add_argument('--swipers', type=int, default=1000, help="users with a swipe history")
+    parser.add_argument('--swipes-per-user', type=int, default=50, help="mean swipes per active user")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', default=':memory:', help="SQLite path, in-memory by default; each size gets its own file next to it")
+    parser.add_argument('--output', help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'samples': args.samples,
+        'runs': [run_size(int(size), args) for size in args.sizes.split(',')]
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Synthetic Data
+Reproducible generator of realistic profiles and swipe histories for benchmarks
+"""
+
+import random
+from datetime import datetime, timedelta
+from matching import INTEREST_VOCABULARY
+
+# (city, relative population, neighborhoods, (lat, lng))
+CITIES = [
+    ('New York, NY', 30, ['Harlem', 'Chelsea', 'East Village', 'Astoria', 'Williamsburg'], (40.7128, -74.0060)),
+    ('Los Angeles, CA', 18, ['Silver Lake', 'Koreatown', 'Echo Park', 'Westwood'], (34.0522, -118.2437)),
+    ('Chicago, IL', 12, ['Wicker Park', 'Lincoln Park', 'Hyde Park'], (41.8781, -87.6298)),
+    ('Austin, TX', 8, ['Hyde Park', 'East Austin', 'South Congress'], (30.2672, -97.7431)),
+    ('Boston, MA', 8, ['Allston', 'Back Bay', 'Jamaica Plain'], (42.3601, -71.0589)),
+    ('Seattle, WA', 7, ['Capitol Hill', 'Fremont', 'Ballard'], (47.6062, -122.3321)),
+    ('Denver, CO', 5, ['Capitol Hill', 'Highlands', 'Baker'], (39.7392, -104.9903)),
+    ('Atlanta, GA', 5, ['Midtown', 'Old Fourth Ward', 'Decatur'], (33.7490, -84.3880)),
+    ('Miami, FL', 4, ['Brickell', 'Wynwood', 'Little Havana'], (25.7617, -80.1918)),
+    ('Portland, OR', 3, ['Alberta', 'Hawthorne', 'Pearl District'], (45.5152, -122.6784)),
+]
+
+# Popularity weights, so some interests are far more common than others
+INTEREST_WEIGHTS = [12, 7, 8, 9, 8, 10, 9, 5, 11, 4, 6, 7]
+
+LIFESTYLE_GROUPS = [
+    (['Early Bird', 'Night Owl', 'Flexible'], [3, 3, 4]),
+    (['Very Social', 'Moderately Social', 'Quiet'], [2, 5, 3]),
+    (['Very Clean', 'Moderately Clean', 'Relaxed'], [3, 5, 2]),
+    (['Love Pets', 'Neutral', 'No Pets'], [3, 5, 2]),
+]
+
+FIRST_NAMES = ['Alex', 'Maya', 'Sam', 'Jessica', 'Mike', 'Sarah', 'Jordan', 'Priya', 'Diego', 'Mei', 'Omar', 'Lena']
+LAST_NAMES = ['Smith', 'Johnson', 'Wilson', 'Brown', 'Davis', 'Miller', 'Garcia', 'Nguyen', 'Patel', 'Kim']
+
+class SyntheticData:
+    """Deterministic generator of profiles and swipes for a given seed"""
+
+    def __init__(self, seed=42):
+        self.random = random.Random(seed)
+        self.city_weights = [weight for city, weight, neighborhoods, center in CITIES]
+
+    def location(self):
+        """A location string: city, neighborhood + city, or browser-style coordinates"""
+        city, weight, neighborhoods, (lat, lng) = self.random.choices(CITIES, self.city_weights)[0]
+        kind = self.random.random()
+        if kind < 0.5:
+            return city
+        if kind < 0.8:
+            return f"{self.random.choice(neighborhoods)}, {city.split(',')[0]}"
+        # Within roughly 15km of the city center, as profile_setup.html would submit
+        return f"{lat + self.random.gauss(0, 0.07):.4f}, {lng + self.random.gauss(0, 0.07):.4f}"
+
+    def profile(self, index):
+        """One profile; ages skew young and budgets are log-normal around $900"""
+        interests = set()
+        for _ in range(self.random.randint(1, 6)):
+            interests.add(self.random.choices(INTEREST_VOCABULARY, INTEREST_WEIGHTS)[0])
+        lifestyle = [
+            self.random.choices(values, weights)[0]
+            for values, weights in LIFESTYLE_GROUPS
+            if self.random.random() < 0.85
+        ]
+        return {
+            'name': f"{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}",
+            'age': min(100, 18 + int(self.random.expovariate(1 / 7))),
+            'budget': max(300, min(5000, int(self.random.lognormvariate(6.8, 0.35)))),
+            'location': self.location(),
+            'bio': f"Synthetic profile {index}",
+            'interests': sorted(interests),
+            'lifestyle_preferences': lifestyle
+        }
+
+    def users(self, count):
+        """(user_data, profile_data) pairs for count users"""
+        for index in range(count):
+            user_data = {
+                'username': f"user{index}",
+                'email': f"user{index}@example.com",
+                'password_hash': 'pbkdf2:sha256:260000$synthetic'
+            }
+            yield user_data, self.profile(index)
+
+    def swipes(self, user_ids, swipers, swipes_per_user=50, like_rate=0.4, reciprocity=0.3):
+        """(swiper_id, swiped_id, action, created_at) tuples for a subset of active users
+
+        A share of likes are returned, so the history contains matches too.
+        """
+        start = datetime(2025, 1, 1)
+        for swiper_id in self.random.sample(user_ids, min(swipers, len(user_ids))):
+            count = min(len(user_ids) - 1, max(1, int(self.random.expovariate(1 / swipes_per_user))))
+            for swiped_id in self.random.sample(user_ids, count):
+                if swiped_id == swiper_id:
+                    continue
+                action = 'like' if self.random.random() < like_rate else 'pass'
+                created_at = (start + timedelta(seconds=self.random.randrange(86400 * 180))).isoformat()
+                yield swiper_id, swiped_id, action, created_at
+                if action == 'like' and self.random.random() < reciprocity:
+                    yield swiped_id, swiper_id, 'like', created_at
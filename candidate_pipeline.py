@@ -0,0 +1,150 @@
+"""
+Candidate Pipeline
+Two-stage swipe deck building: bounded candidate generation, then full scoring
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from matching import select_top_candidates
+from profile_index import profile_index
+from score_cache import pair_scores
+from stats import percentile_ms
+
+class StageStats:
+    """Rolling timings and running counters for one pipeline stage"""
+
+    def __init__(self, window=1024):
+        self.durations = deque(maxlen=window)
+        self.runs = 0
+        self.items_in = 0
+        self.items_out = 0
+
+    def record(self, duration, items_in, items_out):
+        self.durations.append(duration)
+        self.runs += 1
+        self.items_in += items_in
+        self.items_out += items_out
+
+    def snapshot(self):
+        durations = list(self.durations)
+        return {
+            'runs': self.runs,
+            'items_in': self.items_in,
+            'items_out': self.items_out,
+            'p50_ms': percentile_ms(durations, 0.50),
+            'p99_ms': percentile_ms(durations, 0.99),
+            'max_ms': None if not durations else max(durations) * 1000
+        }
+
+class CandidatePipeline:
+    """Builds ranked swipe decks with bounded work per request
+
+    Stage one merges candidate sources from the profile index, in priority
+    order: location pool inside the budget/age scoring windows, location
+    pool, scoring windows, recent sign-ups, and finally a random sample of
+    everyone when those are thin. Already-swiped IDs are excluded and the
+    merged set is capped at max_candidates. Stage two runs the full
+    compatibility scorer on that set only, so scoring cost is bounded by
+    max_candidates however many profiles exist, and pairs already in the
+    score cache are not rescored.
+    """
+
+    SOURCES = ('location_window', 'location', 'window', 'recent', 'backfill')
+
+    def __init__(self, index, max_candidates=2000, recent_signups=100, timing_window=1024, score_cache=None):
+        self.index = index
+        self.score_cache = score_cache
+        self.max_candidates = max_candidates
+        self.recent_signups = recent_signups
+        self.lock = threading.Lock()
+        self.generate_stats = StageStats(timing_window)
+        self.rank_stats = StageStats(timing_window)
+        self.source_counts = dict.fromkeys(self.SOURCES, 0)
+        self.capped_builds = 0
+
+    def generate(self, user_id, user_profile, excluded_ids=(), min_pool=1):
+        """Stage one: candidate IDs from the index sources, capped at max_candidates
+
+        Returns (candidate profiles, per-source counts).
+        """
+        user_id = str(user_id)
+        excluded = set(excluded_ids)
+        excluded.add(user_id)
+        location_ids = self.index.location_pool(user_profile)
+        window_ids = self.index.in_scoring_windows(user_profile)
+
+        sources = []
+        if location_ids is not None and window_ids is not None:
+            sources.append(('location_window', [uid for uid in location_ids if uid in window_ids]))
+        if location_ids is not None:
+            sources.append(('location', location_ids))
+        if window_ids is not None:
+            sources.append(('window', window_ids))
+        sources.append(('recent', self.index.recent_signups(self.recent_signups)))
+
+        selected = {}
+        counts = dict.fromkeys(self.SOURCES, 0)
+        capped = False
+        for name, user_ids in sources:
+            for candidate_id in user_ids:
+                if candidate_id in excluded or candidate_id in selected:
+                    continue
+                if len(selected) >= self.max_candidates:
+                    capped = True
+                    break
+                selected[candidate_id] = name
+                counts[name] += 1
+            if capped:
+                break
+
+        if len(selected) < min_pool and not capped:
+            # Thin pool: top up with a random sample of everyone else
+            remaining = [uid for uid in self.index.user_ids() if uid not in excluded and uid not in selected]
+            room = self.max_candidates - len(selected)
+            for candidate_id in random.sample(remaining, min(room, len(remaining))):
+                selected[candidate_id] = 'backfill'
+                counts['backfill'] += 1
+
+        with self.lock:
+            if capped:
+                self.capped_builds += 1
+            for name, count in counts.items():
+                self.source_counts[name] += count
+        return self.index.profiles_by_id(selected), counts
+
+    def build(self, user_id, user_profile, excluded_ids, k, jitter=True):
+        """Run both stages and return the top k (score, profile) cards, best first"""
+        started = time.perf_counter()
+        candidates, counts = self.generate(user_id, user_profile, excluded_ids, min_pool=k)
+        generated = time.perf_counter()
+        # Jitter and cached scores are keyed by the viewer's ID
+        user_profile = dict(user_profile, user_id=str(user_id))
+        cards = select_top_candidates(user_profile, candidates, k, jitter, self.score_cache)
+        ranked = time.perf_counter()
+
+        with self.lock:
+            self.generate_stats.record(generated - started, len(self.index.profiles), len(candidates))
+            self.rank_stats.record(ranked - generated, len(candidates), len(cards))
+        return cards
+
+    def stats(self):
+        """Per-stage timings and counters"""
+        with self.lock:
+            return {
+                'max_candidates': self.max_candidates,
+                'generate': self.generate_stats.snapshot(),
+                'rank': self.rank_stats.snapshot(),
+                'sources': dict(self.source_counts),
+                'capped_builds': self.capped_builds
+            }
+
+# Create instance
+candidate_pipeline = CandidatePipeline(
+    profile_index,
+    max_candidates=int(os.getenv('CANDIDATE_LIMIT', '2000')),
+    recent_signups=int(os.getenv('CANDIDATE_RECENT_SIGNUPS', '100')),
+    score_cache=pair_scores
+)
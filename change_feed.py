@@ -0,0 +1,194 @@
+"""
+Profile Change Feed
+Applies profile writes from the storage backend's change feed to the candidate
+index and the ranked swipe decks, one affected pair at a time
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from stats import percentile_ms
+from matching import calculate_compatibility_score
+from profile_index import profile_index
+from swipe_deck import profile_version, swipe_decks
+
+class ProfileChangeFeed:
+    """Incrementally rescores swipe decks as profiles change
+
+    Changes are coalesced per user while they wait, so a burst of edits to
+    one profile is applied once. When max_pending users are already waiting,
+    the producer is blocked for up to block_timeout seconds (backpressure on
+    the change stream); if the backlog still has not drained, it is dropped
+    in favour of a full resync: the index reloads and decks rebuild lazily.
+    """
+
+    def __init__(self, storage, index, decks, max_pending=1000, block_timeout=2.0,
+                 batch_size=100, lag_window=1024, clock=time.monotonic):
+        self.storage = storage
+        self.index = index
+        self.decks = decks
+        self.max_pending = max_pending
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self.clock = clock
+        self.pending = OrderedDict()
+        self.resync_requested = False
+        self.condition = threading.Condition()
+        self.watch = None
+        self.thread = None
+        self.running = False
+        self.lags = deque(maxlen=lag_window)
+        self.source_lags = deque(maxlen=lag_window)
+        self.received = 0
+        self.coalesced = 0
+        self.applied = 0
+        self.patched_cards = 0
+        self.blocked = 0
+        self.resyncs = 0
+        self.errors = 0
+
+    def start(self):
+        """Subscribe to the backend's change feed; False when it has none"""
+        if self.running:
+            return True
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='profile-change-feed', daemon=True)
+        self.thread.start()
+        self.watch = self.storage.watch_profiles(self.enqueue)
+        if self.watch is None:
+            self.stop()
+            return False
+        print("✅ Profile change feed started")
+        return True
+
+    def stop(self):
+        """Unsubscribe and stop the worker"""
+        if self.watch is not None:
+            self.watch.close()
+            self.watch = None
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def enqueue(self, user_id):
+        """Record a changed profile (None requests a full resync)"""
+        with self.condition:
+            self.received += 1
+            if user_id is None:
+                self.resync_requested = True
+                self.pending.clear()
+            elif user_id in self.pending:
+                self.coalesced += 1
+            else:
+                if len(self.pending) >= self.max_pending:
+                    self.blocked += 1
+                    deadline = self.clock() + self.block_timeout
+                    while len(self.pending) >= self.max_pending and self.running:
+                        remaining = deadline - self.clock()
+                        if remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+                    if len(self.pending) >= self.max_pending:
+                        # Still saturated: drop the backlog and resync instead
+                        self.resync_requested = True
+                        self.pending.clear()
+                        self.condition.notify_all()
+                        return
+                self.pending[str(user_id)] = self.clock()
+            self.condition.notify_all()
+
+    def run(self):
+        """Worker loop: apply pending changes in arrival order"""
+        while True:
+            with self.condition:
+                while self.running and not self.pending and not self.resync_requested:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                resync = self.resync_requested
+                self.resync_requested = False
+                batch = []
+                while self.pending and len(batch) < self.batch_size:
+                    batch.append(self.pending.popitem(last=False))
+                # Room was freed for blocked producers
+                self.condition.notify_all()
+
+            if resync:
+                self.resync()
+            for user_id, received_at in batch:
+                try:
+                    self.apply(user_id, received_at)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Error applying profile change for {user_id}: {e}")
+
+    def resync(self):
+        """Fall back to a full reload when changes were missed or dropped"""
+        self.index.invalidate()
+        self.decks.clear()
+        self.resyncs += 1
+
+    def apply(self, user_id, received_at):
+        """Update the index entry and rescore the decks holding one changed profile"""
+        profile = self.storage.get_profile(user_id)
+        if profile is None:
+            self.index.remove(user_id)
+            self.decks.invalidate(user_id)
+            patched = self.decks.rescore(user_id, None, None)
+        else:
+            profile = dict(profile, user_id=user_id)
+            self.index.upsert(user_id, profile)
+            # The user's own deck is rebuilt on their next visit when the edit changed its ranking basis
+            if self.decks.needs_refill(user_id, profile):
+                self.decks.invalidate(user_id)
+            patched = self.decks.rescore(user_id, profile, calculate_compatibility_score)
+
+        now = self.clock()
+        with self.condition:
+            self.applied += 1
+            self.patched_cards += patched
+            self.lags.append(now - received_at)
+            written_at = profile_version(profile) if profile else None
+            if written_at:
+                try:
+                    self.source_lags.append((datetime.now() - datetime.fromisoformat(written_at)).total_seconds())
+                except ValueError:
+                    pass
+
+    def stats(self):
+        """Throughput, backlog and lag counters"""
+        with self.condition:
+            lags = list(self.lags)
+            source_lags = list(self.source_lags)
+            return {
+                'running': self.running,
+                'pending': len(self.pending),
+                'received': self.received,
+                'coalesced': self.coalesced,
+                'applied': self.applied,
+                'patched_cards': self.patched_cards,
+                'blocked_producers': self.blocked,
+                'resyncs': self.resyncs,
+                'errors': self.errors,
+                # Time from receiving a change to applying it
+                'apply_lag_p50_ms': percentile_ms(lags, 0.50),
+                'apply_lag_p99_ms': percentile_ms(lags, 0.99),
+                # Time from the profile write (its version stamp) to applying it
+                'end_to_end_lag_p99_ms': percentile_ms(source_lags, 0.99)
+            }
+
+def create_change_feed(storage):
+    """Create the change feed for a backend, started unless CHANGE_FEED=off"""
+    feed = ProfileChangeFeed(
+        storage, profile_index, swipe_decks,
+        max_pending=int(os.getenv('CHANGE_FEED_MAX_PENDING', '1000')),
+        block_timeout=float(os.getenv('CHANGE_FEED_BLOCK_TIMEOUT', '2'))
+    )
+    if os.getenv('CHANGE_FEED', 'on').lower() not in ('off', '0', 'false'):
+        feed.start()
+    return feed
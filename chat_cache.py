@@ -0,0 +1,55 @@
+"""
+Chat Response Cache
+Bounded LRU+TTL cache of RoomieBot replies keyed by the normalized prompt
+"""
+
+import re
+import threading
+import unicodedata
+from cache import TTLCache
+
+_WHITESPACE = re.compile(r'\s+')
+_EDGE_PUNCTUATION = ' \t\n.,!?;:…"\'`'
+
+def normalize_message(message):
+    """Canonical form of a chat prompt: case, spacing and trailing punctuation ignored"""
+    message = unicodedata.normalize('NFKC', message or '').casefold()
+    return _WHITESPACE.sub(' ', message).strip(_EDGE_PUNCTUATION)
+
+class ChatResponseCache:
+    """Serves repeated prompts, such as the quick-topic buttons, from memory
+
+    Entries are keyed by the normalized message within a namespace (the
+    model URL), so switching models never serves the old model's replies.
+    Personalized prompts opt out: they are neither looked up nor stored.
+    """
+
+    def __init__(self, maxsize=512, ttl=3600, namespace=''):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.bypassed = 0
+
+    def key(self, message):
+        return (self.namespace, normalize_message(message))
+
+    def get(self, message, personalized=False):
+        """Cached reply for a prompt, or None"""
+        if personalized:
+            with self.lock:
+                self.bypassed += 1
+            return None
+        return self.cache.get(self.key(message))
+
+    def set(self, message, response, personalized=False):
+        """Store a model reply (not fallbacks) for a prompt"""
+        if not personalized and response:
+            self.cache.set(self.key(message), response)
+
+    def clear(self):
+        """Drop every cached reply"""
+        self.cache.clear()
+
+    def stats(self):
+        """Hit rate and cache counters, plus prompts that opted out"""
+        return dict(self.cache.stats(), bypassed=self.bypassed)
@@ -0,0 +1,98 @@
+"""
+Circuit Breaker
+Stops calling a failing upstream service for a while, then probes it again
+"""
+
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitBreaker:
+    """Classic three-state breaker around calls to one upstream
+
+    Closed: calls go through and consecutive failures are counted; reaching
+    failure_threshold opens the breaker. Open: calls are refused (the caller
+    serves its fallback) until reset_timeout seconds have passed. Half-open:
+    up to half_open_max_calls probe calls go through; a success closes the
+    breaker and a failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, half_open_max_calls=1,
+                 history=50, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.state_since = clock()
+        self.consecutive_failures = 0
+        self.probes = 0
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.transitions = {}
+        self.history = deque(maxlen=history)
+
+    def transition(self, state):
+        """Move to a new state; called with the lock held"""
+        previous = self.state
+        self.state = state
+        self.state_since = self.clock()
+        self.probes = 0
+        key = f"{previous}->{state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        self.history.append({'from': previous, 'to': state, 'at': time.time()})
+        marker = '✅' if state == CLOSED else '❌'
+        print(f"{marker} {self.name} circuit breaker {previous} -> {state}")
+
+    def allow(self):
+        """Whether a call may go to the upstream now; refused calls use the fallback"""
+        with self.lock:
+            if self.state == OPEN and self.clock() - self.state_since >= self.reset_timeout:
+                self.transition(HALF_OPEN)
+            if self.state == CLOSED or (self.state == HALF_OPEN and self.probes < self.half_open_max_calls):
+                if self.state == HALF_OPEN:
+                    self.probes += 1
+                self.calls += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                self.transition(CLOSED)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or (
+                    self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self.transition(OPEN)
+
+    def stats(self):
+        """Current state, counters and recent state transitions"""
+        with self.lock:
+            return {
+                'state': self.state,
+                'state_seconds': self.clock() - self.state_since,
+                'consecutive_failures': self.consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'calls': self.calls,
+                'successes': self.successes,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'transitions': dict(self.transitions),
+                'recent_transitions': list(self.history)
+            }
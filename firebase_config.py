@@ -8,16 +8,39 @@ from firebase_admin import credentials, db
 import os
 from dotenv import load_dotenv
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from cache import TTLCache
+from storage_backend import StorageBackend
+from matching import normalize_profile_fields
+from replica import FirebaseReplica
+from firebase_paths import (
+    batch_swipe_paths, build_user_matches, generate_push_id, identity_paths, match_paths,
+    matched_user_ids, normalize_email, pair_match_id, swipe_paths, swipes_from_index, username_path
+)
 
 # Load environment variables
 load_dotenv()
 
-class FirebaseService:
+class IdentityTakenError(Exception):
+    """Raised inside a claim transaction when a username or email is already in use"""
+
+class FirebaseService(StorageBackend):
     def __init__(self):
         self.app = None
         self.db = None
+        # Shared pool for concurrent reads such as batched profile loads
+        self.fetch_executor = ThreadPoolExecutor(max_workers=int(os.getenv('PROFILE_FETCH_WORKERS', '8')))
+        # Profiles read on every page load, invalidated whenever they are written
+        self.profile_cache = TTLCache(
+            maxsize=int(os.getenv('PROFILE_CACHE_SIZE', '1024')),
+            ttl=float(os.getenv('PROFILE_CACHE_TTL', '60'))
+        )
+        # Optional in-memory mirror serving reads, see replica.py
+        self.replica = None
         self.initialize_firebase()
+        if self.db is not None and os.getenv('FIREBASE_REPLICA', 'off').lower() in ('on', '1', 'true'):
+            self.start_replica()
     
     def initialize_firebase(self):
         """Initialize Firebase Admin SDK"""
@@ -65,18 +88,88 @@ class FirebaseService:
         """Check if Firebase is connected"""
         return self.db is not None
     
+    def start_replica(self):
+        """Mirror profiles, swipes and matches in memory and serve reads from the mirror"""
+        try:
+            self.replica = FirebaseReplica(
+                self.db,
+                max_staleness=float(os.getenv('REPLICA_MAX_STALENESS', '5')),
+                heartbeat_interval=float(os.getenv('REPLICA_HEARTBEAT_INTERVAL', '1')),
+                resync_after=float(os.getenv('REPLICA_RESYNC_AFTER', '30'))
+            )
+            self.replica.start()
+        except Exception as e:
+            print(f"❌ Firebase replica failed to start: {e}")
+            self.replica = None
+    
+    def mirror(self):
+        """The replica when it is fresh enough to serve reads, otherwise None"""
+        if self.replica is not None and self.replica.serving():
+            return self.replica
+        return None
+    
+    def replica_stats(self):
+        """Replica health, or None when replica mode is off"""
+        return self.replica.health() if self.replica is not None else None
+    
+    def cache_stats(self):
+        """Hit/miss/eviction counters for the service's caches"""
+        return {'profiles': self.profile_cache.stats()}
+    
     # User Management
     def create_user(self, user_data):
-        """Create a new user in Firebase"""
+        """Create a new user in Firebase
+
+        The username and email index entries are claimed in transactions
+        first, so concurrent signups cannot create duplicate accounts.
+        Returns None if either is already taken.
+        """
         if not self.is_connected():
             return None
         
+        user_id = generate_push_id()
+        claimed = []
         try:
-            user_id = self.db.child('users').push(user_data)
-            return user_id.key
+            for path in identity_paths(user_data['username'], user_data['email']):
+                def claim(current):
+                    if current is not None and current != user_id:
+                        raise IdentityTakenError(path)
+                    return user_id
+                
+                ref = self.db.child(path)
+                ref.transaction(claim)
+                claimed.append(ref)
+            
+            self.db.child('users').child(user_id).set(user_data)
+            return user_id
+        except IdentityTakenError as e:
+            print(f"User not created, {e} is already taken")
         except Exception as e:
             print(f"Error creating user: {e}")
-            return None
+        
+        # Release whatever this signup claimed before failing
+        for ref in claimed:
+            try:
+                ref.delete()
+            except Exception as e:
+                print(f"Error releasing {ref.path}: {e}")
+        return None
+    
+    def is_identity_taken(self, username, email):
+        """Check whether a username or email is already registered"""
+        if not self.is_connected():
+            return False
+        
+        try:
+            if any(self.db.child(path).get() is not None for path in identity_paths(username, email)):
+                return True
+            # Accounts created before the indexes were backfilled (migrate.py users)
+            if self.find_user('username', username)[0] is not None:
+                return True
+            return any(self.find_user('email', value)[0] is not None for value in {email.strip(), normalize_email(email)})
+        except Exception as e:
+            print(f"Error checking username and email: {e}")
+            return False
     
     def get_user(self, user_id):
         """Get user by ID"""
@@ -92,19 +185,29 @@ class FirebaseService:
     def get_user_by_username(self, username):
         """Get user by username"""
         if not self.is_connected():
-            return None
+            return None, None
         
         try:
-            users = self.db.child('users').get()
-            if users:
-                for user_id, user_data in users.items():
-                    if user_data and user_data.get('username') == username:
-                        return user_id, user_data
-            return None, None
+            user_id = self.db.child(username_path(username)).get()
+            if user_id:
+                user_data = self.db.child('users').child(user_id).get()
+                if user_data:
+                    return user_id, user_data
+                return None, None
+            
+            # Accounts created before the usernames index was backfilled
+            return self.find_user('username', username)
         except Exception as e:
             print(f"Error getting user by username: {e}")
             return None, None
     
+    def find_user(self, field, value):
+        """(user_id, user_data) of a user whose field equals value, by the indexed users query"""
+        users = self.db.child('users').order_by_child(field).equal_to(value).limit_to_first(1).get()
+        for user_id, user_data in (users or {}).items():
+            return user_id, user_data
+        return None, None
+    
     def update_user(self, user_id, user_data):
         """Update user data"""
         if not self.is_connected():
@@ -127,7 +230,11 @@ class FirebaseService:
             # Ensure user_id is a string
             user_id_str = str(user_id)
             profile_data['created_at'] = datetime.now().isoformat()
+            normalize_profile_fields(profile_data)
             self.db.child('profiles').child(user_id_str).set(profile_data)
+            self.profile_cache.invalidate(user_id_str)
+            if self.replica is not None:
+                self.replica.apply_update({f"profiles/{user_id_str}": profile_data})
             return True
         except Exception as e:
             print(f"Error creating profile: {e}")
@@ -140,18 +247,50 @@ class FirebaseService:
         
         try:
             user_id_str = str(user_id)
-            return self.db.child('profiles').child(user_id_str).get()
+            mirror = self.mirror()
+            if mirror is not None:
+                return mirror.get('profiles', user_id_str)
+            
+            profile = self.profile_cache.get(user_id_str)
+            if profile is None:
+                profile = self.db.child('profiles').child(user_id_str).get()
+                if profile is None:
+                    return None
+                self.profile_cache.set(user_id_str, profile)
+            # Callers may annotate the profile, so never hand out the cached dict
+            return dict(profile)
         except Exception as e:
             print(f"Error getting profile: {e}")
             return None
     
+    def get_profiles(self, user_ids):
+        """Get several profiles at once, fetched concurrently and deduplicated
+
+        Returns a dict of user ID to profile; missing profiles are left out.
+        """
+        user_ids = list({str(user_id) for user_id in user_ids})
+        if not user_ids:
+            return {}
+        
+        mirror = self.mirror()
+        if mirror is not None:
+            profiles = ((user_id, mirror.get('profiles', user_id)) for user_id in user_ids)
+            return {user_id: profile for user_id, profile in profiles if profile}
+        
+        profiles = self.fetch_executor.map(self.get_profile, user_ids)
+        return {user_id: profile for user_id, profile in zip(user_ids, profiles) if profile}
+    
     def get_all_profiles(self, exclude_user_id=None):
         """Get all profiles except the specified user"""
         if not self.is_connected():
             return []
         
         try:
-            profiles = self.db.child('profiles').get()
+            mirror = self.mirror()
+            if mirror is not None:
+                profiles = dict(mirror.items('profiles'))
+            else:
+                profiles = self.db.child('profiles').get()
             if not profiles:
                 return []
             
@@ -174,7 +313,12 @@ class FirebaseService:
         
         try:
             user_id_str = str(user_id)
+            profile_data['updated_at'] = datetime.now().isoformat()
+            normalize_profile_fields(profile_data)
             self.db.child('profiles').child(user_id_str).update(profile_data)
+            self.profile_cache.invalidate(user_id_str)
+            if self.replica is not None:
+                self.replica.apply_update({f"profiles/{user_id_str}/{key}": value for key, value in profile_data.items()})
             return True
         except Exception as e:
             print(f"Error updating profile: {e}")
@@ -193,29 +337,52 @@ class FirebaseService:
                 'action': action,
                 'created_at': datetime.now().isoformat()
             }
-            self.db.child('swipes').push(swipe_data)
+            # Write the swipe and its per-swiper index entry together
+            updates = swipe_paths(generate_push_id(), swipe_data)
+            self.db.update(updates)
+            if self.replica is not None:
+                self.replica.apply_update(updates)
             return True
         except Exception as e:
             print(f"Error creating swipe: {e}")
             return False
     
+    def record_swipes(self, swipes):
+        """Record a batch of swipes and the matches they complete in one multi-path update"""
+        if not self.is_connected():
+            return None
+        
+        try:
+            def liked_back(swipe):
+                # Has the other user already liked the swiper?
+                if swipe['action'] != 'like':
+                    return False
+                likes = self.db.child('likes_received').child(str(swipe['swiper_id']))
+                return likes.child(str(swipe['swiped_id'])).get() is not None
+            
+            # Keyed like lookups are independent, so run them concurrently
+            updates, matched = batch_swipe_paths(swipes, list(self.fetch_executor.map(liked_back, swipes)))
+            self.db.update(updates)
+            if self.replica is not None:
+                self.replica.apply_update(updates)
+            return matched
+        except Exception as e:
+            print(f"Error recording swipes: {e}")
+            return None
+    
     def get_user_swipes(self, user_id):
         """Get all swipes made by a user"""
         if not self.is_connected():
             return []
         
         try:
-            swipes = self.db.child('swipes').get()
-            if not swipes:
-                return []
-            
-            user_swipes = []
             user_id_str = str(user_id)
-            for swipe_id, swipe_data in swipes.items():
-                if swipe_data and swipe_data.get('swiper_id') == user_id_str:
-                    user_swipes.append(swipe_data)
-            
-            return user_swipes
+            mirror = self.mirror()
+            if mirror is not None:
+                entries = mirror.get('swipes_by_user', user_id_str)
+            else:
+                entries = self.db.child('swipes_by_user').child(user_id_str).get()
+            return swipes_from_index(user_id_str, entries)
         except Exception as e:
             print(f"Error getting user swipes: {e}")
             return []
@@ -226,52 +393,97 @@ class FirebaseService:
             return []
         
         try:
-            swipes = self.db.child('swipes').get()
-            if not swipes:
-                return []
-            
-            swiped_ids = []
-            user_id_str = str(user_id)
-            for swipe_id, swipe_data in swipes.items():
-                if swipe_data and swipe_data.get('swiper_id') == user_id_str:
-                    swiped_ids.append(swipe_data.get('swiped_id'))
+            mirror = self.mirror()
+            if mirror is not None:
+                return mirror.keys('swipes_by_user', str(user_id))
             
-            return swiped_ids
+            # Shallow read returns only the swiped IDs, not the entries
+            swiped = self.db.child('swipes_by_user').child(str(user_id)).get(shallow=True)
+            return list(swiped) if swiped else []
         except Exception as e:
             print(f"Error getting swiped users: {e}")
             return []
     
+    def record_swipe(self, swiper_id, swiped_id, action):
+        """Record a swipe and, for a returned like, the match
+
+        Returns (success, matched). Costs one multi-path write, plus for a
+        like one keyed read and a second write when it completes a match,
+        however large the swipes table is.
+        """
+        if not self.is_connected():
+            return False, False
+        
+        try:
+            swiper_id_str = str(swiper_id)
+            swiped_id_str = str(swiped_id)
+            now = datetime.now().isoformat()
+            swipe_data = {
+                'swiper_id': swiper_id_str,
+                'swiped_id': swiped_id_str,
+                'action': action,
+                'created_at': now
+            }
+            updates = swipe_paths(generate_push_id(), swipe_data)
+            self.db.update(updates)
+            if self.replica is not None:
+                self.replica.apply_update(updates)
+            
+            matched = False
+            if action == 'like':
+                # Has the other user already liked the swiper? Asked of Firebase,
+                # never the replica, and only once our like is stored: of two
+                # users liking each other at once, at least one sees the other
+                matched = self.db.child('likes_received').child(swiper_id_str).child(swiped_id_str).get() is not None
+                if matched:
+                    match_data = {
+                        'user1_id': swiper_id_str,
+                        'user2_id': swiped_id_str,
+                        'created_at': now
+                    }
+                    updates = match_paths(pair_match_id(swiper_id_str, swiped_id_str), match_data)
+                    self.db.update(updates)
+                    if self.replica is not None:
+                        self.replica.apply_update(updates)
+            return True, matched
+        except Exception as e:
+            print(f"Error recording swipe: {e}")
+            return False, False
+    
     def check_mutual_like(self, user1_id, user2_id):
         """Check if two users have liked each other"""
         if not self.is_connected():
             return False
         
         try:
-            swipes = self.db.child('swipes').get()
-            if not swipes:
-                return False
-            
-            user1_liked_user2 = False
-            user2_liked_user1 = False
             user1_id_str = str(user1_id)
             user2_id_str = str(user2_id)
+            mirror = self.mirror()
+            if mirror is not None:
+                return (mirror.get('likes_received', user2_id_str, user1_id_str) is not None
+                        and mirror.get('likes_received', user1_id_str, user2_id_str) is not None)
             
-            for swipe_id, swipe_data in swipes.items():
-                if swipe_data:
-                    swiper_id = swipe_data.get('swiper_id')
-                    swiped_id = swipe_data.get('swiped_id')
-                    action = swipe_data.get('action')
-                    
-                    if swiper_id == user1_id_str and swiped_id == user2_id_str and action == 'like':
-                        user1_liked_user2 = True
-                    elif swiper_id == user2_id_str and swiped_id == user1_id_str and action == 'like':
-                        user2_liked_user1 = True
-            
-            return user1_liked_user2 and user2_liked_user1
+            likes = self.db.child('likes_received')
+            return (likes.child(user2_id_str).child(user1_id_str).get() is not None
+                    and likes.child(user1_id_str).child(user2_id_str).get() is not None)
         except Exception as e:
             print(f"Error checking mutual like: {e}")
             return False
     
+    def has_liked(self, liker_id, liked_id):
+        """Check if one user's latest swipe on another is a like"""
+        if not self.is_connected():
+            return False
+        
+        try:
+            mirror = self.mirror()
+            if mirror is not None:
+                return mirror.get('likes_received', str(liked_id), str(liker_id)) is not None
+            return self.db.child('likes_received').child(str(liked_id)).child(str(liker_id)).get() is not None
+        except Exception as e:
+            print(f"Error checking like: {e}")
+            return False
+    
     # Matches Management
     def create_match(self, user1_id, user2_id):
         """Create a match between two users"""
@@ -284,7 +496,10 @@ class FirebaseService:
                 'user2_id': str(user2_id),
                 'created_at': datetime.now().isoformat()
             }
-            self.db.child('matches').push(match_data)
+            updates = match_paths(pair_match_id(user1_id, user2_id), match_data)
+            self.db.update(updates)
+            if self.replica is not None:
+                self.replica.apply_update(updates)
             return True
         except Exception as e:
             print(f"Error creating match: {e}")
@@ -296,172 +511,106 @@ class FirebaseService:
             return []
         
         try:
-            matches = self.db.child('matches').get()
+            mirror = self.mirror()
+            if mirror is not None:
+                matches = mirror.get('matches_by_user', str(user_id))
+            else:
+                matches = self.db.child('matches_by_user').child(str(user_id)).get()
             if not matches:
                 return []
             
-            user_matches = []
-            user_id_str = str(user_id)
-            for match_id, match_data in matches.items():
-                if match_data:
-                    if match_data.get('user1_id') == user_id_str or match_data.get('user2_id') == user_id_str:
-                        # Get profile data for both users
-                        user1_profile = self.get_profile(match_data.get('user1_id'))
-                        user2_profile = self.get_profile(match_data.get('user2_id'))
-                        
-                        if user1_profile and user2_profile:
-                            match_info = {
-                                'match_id': match_id,
-                                'user1_id': match_data.get('user1_id'),
-                                'user2_id': match_data.get('user2_id'),
-                                'user1_name': user1_profile.get('name'),
-                                'user1_bio': user1_profile.get('bio'),
-                                'user1_location': user1_profile.get('location'),
-                                'user2_name': user2_profile.get('name'),
-                                'user2_bio': user2_profile.get('bio'),
-                                'user2_location': user2_profile.get('location'),
-                                'created_at': match_data.get('created_at')
-                            }
-                            user_matches.append(match_info)
-            
-            return user_matches
+            # Load every profile involved once, concurrently
+            profiles = self.get_profiles(matched_user_ids(matches))
+            return build_user_matches(matches, profiles)
         except Exception as e:
             print(f"Error getting user matches: {e}")
             return []
     
-    # Sample Data
-    def add_sample_data(self):
-        """Add sample data to Firebase"""
+    # Change Feed
+    def watch_profiles(self, on_change):
+        """Stream profile writes with the Admin SDK listen() API"""
         if not self.is_connected():
-            return False
+            return None
         
-        try:
-            # Sample users
-            sample_users = [
-                {
-                    'username': 'alex_smith',
-                    'email': 'alex@example.com',
-                    'password_hash': 'pbkdf2:sha256:260000$...',  # You'll need to generate real hashes
-                    'created_at': datetime.now().isoformat()
-                },
-                {
-                    'username': 'maya_johnson',
-                    'email': 'maya@example.com',
-                    'password_hash': 'pbkdf2:sha256:260000$...',
-                    'created_at': datetime.now().isoformat()
-                },
-                {
-                    'username': 'sam_wilson',
-                    'email': 'sam@example.com',
-                    'password_hash': 'pbkdf2:sha256:260000$...',
-                    'created_at': datetime.now().isoformat()
-                },
-                {
-                    'username': 'jessica_brown',
-                    'email': 'jessica@example.com',
-                    'password_hash': 'pbkdf2:sha256:260000$...',
-                    'created_at': datetime.now().isoformat()
-                },
-                {
-                    'username': 'mike_davis',
-                    'email': 'mike@example.com',
-                    'password_hash': 'pbkdf2:sha256:260000$...',
-                    'created_at': datetime.now().isoformat()
-                },
-                {
-                    'username': 'sarah_miller',
-                    'email': 'sarah@example.com',
-                    'password_hash': 'pbkdf2:sha256:260000$...',
-                    'created_at': datetime.now().isoformat()
-                }
-            ]
-            
-            # Add users
-            for user_data in sample_users:
-                user_id = self.create_user(user_data)
-                if user_id:
-                    print(f"Created user: {user_data['username']} with ID: {user_id}")
+        if self.replica is not None:
+            # Follow the replica's own stream, so on_change only fires once
+            # the mirror already holds the new profile
+            def invalidate(user_id):
+                if user_id is None:
+                    self.profile_cache.clear()
+                else:
+                    self.profile_cache.invalidate(user_id)
+                on_change(user_id)
+            return self.replica.subscribe('profiles', invalidate)
+        
+        initial = True
+        def handle_event(event):
+            nonlocal initial
+            path = event.path.strip('/')
+            if not path:
+                if initial and event.event_type == 'put':
+                    # The first event is the full snapshot, already loaded elsewhere
+                    initial = False
+                    return
+                if event.event_type == 'patch' and event.data:
+                    user_ids = {key.split('/')[0] for key in event.data}
+                else:
+                    # The whole node was replaced
+                    self.profile_cache.clear()
+                    on_change(None)
+                    return
+            else:
+                user_ids = {path.split('/')[0]}
             
-            # Sample profiles
-            sample_profiles = [
-                {
-                    'user_id': 'alex_smith',
-                    'name': 'Alex Smith',
-                    'age': 22,
-                    'budget': 600,
-                    'location': 'Downtown',
-                    'bio': 'Love music, gaming, and cooking!',
-                    'interests': '["Music", "Gaming", "Cooking", "Movies"]',
-                    'lifestyle_preferences': '["Night Owl", "Very Social", "Moderately Clean", "Love Pets"]',
-                    'created_at': datetime.now().isoformat()
-                },
-                {
-                    'user_id': 'maya_johnson',
-                    'name': 'Maya Johnson',
-                    'age': 25,
-                    'budget': 750,
-                    'location': 'Midtown',
-                    'bio': 'Fitness enthusiast and nature lover.',
-                    'interests': '["Fitness", "Nature", "Reading", "Photography"]',
-                    'lifestyle_preferences': '["Early Bird", "Quiet", "Very Clean", "Neutral"]',
-                    'created_at': datetime.now().isoformat()
-                },
-                {
-                    'user_id': 'sam_wilson',
-                    'name': 'Sam Wilson',
-                    'age': 23,
-                    'budget': 650,
-                    'location': 'Uptown',
-                    'bio': 'Artist and photographer.',
-                    'interests': '["Art", "Photography", "Travel", "Cooking"]',
-                    'lifestyle_preferences': '["Flexible", "Moderately Social", "Moderately Clean", "Love Pets"]',
-                    'created_at': datetime.now().isoformat()
-                },
-                {
-                    'user_id': 'jessica_brown',
-                    'name': 'Jessica Brown',
-                    'age': 24,
-                    'budget': 700,
-                    'location': 'Downtown',
-                    'bio': 'Tech professional who loves coding.',
-                    'interests': '["Technology", "Gaming", "Movies", "Music"]',
-                    'lifestyle_preferences': '["Night Owl", "Moderately Social", "Moderately Clean", "Neutral"]',
-                    'created_at': datetime.now().isoformat()
-                },
-                {
-                    'user_id': 'mike_davis',
-                    'name': 'Mike Davis',
-                    'age': 26,
-                    'budget': 800,
-                    'location': 'Midtown',
-                    'bio': 'Sports fanatic and outdoor enthusiast.',
-                    'interests': '["Sports", "Fitness", "Nature", "Travel"]',
-                    'lifestyle_preferences': '["Early Bird", "Very Social", "Very Clean", "No Pets"]',
-                    'created_at': datetime.now().isoformat()
-                },
-                {
-                    'user_id': 'sarah_miller',
-                    'name': 'Sarah Miller',
-                    'age': 21,
-                    'budget': 550,
-                    'location': 'Uptown',
-                    'bio': 'Student studying art history.',
-                    'interests': '["Art", "Reading", "Movies", "Nature"]',
-                    'lifestyle_preferences': '["Flexible", "Quiet", "Very Clean", "Neutral"]',
-                    'created_at': datetime.now().isoformat()
-                }
-            ]
+            for user_id in user_ids:
+                self.profile_cache.invalidate(user_id)
+                on_change(user_id)
+        
+        try:
+            return self.db.child('profiles').listen(handle_event)
+        except Exception as e:
+            print(f"Error listening to profiles: {e}")
+            return None
+    
+    # Bulk Operations
+    def iter_node(self, path, batch_size=500):
+        """Stream the children of a node in key order, one batch at a time"""
+        if not self.is_connected():
+            return
+        
+        start_key = None
+        while True:
+            query = self.db.child(path).order_by_key()
+            if start_key is not None:
+                query = query.start_at(start_key)
+            # Fetch one extra child when resuming, since start_at is inclusive
+            limit = batch_size + 1 if start_key is not None else batch_size
+            children = query.limit_to_first(limit).get()
+            if not children:
+                return
             
-            # Add profiles
-            for profile_data in sample_profiles:
-                if self.create_profile(profile_data['user_id'], profile_data):
-                    print(f"Created profile for: {profile_data['name']}")
+            batch = [(key, value) for key, value in children.items() if key != start_key]
+            if not batch:
+                return
+            yield batch
             
-            print("✅ Sample data added to Firebase successfully")
+            if len(batch) < batch_size:
+                return
+            start_key = batch[-1][0]
+    
+    def multi_update(self, updates):
+        """Apply a multi-path update atomically"""
+        if not self.is_connected():
+            return False
+        
+        try:
+            if updates:
+                self.db.update(updates)
+                if self.replica is not None:
+                    self.replica.apply_update(updates)
             return True
-            
         except Exception as e:
-            print(f"❌ Error adding sample data: {e}")
+            print(f"Error applying multi-path update: {e}")
             return False
 
 # Global Firebase service instance
@@ -0,0 +1,189 @@
+"""
+Firebase Paths
+Key generation, multi-path write layouts and index readers shared by the Firebase services
+"""
+
+import random
+import threading
+import time
+
+PUSH_CHARS = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+
+_push_lock = threading.Lock()
+_last_push_time = 0
+_last_rand_chars = [0] * 12
+
+def generate_push_id():
+    """Generate a chronologically ordered Firebase-style push ID on the client
+
+    Lets a record and its index entries be written in one multi-path update.
+    """
+    global _last_push_time, _last_rand_chars
+    with _push_lock:
+        now = int(time.time() * 1000)
+        if now == _last_push_time:
+            # Same millisecond: increment the random suffix to keep ordering
+            for i in range(11, -1, -1):
+                if _last_rand_chars[i] != 63:
+                    _last_rand_chars[i] += 1
+                    break
+                _last_rand_chars[i] = 0
+        else:
+            _last_push_time = now
+            _last_rand_chars = [random.randrange(64) for _ in range(12)]
+
+        time_chars = []
+        for _ in range(8):
+            time_chars.append(PUSH_CHARS[now % 64])
+            now //= 64
+        return ''.join(reversed(time_chars)) + ''.join(PUSH_CHARS[c] for c in _last_rand_chars)
+
+def encode_key(value):
+    """Escape a value for use as a Realtime Database key ('.', '$', '#', '[', ']', '/' are not allowed)"""
+    return ''.join(
+        f"%{ord(char):02X}" if char in '.$#[]/%' or ord(char) < 32 or ord(char) == 127 else char
+        for char in value
+    )
+
+def normalize_email(email):
+    """Canonical form of an email address for uniqueness checks"""
+    return email.strip().lower()
+
+def username_path(username):
+    """Index path mapping a username to its user ID"""
+    return f"usernames/{encode_key(username)}"
+
+def email_path(email):
+    """Index path mapping a normalized email to its user ID"""
+    return f"emails/{encode_key(normalize_email(email))}"
+
+def identity_paths(username, email):
+    """Index paths that must be claimed before a user record is written"""
+    return [username_path(username), email_path(email)]
+
+def swipe_paths(swipe_id, swipe_data):
+    """Multi-path update that writes a swipe and its index entries
+
+    swipes_by_user/{swiper}/{swiped} holds the swiper's latest action and
+    likes_received/{swiped}/{swiper} exists only while that action is a like.
+    """
+    swiper_id = swipe_data['swiper_id']
+    swiped_id = swipe_data['swiped_id']
+    liked_at = (swipe_data.get('created_at') or True) if swipe_data['action'] == 'like' else None
+    return {
+        f"swipes/{swipe_id}": swipe_data,
+        f"swipes_by_user/{swiper_id}/{swiped_id}": {
+            'action': swipe_data['action'],
+            'created_at': swipe_data.get('created_at'),
+            'swipe_id': swipe_id
+        },
+        f"likes_received/{swiped_id}/{swiper_id}": liked_at
+    }
+
+def pair_match_id(user1_id, user2_id):
+    """Match ID shared by both orderings of a pair of users
+
+    Both users of a mutual like may see each other's like and write the
+    match at once; keyed by the sorted pair they write the same record.
+    """
+    return ':'.join(encode_key(str(user_id)) for user_id in sorted((str(user1_id), str(user2_id))))
+
+def match_paths(match_id, match_data):
+    """Multi-path update that writes a match record and both users' index entries"""
+    return {
+        f"matches/{match_id}": match_data,
+        f"matches_by_user/{match_data['user1_id']}/{match_id}": match_data,
+        f"matches_by_user/{match_data['user2_id']}/{match_id}": match_data
+    }
+
+def batch_swipe_paths(swipes, liked_back):
+    """Multi-path update for a batch of swipes plus the matches their likes complete
+
+    Each swipe carries its swipe_id, swiper_id, swiped_id, action and
+    created_at; liked_back[i] tells whether swipes[i]'s target had liked the
+    swiper before the batch. Swipes back within the batch take precedence:
+    when both users like each other in one batch, the later like completes
+    the match, while a like answered later in the batch by a pass still
+    counts the like from before the batch. Index paths repeated in the
+    batch keep the pair's latest action. A match is keyed by the user pair
+    (pair_match_id), so replaying a batch rewrites the same records.
+    Returns (updates, matched flags).
+    """
+    updates = {}
+    matched = []
+    latest = {}
+    last_index = {(str(swipe['swiper_id']), str(swipe['swiped_id'])): i for i, swipe in enumerate(swipes)}
+    for i, (swipe, liked) in enumerate(zip(swipes, liked_back)):
+        swiper_id = str(swipe['swiper_id'])
+        swiped_id = str(swipe['swiped_id'])
+        swipe_data = {
+            'swiper_id': swiper_id,
+            'swiped_id': swiped_id,
+            'action': swipe['action'],
+            'created_at': swipe['created_at']
+        }
+        updates.update(swipe_paths(swipe['swipe_id'], swipe_data))
+        latest[(swiper_id, swiped_id)] = swipe['action']
+        
+        returned = latest.get((swiped_id, swiper_id))
+        later = last_index.get((swiped_id, swiper_id), -1)
+        if returned is None and later > i and swipes[later]['action'] == 'like':
+            # A like back later in this batch settles the match
+            liked = False
+        is_match = swipe['action'] == 'like' and (returned == 'like' if returned is not None else bool(liked))
+        if is_match:
+            updates.update(match_paths(pair_match_id(swiper_id, swiped_id), {
+                'user1_id': swiper_id,
+                'user2_id': swiped_id,
+                'created_at': swipe['created_at']
+            }))
+        matched.append(is_match)
+    return updates, matched
+
+def matched_user_ids(matches):
+    """Distinct user IDs appearing in a matches_by_user subtree"""
+    user_ids = set()
+    for match_data in matches.values():
+        if match_data:
+            user_ids.add(match_data.get('user1_id'))
+            user_ids.add(match_data.get('user2_id'))
+    user_ids.discard(None)
+    return user_ids
+
+def build_user_matches(matches, profiles):
+    """Join a matches_by_user subtree with loaded profiles, oldest match first"""
+    user_matches = []
+    matches = {match_id: match_data for match_id, match_data in (matches or {}).items() if match_data}
+    for match_id in sorted(matches, key=lambda match_id: (matches[match_id].get('created_at') or '', match_id)):
+        match_data = matches[match_id]
+        user1_profile = profiles.get(match_data.get('user1_id'))
+        user2_profile = profiles.get(match_data.get('user2_id'))
+        
+        if user1_profile and user2_profile:
+            user_matches.append({
+                'match_id': match_id,
+                'user1_id': match_data.get('user1_id'),
+                'user2_id': match_data.get('user2_id'),
+                'user1_name': user1_profile.get('name'),
+                'user1_bio': user1_profile.get('bio'),
+                'user1_location': user1_profile.get('location'),
+                'user2_name': user2_profile.get('name'),
+                'user2_bio': user2_profile.get('bio'),
+                'user2_location': user2_profile.get('location'),
+                'created_at': match_data.get('created_at')
+            })
+    return user_matches
+
+def swipes_from_index(swiper_id, entries):
+    """Rebuild swipe records from a swipes_by_user/{swiper_id} subtree"""
+    if not entries:
+        return []
+    return [
+        {
+            'swiper_id': str(swiper_id),
+            'swiped_id': swiped_id,
+            'action': entry.get('action'),
+            'created_at': entry.get('created_at')
+        }
+        for swiped_id, entry in entries.items() if entry
+    ]
@@ -2,54 +2,257 @@
 Firebase REST API Service - Temporary workaround for JWT signature issues
 """
 
+import random
 import requests
+import os
 import json
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from matching import normalize_profile_fields
+from storage_backend import StorageBackend
+from firebase_paths import (
+    batch_swipe_paths, build_user_matches, generate_push_id, identity_paths, match_paths,
+    matched_user_ids, normalize_email, pair_match_id, swipe_paths, swipes_from_index, username_path
+)
 
-class FirebaseRestService:
+class JitteredRetry(Retry):
+    """urllib3 Retry that spreads backoff sleeps with full jitter"""
+
+    def get_backoff_time(self):
+        return random.uniform(0, super().get_backoff_time())
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter with a default timeout and counters for retried requests"""
+
+    def __init__(self, timeout, **kwargs):
+        self.timeout = timeout
+        self.stats_lock = threading.Lock()
+        self.requests_sent = 0
+        self.retried_requests = 0
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        response = super().send(request, **kwargs)
+        retries = getattr(response.raw, 'retries', None)
+        with self.stats_lock:
+            self.requests_sent += 1
+            if retries is not None and retries.history:
+                self.retried_requests += 1
+        return response
+
+class FirebaseRestService(StorageBackend):
     def __init__(self):
-        self.database_url = "https://dromie-58a40-default-rtdb.firebaseio.com"
+        self.database_url = os.getenv('FIREBASE_DATABASE_URL', "https://dromie-58a40-default-rtdb.firebaseio.com").rstrip('/')
         self.base_url = f"{self.database_url}/.json"
+        # Shared pool for concurrent reads such as batched profile loads
+        fetch_workers = int(os.getenv('PROFILE_FETCH_WORKERS', '8'))
+        self.fetch_executor = ThreadPoolExecutor(max_workers=fetch_workers)
+        self.session = self.create_session(pool_size=int(os.getenv('REST_POOL_SIZE', str(max(10, fetch_workers)))))
+    
+    def create_session(self, pool_size):
+        """Create the shared keep-alive session used for every request
+
+        Connections are pooled per host, every call gets a (connect, read)
+        timeout, and idempotent requests are retried with jittered
+        exponential backoff on 429 and 5xx responses.
+        """
+        retry = JitteredRetry(
+            total=int(os.getenv('REST_MAX_RETRIES', '3')),
+            backoff_factor=float(os.getenv('REST_BACKOFF_FACTOR', '0.2')),
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({'GET', 'PUT', 'PATCH', 'DELETE'}),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        self.adapter = PooledAdapter(
+            timeout=(float(os.getenv('REST_CONNECT_TIMEOUT', '3.05')), float(os.getenv('REST_READ_TIMEOUT', '10'))),
+            pool_connections=4,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        return session
+    
+    def pool_stats(self):
+        """Connection pool counters: requests sent versus connections opened"""
+        pools = []
+        for key in self.adapter.poolmanager.pools.keys():
+            pool = self.adapter.poolmanager.pools[key]
+            pools.append({
+                'host': pool.host,
+                'port': pool.port,
+                'maxsize': pool.pool.maxsize if pool.pool else 0,
+                # The pool queue is pre-filled with None placeholders for unopened slots
+                'idle_connections': sum(1 for conn in pool.pool.queue if conn is not None) if pool.pool else 0,
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+                # Every request beyond the opened connections reused a kept-alive one
+                'handshakes_saved': max(0, pool.num_requests - pool.num_connections)
+            })
+        with self.adapter.stats_lock:
+            return {
+                'requests_sent': self.adapter.requests_sent,
+                'retried_requests': self.adapter.retried_requests,
+                'pools': pools
+            }
     
     def is_connected(self):
         """Check if Firebase is accessible"""
         try:
-            response = requests.get(self.base_url, timeout=5)
+            # Shallow read returns only the top-level keys, not the whole database
+            response = self.session.get(self.base_url, params={'shallow': 'true'}, timeout=5)
             return response.status_code == 200
         except:
             return False
     
+    def query(self, path, order_by, equal_to=None, start_at=None, end_at=None, limit_to_first=None, limit_to_last=None):
+        """Run a filtered query so only matching children are sent back
+
+        order_by is a child key, '$key' or '$value'; ordering by a child
+        needs a matching .indexOn rule (see database.rules.json). Returns a
+        dict of key to child, in no particular order, or None on failure.
+        """
+        params = {'orderBy': json.dumps(order_by)}
+        for name, value in (('equalTo', equal_to), ('startAt', start_at), ('endAt', end_at)):
+            if value is not None:
+                params[name] = json.dumps(value)
+        if limit_to_first is not None:
+            params['limitToFirst'] = limit_to_first
+        if limit_to_last is not None:
+            params['limitToLast'] = limit_to_last
+        
+        try:
+            response = self.session.get(f"{self.database_url}/{path}.json", params=params)
+            if response.status_code == 200:
+                return response.json() or {}
+            print(f"Error querying {path}: {response.status_code} {response.text}")
+            return None
+        except Exception as e:
+            print(f"Error querying {path}: {e}")
+            return None
+    
+    def get_user(self, user_id):
+        """Get user by ID using REST API"""
+        try:
+            response = self.session.get(f"{self.database_url}/users/{user_id}.json")
+            if response.status_code == 200:
+                return response.json()
+            return None
+        except Exception as e:
+            print(f"Error getting user: {e}")
+            return None
+    
+    def update_user(self, user_id, user_data):
+        """Update user data using REST API"""
+        try:
+            response = self.session.patch(f"{self.database_url}/users/{user_id}.json", json=user_data)
+            return response.status_code == 200
+        except Exception as e:
+            print(f"Error updating user: {e}")
+            return False
+    
     def get_user_by_username(self, username):
         """Get user by username using REST API"""
         try:
-            response = requests.get(f"{self.database_url}/users.json")
+            response = self.session.get(f"{self.database_url}/{username_path(username)}.json")
             if response.status_code == 200:
-                users = response.json()
-                if users:
-                    for user_id, user_data in users.items():
-                        if user_data and user_data.get('username') == username:
-                            return user_id, user_data
-            return None, None
+                user_id = response.json()
+                if user_id:
+                    response = self.session.get(f"{self.database_url}/users/{user_id}.json")
+                    if response.status_code == 200 and response.json():
+                        return user_id, response.json()
+                    return None, None
+            
+            # Accounts created before the usernames index was backfilled
+            return self.find_user('username', username)
         except Exception as e:
             print(f"Error getting user by username: {e}")
             return None, None
     
+    def find_user(self, field, value):
+        """(user_id, user_data) of a user whose field equals value, by the indexed users query"""
+        users = self.query('users', field, equal_to=value, limit_to_first=1)
+        for user_id, user_data in (users or {}).items():
+            return user_id, user_data
+        return None, None
+    
+    def claim_path(self, path, owner_id, attempts=5):
+        """Atomically claim an index path for owner_id using ETag conditional writes"""
+        url = f"{self.database_url}/{path}.json"
+        for _ in range(attempts):
+            response = self.session.get(url, headers={'X-Firebase-ETag': 'true'})
+            if response.status_code != 200:
+                return False
+            current = response.json()
+            if current is not None:
+                return current == owner_id
+            
+            response = self.session.put(url, json=owner_id, headers={'if-match': response.headers.get('ETag', '')})
+            if response.status_code == 200:
+                return True
+            if response.status_code != 412:
+                return False
+            # 412: someone wrote the path since our read, re-check it
+        return False
+    
     def create_user(self, user_data):
-        """Create a new user using REST API"""
+        """Create a new user using REST API
+
+        Claims the username and email index entries first, so concurrent
+        signups cannot create duplicate accounts. Returns None if either is
+        already taken.
+        """
+        user_id = generate_push_id()
+        claimed = []
         try:
-            response = requests.post(f"{self.database_url}/users.json", json=user_data)
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('name')  # Firebase returns the key in 'name' field
-            return None
+            for path in identity_paths(user_data['username'], user_data['email']):
+                if not self.claim_path(path, user_id):
+                    print(f"User not created, {path} is already taken")
+                    break
+                claimed.append(path)
+            else:
+                response = self.session.put(f"{self.database_url}/users/{user_id}.json", json=user_data)
+                if response.status_code == 200:
+                    return user_id
         except Exception as e:
             print(f"Error creating user: {e}")
-            return None
+        
+        # Release whatever this signup claimed before failing
+        for path in claimed:
+            try:
+                self.session.delete(f"{self.database_url}/{path}.json")
+            except Exception as e:
+                print(f"Error releasing {path}: {e}")
+        return None
+    
+    def is_identity_taken(self, username, email):
+        """Check whether a username or email is already registered"""
+        try:
+            for path in identity_paths(username, email):
+                response = self.session.get(f"{self.database_url}/{path}.json")
+                if response.status_code == 200 and response.json() is not None:
+                    return True
+            
+            # Accounts created before the indexes were backfilled (migrate.py users)
+            if self.find_user('username', username)[0] is not None:
+                return True
+            return any(self.find_user('email', value)[0] is not None for value in {email.strip(), normalize_email(email)})
+        except Exception as e:
+            print(f"Error checking username and email: {e}")
+            return False
     
     def get_profile(self, user_id):
         """Get user profile using REST API"""
         try:
-            response = requests.get(f"{self.database_url}/profiles/{user_id}.json")
+            response = self.session.get(f"{self.database_url}/profiles/{user_id}.json")
             if response.status_code == 200:
                 return response.json()
             return None
@@ -61,16 +264,40 @@ class FirebaseRestService:
         """Create user profile using REST API"""
         try:
             profile_data['created_at'] = datetime.now().isoformat()
-            response = requests.put(f"{self.database_url}/profiles/{user_id}.json", json=profile_data)
+            normalize_profile_fields(profile_data)
+            response = self.session.put(f"{self.database_url}/profiles/{user_id}.json", json=profile_data)
             return response.status_code == 200
         except Exception as e:
             print(f"Error creating profile: {e}")
             return False
     
+    def update_profile(self, user_id, profile_data):
+        """Update user profile using REST API"""
+        try:
+            profile_data['updated_at'] = datetime.now().isoformat()
+            normalize_profile_fields(profile_data)
+            response = self.session.patch(f"{self.database_url}/profiles/{user_id}.json", json=profile_data)
+            return response.status_code == 200
+        except Exception as e:
+            print(f"Error updating profile: {e}")
+            return False
+    
+    def get_profiles(self, user_ids):
+        """Get several profiles at once, fetched concurrently and deduplicated
+
+        Returns a dict of user ID to profile; missing profiles are left out.
+        """
+        user_ids = list({str(user_id) for user_id in user_ids})
+        if not user_ids:
+            return {}
+        
+        profiles = self.fetch_executor.map(self.get_profile, user_ids)
+        return {user_id: profile for user_id, profile in zip(user_ids, profiles) if profile}
+    
     def get_all_profiles(self, exclude_user_id=None):
         """Get all profiles using REST API"""
         try:
-            response = requests.get(f"{self.database_url}/profiles.json")
+            response = self.session.get(f"{self.database_url}/profiles.json")
             if response.status_code == 200:
                 profiles = response.json()
                 if not profiles:
@@ -92,19 +319,11 @@ class FirebaseRestService:
     def get_swiped_users(self, user_id):
         """Get list of user IDs that the user has swiped on"""
         try:
-            response = requests.get(f"{self.database_url}/swipes.json")
+            # Shallow read returns only the swiped IDs, not the entries
+            response = self.session.get(f"{self.database_url}/swipes_by_user/{user_id}.json", params={'shallow': 'true'})
             if response.status_code == 200:
-                swipes = response.json()
-                if not swipes:
-                    return []
-                
-                swiped_ids = []
-                user_id_str = str(user_id)
-                for swipe_id, swipe_data in swipes.items():
-                    if swipe_data and swipe_data.get('swiper_id') == user_id_str:
-                        swiped_ids.append(swipe_data.get('swiped_id'))
-                
-                return swiped_ids
+                swiped = response.json()
+                return list(swiped) if swiped else []
             return []
         except Exception as e:
             print(f"Error getting swiped users: {e}")
@@ -119,39 +338,95 @@ class FirebaseRestService:
                 'action': action,
                 'created_at': datetime.now().isoformat()
             }
-            response = requests.post(f"{self.database_url}/swipes.json", json=swipe_data)
+            # Write the swipe and its per-swiper index entry together
+            response = self.session.patch(f"{self.database_url}/.json", json=swipe_paths(generate_push_id(), swipe_data))
             return response.status_code == 200
         except Exception as e:
             print(f"Error creating swipe: {e}")
             return False
     
+    def record_swipe(self, swiper_id, swiped_id, action):
+        """Record a swipe and, for a returned like, the match
+
+        Returns (success, matched).
+        """
+        try:
+            swiper_id_str = str(swiper_id)
+            swiped_id_str = str(swiped_id)
+            now = datetime.now().isoformat()
+            swipe_data = {
+                'swiper_id': swiper_id_str,
+                'swiped_id': swiped_id_str,
+                'action': action,
+                'created_at': now
+            }
+            response = self.session.patch(f"{self.database_url}/.json", json=swipe_paths(generate_push_id(), swipe_data))
+            if response.status_code != 200:
+                return False, False
+            
+            matched = False
+            if action == 'like':
+                # Has the other user already liked the swiper? Asked only once our
+                # like is stored: of two users liking each other at once, at
+                # least one sees the other
+                response = self.session.get(f"{self.database_url}/likes_received/{swiper_id_str}/{swiped_id_str}.json")
+                if response.status_code != 200:
+                    return True, False
+                matched = response.json() is not None
+                if matched:
+                    match_data = {
+                        'user1_id': swiper_id_str,
+                        'user2_id': swiped_id_str,
+                        'created_at': now
+                    }
+                    match_id = pair_match_id(swiper_id_str, swiped_id_str)
+                    response = self.session.patch(f"{self.database_url}/.json", json=match_paths(match_id, match_data))
+                    if response.status_code != 200:
+                        return True, False
+            return True, matched
+        except Exception as e:
+            print(f"Error recording swipe: {e}")
+            return False, False
+    
+    def record_swipes(self, swipes):
+        """Record a batch of swipes and the matches they complete in one PATCH"""
+        try:
+            def liked_back(swipe):
+                # Has the other user already liked the swiper?
+                if swipe['action'] != 'like':
+                    return False
+                response = self.session.get(f"{self.database_url}/likes_received/{swipe['swiper_id']}/{swipe['swiped_id']}.json")
+                if response.status_code != 200:
+                    raise RuntimeError(f"like lookup failed with status {response.status_code}")
+                return response.json() is not None
+            
+            # Keyed like lookups are independent, so run them concurrently
+            updates, matched = batch_swipe_paths(swipes, list(self.fetch_executor.map(liked_back, swipes)))
+            response = self.session.patch(f"{self.database_url}/.json", json=updates)
+            if response.status_code == 200:
+                return matched
+            return None
+        except Exception as e:
+            print(f"Error recording swipes: {e}")
+            return None
+    
+    def has_liked(self, liker_id, liked_id):
+        """Check if one user's latest swipe on another is a like"""
+        try:
+            response = self.session.get(f"{self.database_url}/likes_received/{liked_id}/{liker_id}.json")
+            return response.status_code == 200 and response.json() is not None
+        except Exception as e:
+            print(f"Error checking like: {e}")
+            return False
+    
     def check_mutual_like(self, user1_id, user2_id):
         """Check if two users have liked each other"""
         try:
-            response = requests.get(f"{self.database_url}/swipes.json")
-            if response.status_code == 200:
-                swipes = response.json()
-                if not swipes:
+            for liked_id, liker_id in ((user2_id, user1_id), (user1_id, user2_id)):
+                response = self.session.get(f"{self.database_url}/likes_received/{liked_id}/{liker_id}.json")
+                if response.status_code != 200 or response.json() is None:
                     return False
-                
-                user1_liked_user2 = False
-                user2_liked_user1 = False
-                user1_id_str = str(user1_id)
-                user2_id_str = str(user2_id)
-                
-                for swipe_id, swipe_data in swipes.items():
-                    if swipe_data:
-                        swiper_id = swipe_data.get('swiper_id')
-                        swiped_id = swipe_data.get('swiped_id')
-                        action = swipe_data.get('action')
-                        
-                        if swiper_id == user1_id_str and swiped_id == user2_id_str and action == 'like':
-                            user1_liked_user2 = True
-                        elif swiper_id == user2_id_str and swiped_id == user1_id_str and action == 'like':
-                            user2_liked_user1 = True
-                
-                return user1_liked_user2 and user2_liked_user1
-            return False
+            return True
         except Exception as e:
             print(f"Error checking mutual like: {e}")
             return False
@@ -164,7 +439,7 @@ class FirebaseRestService:
                 'user2_id': str(user2_id),
                 'created_at': datetime.now().isoformat()
             }
-            response = requests.post(f"{self.database_url}/matches.json", json=match_data)
+            response = self.session.patch(f"{self.database_url}/.json", json=match_paths(pair_match_id(user1_id, user2_id), match_data))
             return response.status_code == 200
         except Exception as e:
             print(f"Error creating match: {e}")
@@ -173,37 +448,15 @@ class FirebaseRestService:
     def get_user_matches(self, user_id):
         """Get all matches for a user"""
         try:
-            response = requests.get(f"{self.database_url}/matches.json")
+            response = self.session.get(f"{self.database_url}/matches_by_user/{user_id}.json")
             if response.status_code == 200:
                 matches = response.json()
                 if not matches:
                     return []
                 
-                user_matches = []
-                user_id_str = str(user_id)
-                for match_id, match_data in matches.items():
-                    if match_data:
-                        if match_data.get('user1_id') == user_id_str or match_data.get('user2_id') == user_id_str:
-                            # Get profile data for both users
-                            user1_profile = self.get_profile(match_data.get('user1_id'))
-                            user2_profile = self.get_profile(match_data.get('user2_id'))
-                            
-                            if user1_profile and user2_profile:
-                                match_info = {
-                                    'match_id': match_id,
-                                    'user1_id': match_data.get('user1_id'),
-                                    'user2_id': match_data.get('user2_id'),
-                                    'user1_name': user1_profile.get('name'),
-                                    'user1_bio': user1_profile.get('bio'),
-                                    'user1_location': user1_profile.get('location'),
-                                    'user2_name': user2_profile.get('name'),
-                                    'user2_bio': user2_profile.get('bio'),
-                                    'user2_location': user2_profile.get('location'),
-                                    'created_at': match_data.get('created_at')
-                                }
-                                user_matches.append(match_info)
-                
-                return user_matches
+                # Load every profile involved once, concurrently
+                profiles = self.get_profiles(matched_user_ids(matches))
+                return build_user_matches(matches, profiles)
             return []
         except Exception as e:
             print(f"Error getting user matches: {e}")
@@ -212,23 +465,45 @@ class FirebaseRestService:
     def get_user_swipes(self, user_id):
         """Get all swipes made by a user"""
         try:
-            response = requests.get(f"{self.database_url}/swipes.json")
+            response = self.session.get(f"{self.database_url}/swipes_by_user/{user_id}.json")
             if response.status_code == 200:
-                swipes = response.json()
-                if not swipes:
-                    return []
-                
-                user_swipes = []
-                user_id_str = str(user_id)
-                for swipe_id, swipe_data in swipes.items():
-                    if swipe_data and swipe_data.get('swiper_id') == user_id_str:
-                        user_swipes.append(swipe_data)
-                
-                return user_swipes
+                return swipes_from_index(user_id, response.json())
             return []
         except Exception as e:
             print(f"Error getting user swipes: {e}")
             return []
+    
+    def iter_node(self, path, batch_size=500):
+        """Stream the children of a node in key order, one batch at a time"""
+        start_key = None
+        while True:
+            if start_key is not None:
+                # startAt is inclusive, so fetch one extra child when resuming
+                children = self.query(path, '$key', start_at=start_key, limit_to_first=batch_size + 1)
+            else:
+                children = self.query(path, '$key', limit_to_first=batch_size)
+            if not children:
+                return
+            
+            batch = sorted((key, value) for key, value in children.items() if key != start_key)
+            if not batch:
+                return
+            yield batch
+            
+            if len(batch) < batch_size:
+                return
+            start_key = batch[-1][0]
+    
+    def multi_update(self, updates):
+        """Apply a multi-path update atomically using REST API"""
+        try:
+            if not updates:
+                return True
+            response = self.session.patch(f"{self.database_url}/.json", json=updates)
+            return response.status_code == 200
+        except Exception as e:
+            print(f"Error applying multi-path update: {e}")
+            return False
 
 # Create instance
 firebase_rest_service = FirebaseRestService()
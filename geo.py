@@ -0,0 +1,159 @@
+"""
+Geospatial Helpers
+Coordinate parsing, haversine distances and a geohash grid index over profile locations
+"""
+
+import math
+import threading
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def parse_coordinates(location):
+    """Parse a "lat, lng" location string into floats, None if it is not one"""
+    if not isinstance(location, str) or location.count(',') != 1:
+        return None
+    try:
+        lat, lng = (float(part.strip()) for part in location.split(','))
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+def profile_coordinates(profile):
+    """Stored coordinates of a profile, parsing the location only for legacy records"""
+    lat = profile.get('latitude')
+    lng = profile.get('longitude')
+    if lat is not None and lng is not None:
+        return lat, lng
+    if 'latitude' in profile:
+        # Normalized at write time and not a coordinate location
+        return None
+    return parse_coordinates(profile.get('location'))
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def haversine_km_many(lat, lng, lats, lngs):
+    """Distances in kilometres from one point to arrays of points"""
+    phi1 = np.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lngs - lng)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+def geohash_encode(lat, lng, precision=9):
+    """Encode a point as a geohash string of the given length"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+def geohash_cell_size(precision):
+    """(height, width) in degrees of a geohash cell of the given length"""
+    total_bits = precision * 5
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+def geohash_cells_covering(lat, lng, radius_km, precision):
+    """Geohash cells of the given length that together cover a circle"""
+    cell_height, cell_width = geohash_cell_size(precision)
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(lat))
+    # Near the poles the circle spans every longitude
+    dlng = 180.0 if cos_lat < 1e-6 else min(180.0, dlat / cos_lat)
+
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    cells = set()
+    step_lat = min_lat
+    while True:
+        sample_lat = min(step_lat, max_lat)
+        step_lng = lng - dlng
+        while True:
+            sample_lng = min(step_lng, lng + dlng)
+            # Wrap across the antimeridian
+            wrapped = (sample_lng + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(sample_lat, wrapped, precision))
+            if step_lng >= lng + dlng:
+                break
+            step_lng += cell_width
+        if step_lat >= max_lat:
+            break
+        step_lat += cell_height
+    return cells
+
+class GeoIndex:
+    """Grid of geohash cells mapping each cell to the user IDs located in it"""
+
+    def __init__(self, precision=5):
+        self.precision = precision
+        self.cells = {}
+        self.points = {}
+        self.lock = threading.RLock()
+
+    def add(self, user_id, lat, lng):
+        """Index (or move) a user's location"""
+        with self.lock:
+            self.remove(user_id)
+            cell = geohash_encode(lat, lng, self.precision)
+            self.cells.setdefault(cell, set()).add(user_id)
+            self.points[user_id] = (lat, lng, cell)
+
+    def remove(self, user_id):
+        """Drop a user from the index"""
+        with self.lock:
+            point = self.points.pop(user_id, None)
+            if point is None:
+                return
+            members = self.cells.get(point[2])
+            if members is not None:
+                members.discard(user_id)
+                if not members:
+                    del self.cells[point[2]]
+
+    def within(self, lat, lng, radius_km):
+        """User IDs within radius_km of a point, mapped to their distance in km"""
+        with self.lock:
+            user_ids = []
+            for cell in geohash_cells_covering(lat, lng, radius_km, self.precision):
+                user_ids.extend(self.cells.get(cell, ()))
+            if not user_ids:
+                return {}
+            points = np.array([self.points[user_id][:2] for user_id in user_ids], dtype=np.float64)
+
+        distances = haversine_km_many(lat, lng, points[:, 0], points[:, 1])
+        return {
+            user_id: float(distance)
+            for user_id, distance in zip(user_ids, distances) if distance <= radius_km
+        }
+
+    def __len__(self):
+        return len(self.points)
@@ -0,0 +1,177 @@
+"""
+Inference Pool
+Bounded concurrency, single-flight deduplication and load shedding for
+outbound model calls
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from stats import percentile_ms
+
+class InferenceShed(Exception):
+    """Raised when a call is refused or dropped because the pool is saturated"""
+
+class Flight:
+    """One upstream call whose output is shared by every caller that asked for it
+
+    The producer publishes chunks as they arrive; each caller replays them
+    from the start, so a caller that joins late still gets the whole reply.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def publish(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    def stream(self, first_chunk_timeout, timeout):
+        """Yield chunks as they are published
+
+        Raises TimeoutError when no chunk arrives within first_chunk_timeout
+        seconds, queueing included, or the output is not finished timeout
+        seconds after its first chunk.
+        """
+        deadline = time.monotonic() + first_chunk_timeout
+        position = 0
+        while True:
+            with self.condition:
+                while position >= len(self.chunks) and not self.done:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("inference call did not finish in time")
+                    self.condition.wait(remaining)
+                chunks = self.chunks[position:]
+                done = self.done
+                error = self.error
+            if position == 0 and chunks:
+                # The call is running now, so its own budget bounds the rest
+                deadline = time.monotonic() + timeout
+            for chunk in chunks:
+                yield chunk
+            position += len(chunks)
+            if done and position >= len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+    def result(self, timeout):
+        """The whole output once the call has finished, within timeout seconds"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.done, timeout):
+                raise TimeoutError("inference call did not finish in time")
+            if self.error is not None:
+                raise self.error
+            return ''.join(self.chunks)
+
+class InferencePool:
+    """Runs upstream calls on a few dedicated threads instead of request threads
+
+    At most max_workers calls run at once and max_queue more may wait;
+    beyond that run() sheds the call (returns None) so the caller answers
+    from its fallback immediately. Calls with the same key that overlap
+    share one flight, so identical prompts sent together cost one upstream
+    call. Callers bound their own wait with the timeouts they pass to the
+    flight; a queued call that waited longer than max_queue_wait is dropped,
+    so max_queue_wait should stay below the wait for the first chunk. No more than
+    max_workers + max_queue distinct calls are ever waiting on the upstream,
+    however large a traffic spike is.
+    """
+
+    def __init__(self, name, max_workers=4, max_queue=16, max_queue_wait=10.0, timing_window=1024):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.queue_waits = deque(maxlen=timing_window)
+        self.running = 0
+        self.in_pool = 0
+        self.admitted = 0
+        self.coalesced = 0
+        self.shed = 0
+        self.expired = 0
+        self.errors = 0
+
+    def run(self, key, produce):
+        """Start (or join) the flight for key; produce() yields its chunks
+
+        A key of None is never shared. Returns the Flight, or None when the
+        pool is saturated and the call was shed.
+        """
+        with self.lock:
+            flight = self.flights.get(key) if key is not None else None
+            if flight is not None:
+                self.coalesced += 1
+                return flight
+            if not self.slots.acquire(blocking=False):
+                self.shed += 1
+                return None
+            flight = Flight()
+            if key is not None:
+                self.flights[key] = flight
+            self.in_pool += 1
+            self.admitted += 1
+        self.executor.submit(self.execute, key, flight, produce, time.monotonic())
+        return flight
+
+    def execute(self, key, flight, produce, queued_at):
+        waited = time.monotonic() - queued_at
+        with self.lock:
+            self.queue_waits.append(waited)
+            self.running += 1
+        try:
+            if waited > self.max_queue_wait:
+                with self.lock:
+                    self.expired += 1
+                flight.finish(InferenceShed(f"waited {waited:.1f}s in the {self.name} queue"))
+                return
+            for chunk in produce():
+                flight.publish(chunk)
+            flight.finish()
+        except Exception as e:
+            with self.lock:
+                self.errors += 1
+            print(f"Error in {self.name} call: {e}")
+            flight.finish(e)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.in_pool -= 1
+                if key is not None and self.flights.get(key) is flight:
+                    del self.flights[key]
+            self.slots.release()
+
+    def stats(self):
+        """Concurrency, queueing, coalescing and shedding counters"""
+        with self.lock:
+            waits = list(self.queue_waits)
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'running': self.running,
+                'queued': self.in_pool - self.running,
+                'flights': len(self.flights),
+                'admitted': self.admitted,
+                'coalesced': self.coalesced,
+                'shed': self.shed,
+                'expired': self.expired,
+                'errors': self.errors,
+                'queue_wait_p50_ms': percentile_ms(waits, 0.50),
+                'queue_wait_p99_ms': percentile_ms(waits, 0.99)
+            }
@@ -1,10 +1,24 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify, stream_with_context
+import asyncio
+import inspect
+import re
+import threading
+import time
 from werkzeug.security import generate_password_hash, check_password_hash
-import random
 import requests
 import os
 import json
-from firebase_config import firebase_service
+from storage_backend import get_storage_backend
+from async_storage import create_async_storage
+from swipe_deck import swipe_decks
+from profile_index import profile_index
+from candidate_pipeline import candidate_pipeline
+from score_cache import pair_scores
+from change_feed import create_change_feed
+from swipe_queue import create_swipe_writer
+from chat_cache import ChatResponseCache
+from circuit_breaker import CircuitBreaker
+from inference_pool import InferencePool
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -16,26 +30,62 @@ app.secret_key = 'roommate-finder-secret-key-change-in-production'
 # Hugging Face API configuration
 HF_API_URL = "https://api-inference.huggingface.co/models/microsoft/DialoGPT-medium"
 HF_API_TOKEN = os.getenv('HUGGINGFACE_API_TOKEN')  # Set your token as environment variable
-
-# Firebase is initialized in firebase_config.py
-# No need for SQLite database setup
+# Replies to repeated prompts (e.g. the quick-topic buttons), keyed by the normalized message
+chat_cache = ChatResponseCache(
+    maxsize=int(os.getenv('CHAT_CACHE_SIZE', '512')),
+    ttl=float(os.getenv('CHAT_CACHE_TTL', '3600')),
+    namespace=HF_API_URL
+)
+# Seconds a chat request may wait on the inference API before using the fallback
+CHAT_LATENCY_BUDGET = float(os.getenv('CHAT_LATENCY_BUDGET', '10'))
+# Skips the inference API while it keeps failing, so chat requests fail fast
+hf_breaker = CircuitBreaker(
+    'Hugging Face',
+    failure_threshold=int(os.getenv('HF_BREAKER_FAILURES', '5')),
+    reset_timeout=float(os.getenv('HF_BREAKER_RESET', '30'))
+)
+# Longest a chat request thread waits for its reply (or, when streaming, its
+# first chunk), queueing included; never more than one call's budget. A call
+# still running afterwards fills the cache
+CHAT_WAIT_LIMIT = min(float(os.getenv('CHAT_MAX_WAIT', '8')), CHAT_LATENCY_BUDGET)
+# Inference calls run here, off the request threads: identical prompts in flight
+# share one call, and calls beyond the worker and queue limits get the fallback
+inference_pool = InferencePool(
+    'huggingface',
+    max_workers=int(os.getenv('INFERENCE_WORKERS', '4')),
+    max_queue=int(os.getenv('INFERENCE_QUEUE', '16')),
+    max_queue_wait=min(float(os.getenv('INFERENCE_QUEUE_WAIT', '2')), CHAT_WAIT_LIMIT)
+)
+# Words per Server-Sent Event when a whole reply is delivered in pieces
+CHAT_STREAM_CHUNK_WORDS = int(os.getenv('CHAT_STREAM_CHUNK_WORDS', '4'))
+
+# Storage backend selected by STORAGE_BACKEND (firebase, firebase_rest or sqlite)
+storage = get_storage_backend()
+# Awaitable view of the same backend, for views that fan out independent reads
+async_storage = create_async_storage(storage)
+# Keeps the candidate index and ranked decks in step with profile edits
+change_feed = create_change_feed(storage)
+# Records swipes, write-behind through a local log when SWIPE_WRITE_BEHIND=on
+swipe_writer = create_swipe_writer(storage)
 
 def is_logged_in():
     return 'user_id' in session
 
 def require_login(f):
-    def decorated_function(*args, **kwargs):
-        if not is_logged_in():
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
+    if inspect.iscoroutinefunction(f):
+        async def decorated_function(*args, **kwargs):
+            if not is_logged_in():
+                return redirect(url_for('login'))
+            return await f(*args, **kwargs)
+    else:
+        def decorated_function(*args, **kwargs):
+            if not is_logged_in():
+                return redirect(url_for('login'))
+            return f(*args, **kwargs)
     decorated_function.__name__ = f.__name__
     return decorated_function
 
-def get_huggingface_response(user_message):
-    """Get response from Hugging Face API with housing context"""
-    try:
-        # Add housing context to the user message
-        housing_context = """You are RoomieBot, an AI assistant specialized in helping people with shared living situations, roommate issues, and housing-related questions. You provide practical, helpful advice about:
+HOUSING_CONTEXT = """You are RoomieBot, an AI assistant specialized in helping people with shared living situations, roommate issues, and housing-related questions. You provide practical, helpful advice about:
 - Cleaning schedules and chore management
 - Conflict resolution between roommates
 - House rules and living agreements
@@ -48,43 +98,89 @@ def get_huggingface_response(user_message):
 - Communication strategies
 
 Keep responses helpful, practical, and focused on shared living. Be friendly and understanding. Here's the user's question: """
-        
-        full_prompt = housing_context + user_message
-        
-        headers = {
-            "Authorization": f"Bearer {HF_API_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "inputs": full_prompt,
-            "parameters": {
-                "max_length": 500,
-                "temperature": 0.7,
-                "do_sample": True,
-                "return_full_text": False
-            }
+
+def build_huggingface_request(user_message, stream=False):
+    """Headers and payload for a Hugging Face inference call with housing context"""
+    headers = {
+        "Authorization": f"Bearer {HF_API_TOKEN}",
+        "Content-Type": "application/json"
+    }
+    
+    payload = {
+        "inputs": HOUSING_CONTEXT + user_message,
+        "parameters": {
+            "max_length": 500,
+            "temperature": 0.7,
+            "do_sample": True,
+            "return_full_text": False
         }
+    }
+    if stream:
+        # Servers that support it send tokens as Server-Sent Events
+        payload["stream"] = True
+    return headers, payload
+
+def chat_flight_key(user_message, personalized=False):
+    """Key under which identical in-flight prompts share one call (personalized prompts never do)"""
+    return None if personalized else chat_cache.key(user_message)
+
+def get_huggingface_response(user_message, personalized=False):
+    """Get response from Hugging Face API with housing context
+
+    Replies are cached by normalized message unless the prompt is personalized.
+    The call runs on the inference pool, shared with identical prompts already
+    in flight; when the pool is saturated the fallback is returned at once.
+    """
+    cached = chat_cache.get(user_message, personalized)
+    if cached is not None:
+        return cached
+    
+    flight = inference_pool.run(chat_flight_key(user_message, personalized),
+                                lambda: chunk_text(call_huggingface(user_message, personalized)))
+    if flight is None:
+        return get_fallback_response(user_message)
+    try:
+        return flight.result(CHAT_WAIT_LIMIT)
+    except Exception as e:
+        print(f"Hugging Face call not completed: {e}")
+        return get_fallback_response(user_message)
+
+def call_huggingface(user_message, personalized=False):
+    """One Hugging Face API call, bounded by CHAT_LATENCY_BUDGET
+
+    Skipped while the circuit breaker is open; failures return the fallback.
+    """
+    if not hf_breaker.allow():
+        return get_fallback_response(user_message)
+    
+    try:
+        headers, payload = build_huggingface_request(user_message)
         
-        response = requests.post(HF_API_URL, headers=headers, json=payload, timeout=30)
+        response = requests.post(HF_API_URL, headers=headers, json=payload, timeout=CHAT_LATENCY_BUDGET)
         
         if response.status_code == 200:
+            hf_breaker.record_success()
             result = response.json()
-            if isinstance(result, list) and len(result) > 0:
-                return result[0].get('generated_text', 'I apologize, but I had trouble processing your request. Could you please rephrase your question?')
+            if isinstance(result, list) and len(result) > 0 and result[0].get('generated_text'):
+                chat_cache.set(user_message, result[0]['generated_text'], personalized)
+                return result[0]['generated_text']
             else:
                 return 'I apologize, but I had trouble processing your request. Could you please rephrase your question?'
         else:
+            hf_breaker.record_failure()
             print(f"Hugging Face API error: {response.status_code} - {response.text}")
             return get_fallback_response(user_message)
             
     except requests.exceptions.Timeout:
+        hf_breaker.record_failure()
         print("Hugging Face API timeout")
         return get_fallback_response(user_message)
     except requests.exceptions.RequestException as e:
+        hf_breaker.record_failure()
         print(f"Hugging Face API request error: {e}")
         return get_fallback_response(user_message)
     except Exception as e:
+        hf_breaker.record_failure()
         print(f"Unexpected error: {e}")
         return get_fallback_response(user_message)
 
@@ -162,7 +258,114 @@ Would you like help setting up a specific expense tracking system?"""
 
 Could you be more specific about what you'd like help with? I'm here to make your shared living experience smoother and more enjoyable!"""
 
-# Sample data is handled by Firebase service
+def chunk_text(text, words_per_chunk=None):
+    """Split text into pieces of a few words each, keeping its whitespace"""
+    words = re.findall(r'\s*\S+\s*', text or '')
+    size = max(1, words_per_chunk or CHAT_STREAM_CHUNK_WORDS)
+    return [''.join(words[i:i + size]) for i in range(0, len(words), size)]
+
+def stream_huggingface_response(user_message, personalized=False):
+    """Yield a chat reply piece by piece as it arrives from Hugging Face
+
+    A cached reply is sent in chunks. Otherwise the call runs on the
+    inference pool and callers with the same prompt in flight share its
+    chunks; when the pool is saturated, or no chunk arrives within
+    CHAT_WAIT_LIMIT, the fallback is sent instead. Once the reply has started
+    it may take the rest of CHAT_LATENCY_BUDGET; a reply cut short after
+    that raises, so the caller can tell it apart from a finished one.
+    """
+    cached = chat_cache.get(user_message, personalized)
+    if cached is not None:
+        yield from chunk_text(cached)
+        return
+    
+    flight = inference_pool.run(chat_flight_key(user_message, personalized),
+                                lambda: call_huggingface_stream(user_message, personalized))
+    if flight is None:
+        yield from chunk_text(get_fallback_response(user_message))
+        return
+    
+    sent = False
+    try:
+        for chunk in flight.stream(CHAT_WAIT_LIMIT, CHAT_LATENCY_BUDGET):
+            sent = True
+            yield chunk
+    except Exception as e:
+        print(f"Hugging Face stream not completed: {e}")
+        if sent:
+            raise
+        yield from chunk_text(get_fallback_response(user_message))
+
+def call_huggingface_stream(user_message, personalized=False):
+    """One streaming Hugging Face API call, yielding pieces of the reply
+
+    Token streams are passed through as they arrive; a model that answers in
+    one piece, or the fallback response, is sent in chunks. A reply that
+    streamed to completion is cached like get_huggingface_response. The whole
+    stream shares one CHAT_LATENCY_BUDGET and the circuit breaker; a stream
+    that fails after its first piece raises once it stops.
+    """
+    if not hf_breaker.allow():
+        yield from chunk_text(get_fallback_response(user_message))
+        return
+    
+    parts = []
+    completed = False
+    failed = False
+    deadline = time.monotonic() + CHAT_LATENCY_BUDGET
+    try:
+        headers, payload = build_huggingface_request(user_message, stream=True)
+        with requests.post(HF_API_URL, headers=headers, json=payload, timeout=CHAT_LATENCY_BUDGET, stream=True) as response:
+            if response.status_code != 200:
+                failed = True
+                print(f"Hugging Face API error: {response.status_code} - {response.text}")
+            elif response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                for line in response.iter_lines(decode_unicode=True):
+                    if time.monotonic() > deadline:
+                        raise requests.exceptions.Timeout("latency budget exceeded")
+                    if not line or not line.startswith('data:'):
+                        continue
+                    token = json.loads(line[len('data:'):]).get('token') or {}
+                    if token.get('text') and not token.get('special'):
+                        parts.append(token['text'])
+                        yield token['text']
+                completed = True
+            else:
+                result = response.json()
+                if isinstance(result, list) and len(result) > 0 and result[0].get('generated_text'):
+                    parts.append(result[0]['generated_text'])
+                    yield from chunk_text(parts[0])
+                completed = True
+    except requests.exceptions.Timeout:
+        failed = True
+        print("Hugging Face API timeout")
+    except requests.exceptions.RequestException as e:
+        failed = True
+        print(f"Hugging Face API request error: {e}")
+    except Exception as e:
+        failed = True
+        print(f"Unexpected error: {e}")
+    finally:
+        if completed:
+            hf_breaker.record_success()
+        elif failed:
+            hf_breaker.record_failure()
+    
+    if parts:
+        if not completed:
+            raise RuntimeError("Hugging Face stream cut short")
+        chat_cache.set(user_message, ''.join(parts), personalized)
+    else:
+        # Nothing was sent yet, so the fallback can still take the reply's place
+        yield from chunk_text(get_fallback_response(user_message))
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Event carrying JSON data"""
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+# Sample data is handled by the storage backend
 # No need for separate sample data function
 
 # Routes
@@ -184,7 +387,7 @@ def login():
             return render_template("login.html")
         
         # Get user from Firebase
-        user_id, user_data = firebase_service.get_user_by_username(username)
+        user_id, user_data = storage.get_user_by_username(username)
         
         if user_data and check_password_hash(user_data['password_hash'], password):
             session['user_id'] = user_id
@@ -221,14 +424,12 @@ def signup():
             return render_template("signup.html")
         
         # Check if Firebase is connected
-        if not firebase_service.is_connected():
+        if not storage.is_connected():
             flash('Database connection error. Please try again later.', 'error')
             return render_template("signup.html")
         
         # Check if user already exists
-        existing_user_id, existing_user_data = firebase_service.get_user_by_username(username)
-        
-        if existing_user_data:
+        if storage.is_identity_taken(username, email):
             flash('Username or email already exists', 'error')
             return render_template("signup.html")
         
@@ -240,7 +441,8 @@ def signup():
             'password_hash': password_hash
         }
         
-        user_id = firebase_service.create_user(user_data)
+        # Claims the username and email atomically, None if another signup won the race
+        user_id = storage.create_user(user_data)
         
         if user_id:
             session['user_id'] = user_id
@@ -302,12 +504,13 @@ def profile_setup():
             'budget': budget,
             'location': location,
             'bio': bio,
-            'interests': json.dumps(interests),
-            'lifestyle_preferences': json.dumps(lifestyle_prefs)
+            'interests': interests,
+            'lifestyle_preferences': lifestyle_prefs
         }
         
         # Create profile in Firebase
-        if firebase_service.create_profile(session['user_id'], profile_data):
+        if storage.create_profile(session['user_id'], profile_data):
+            profile_index.upsert(session['user_id'], profile_data)
             flash('Profile created successfully!', 'success')
             return redirect(url_for('swipe'))
         else:
@@ -315,153 +518,72 @@ def profile_setup():
     
     return render_template("profile_setup.html")
 
+# Held by the one request reloading the candidate index
+profile_index_reload = threading.Lock()
+
+async def refresh_profile_index():
+    """Reload the candidate index from storage once its snapshot has expired
+
+    One request reloads at a time while the others keep using the current
+    snapshot; they wait for the reload only when there is no snapshot yet.
+    """
+    if not profile_index.is_stale():
+        return
+    if not profile_index_reload.acquire(blocking=False):
+        if profile_index.loaded_at is not None:
+            return
+        await asyncio.get_running_loop().run_in_executor(None, profile_index_reload.acquire)
+    try:
+        if profile_index.is_stale():
+            all_profiles = await async_storage.get_all_profiles()
+            if all_profiles:
+                profile_index.load(all_profiles)
+    finally:
+        profile_index_reload.release()
+
 @app.route("/swipe")
 @require_login
-def swipe():
-    # Get user's profile from Firebase
-    user_profile = firebase_service.get_profile(session['user_id'])
+async def swipe():
+    user_id = session['user_id']
+    
+    if swipe_decks.needs_refill(user_id):
+        # The deck has to be rebuilt, so fetch the profile, swipe history and
+        # (when stale) the candidate index concurrently
+        user_profile, swiped_ids, _ = await asyncio.gather(
+            async_storage.get_profile(user_id),
+            async_storage.get_swiped_users(user_id),
+            refresh_profile_index()
+        )
+    else:
+        user_profile = await async_storage.get_profile(user_id)
+        swiped_ids = None
     
     if not user_profile:
         return redirect(url_for('profile_setup'))
     
-    # Get potential matches (users not yet swiped on)
-    swiped_ids = firebase_service.get_swiped_users(session['user_id'])
-    
-    # Get all profiles except current user and already swiped users
-    all_profiles = firebase_service.get_all_profiles(exclude_user_id=session['user_id'])
+    # Rebuild the ranked deck only when it is missing, low, or the profile changed
+    if swipe_decks.needs_refill(user_id, user_profile):
+        if swiped_ids is None:
+            swiped_ids, _ = await asyncio.gather(
+                async_storage.get_swiped_users(user_id),
+                refresh_profile_index()
+            )
+        
+        # Swipes still queued for write-behind are not in storage yet
+        swiped_ids = set(swiped_ids) | swipe_writer.pending_swiped(user_id)
+        
+        # Gather a bounded set of plausible, not yet swiped candidates and
+        # keep only the top ones, best first
+        swipe_decks.fill(user_id, user_profile,
+                         candidate_pipeline.build(user_id, user_profile, swiped_ids, swipe_decks.size))
     
-    # Filter out already swiped users
-    available_matches = [profile for profile in all_profiles if profile['user_id'] not in swiped_ids]
+    best_match = swipe_decks.peek(session['user_id'])
     
-    if not available_matches:
+    if not best_match:
         return render_template("no_more_matches.html")
     
-    # Calculate compatibility scores and sort by best matches
-    scored_matches = []
-    for match in available_matches:
-        score = calculate_compatibility_score(user_profile, match)
-        scored_matches.append((match, score))
-    
-    # Sort by compatibility score (highest first)
-    scored_matches.sort(key=lambda x: x[1], reverse=True)
-    
-    # Select the best match
-    best_match = scored_matches[0][0]
-    
     return render_template("swipe.html", match=best_match)
 
-def calculate_compatibility_score(user_profile, potential_match):
-    """Calculate compatibility score between two users with location priority"""
-    score = 0
-    
-    # Location compatibility (highest priority for nearby roommates)
-    location_score = calculate_location_score(user_profile['location'], potential_match['location'])
-    score += location_score
-    
-    # Budget compatibility
-    budget_diff = abs(user_profile['budget'] - potential_match['budget'])
-    if budget_diff <= 100:
-        score += 30
-    elif budget_diff <= 200:
-        score += 20
-    elif budget_diff <= 300:
-        score += 10
-    
-    # Age compatibility
-    age_diff = abs(user_profile['age'] - potential_match['age'])
-    if age_diff <= 2:
-        score += 20
-    elif age_diff <= 5:
-        score += 15
-    elif age_diff <= 10:
-        score += 10
-    
-    # Interests compatibility
-    user_interests = eval(user_profile['interests']) if user_profile['interests'] else []
-    match_interests = eval(potential_match['interests']) if potential_match['interests'] else []
-    
-    if user_interests and match_interests:
-        common_interests = set(user_interests) & set(match_interests)
-        interest_score = (len(common_interests) / max(len(user_interests), len(match_interests))) * 25
-        score += interest_score
-    
-    # Lifestyle preferences compatibility
-    user_lifestyle = eval(user_profile['lifestyle_preferences']) if user_profile['lifestyle_preferences'] else []
-    match_lifestyle = eval(potential_match['lifestyle_preferences']) if potential_match['lifestyle_preferences'] else []
-    
-    if user_lifestyle and match_lifestyle:
-        common_lifestyle = set(user_lifestyle) & set(match_lifestyle)
-        lifestyle_score = (len(common_lifestyle) / max(len(user_lifestyle), len(match_lifestyle))) * 20
-        score += lifestyle_score
-    
-    # Add some randomness
-    score += random.uniform(0, 5)
-    
-    return score
-
-def calculate_location_score(user_location, match_location):
-    """Calculate location compatibility score with enhanced matching"""
-    user_loc = user_location.lower().strip()
-    match_loc = match_location.lower().strip()
-    
-    # Exact match (highest score)
-    if user_loc == match_loc:
-        return 40
-    
-    # Check for city-level matches
-    user_city = user_loc.split(',')[0].strip()
-    match_city = match_loc.split(',')[0].strip()
-    
-    if user_city == match_city:
-        return 35
-    
-    # Check for partial matches (same area/neighborhood)
-    user_words = set(user_loc.replace(',', ' ').split())
-    match_words = set(match_loc.replace(',', ' ').split())
-    
-    # Find common words (excluding common words)
-    common_words = user_words & match_words
-    common_words.discard('downtown')
-    common_words.discard('midtown')
-    common_words.discard('uptown')
-    common_words.discard('east')
-    common_words.discard('west')
-    common_words.discard('north')
-    common_words.discard('south')
-    
-    if common_words:
-        return 25 + len(common_words) * 5
-    
-    # Check for coordinate-based matching (if locations are coordinates)
-    if ',' in user_loc and ',' in match_loc:
-        try:
-            user_coords = user_loc.split(',')
-            match_coords = match_loc.split(',')
-            
-            if len(user_coords) == 2 and len(match_coords) == 2:
-                user_lat = float(user_coords[0].strip())
-                user_lng = float(user_coords[1].strip())
-                match_lat = float(match_coords[0].strip())
-                match_lng = float(match_coords[1].strip())
-                
-                # Calculate distance (simplified)
-                distance = ((user_lat - match_lat) ** 2 + (user_lng - match_lng) ** 2) ** 0.5
-                
-                # Score based on distance (closer = higher score)
-                if distance < 0.01:  # Very close (within ~1km)
-                    return 35
-                elif distance < 0.05:  # Close (within ~5km)
-                    return 25
-                elif distance < 0.1:  # Nearby (within ~10km)
-                    return 15
-                else:
-                    return 5
-        except ValueError:
-            pass
-    
-    # No match
-    return 0
-
 @app.route("/swipe_action", methods=["POST"])
 @require_login
 def swipe_action():
@@ -469,27 +591,25 @@ def swipe_action():
     swiped_id = data.get('swiped_id')
     action = data.get('action')
     
-    # Record the swipe in Firebase
-    if firebase_service.create_swipe(session['user_id'], swiped_id, action):
-        # If it's a like, check if it's a mutual match
-        if action == 'like':
-            if firebase_service.check_mutual_like(session['user_id'], swiped_id):
-                # Create a match
-                firebase_service.create_match(session['user_id'], swiped_id)
-        
-        return jsonify({'success': True})
+    # Record the swipe; a returned like creates the match in the same write
+    success, matched = swipe_writer.record_swipe(session['user_id'], swiped_id, action)
+    if success:
+        swipe_decks.discard(session['user_id'], swiped_id)
+        return jsonify({'success': True, 'match': matched})
     else:
         return jsonify({'success': False, 'error': 'Failed to record swipe'})
 
 @app.route("/matches")
 @require_login
-def matches():
-    # Get user's matches from Firebase
-    user_matches = firebase_service.get_user_matches(session['user_id'])
+async def matches():
+    # Matches and swipe history are independent, so read them concurrently
+    user_matches, user_swipes = await asyncio.gather(
+        async_storage.get_user_matches(session['user_id']),
+        async_storage.get_user_swipes(session['user_id'])
+    )
     
-    # Debug: Get user's swipe history
-    user_swipes = firebase_service.get_user_swipes(session['user_id'])
-    likes_received = [swipe for swipe in firebase_service.get_user_swipes(session['user_id']) if swipe.get('action') == 'like']
+    # Debug: Summarize the user's swipe history
+    likes_received = [swipe for swipe in user_swipes if swipe.get('action') == 'like']
     
     print(f"Debug - User {session['user_id']}:")
     print(f"  - Matches found: {len(user_matches)}")
@@ -513,6 +633,34 @@ def chat_assistant():
 def success_predictor():
     return render_template("success_predictor.html")
 
+@app.route("/chat/stream", methods=["POST"])
+@require_login
+def chat_stream():
+    """Stream the reply to a chat message as Server-Sent Events"""
+    data = request.get_json(silent=True) or {}
+    user_message = (data.get('message') or '').strip()
+    
+    if not user_message:
+        return jsonify({'error': 'Message cannot be empty'}), 400
+    
+    personalized = bool(data.get('personalized'))
+    def events():
+        try:
+            for chunk in stream_huggingface_response(user_message, personalized):
+                yield sse_event({'delta': chunk})
+        except Exception as e:
+            # A reply cut short must not look finished to the client
+            print(f"Chat stream error: {e}")
+            yield sse_event({'error': 'Sorry, I encountered an error. Please try again.'}, event='error')
+            return
+        yield sse_event({'done': True}, event='done')
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Keep reverse proxies from buffering the stream
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route("/chat", methods=["POST"])
 @require_login
 def chat():
@@ -524,8 +672,8 @@ def chat():
         if not user_message:
             return jsonify({'error': 'Message cannot be empty'}), 400
         
-        # Get AI response from Hugging Face API
-        ai_response = get_huggingface_response(user_message)
+        # Get AI response from Hugging Face API; personalized prompts skip the reply cache
+        ai_response = get_huggingface_response(user_message, personalized=bool(data.get('personalized')))
         
         return jsonify({
             'success': True,
@@ -560,7 +708,8 @@ def reset_database():
     """Reset the Firebase database - adds sample data"""
     try:
         # Add sample data to Firebase
-        if firebase_service.add_sample_data():
+        if storage.add_sample_data():
+            profile_index.invalidate()
             print("Sample data added to Firebase")
             return jsonify({'success': True, 'message': 'Firebase database reset with sample data'})
         else:
@@ -569,6 +718,24 @@ def reset_database():
         print(f"Error resetting Firebase database: {e}")
         return jsonify({'success': False, 'message': f'Error resetting Firebase database: {str(e)}'})
 
+@app.route("/metrics")
+def metrics():
+    """Expose in-process cache and connection pool counters for monitoring"""
+    return jsonify({
+        'cache': storage.cache_stats(),
+        'pool': storage.pool_stats(),
+        'replica': storage.replica_stats(),
+        'profile_index': profile_index.stats(),
+        'candidate_pipeline': candidate_pipeline.stats(),
+        'pair_scores': pair_scores.stats(),
+        'swipe_decks': swipe_decks.stats(),
+        'change_feed': change_feed.stats(),
+        'swipe_writer': swipe_writer.stats(),
+        'chat_cache': chat_cache.stats(),
+        'chat_breaker': hf_breaker.stats(),
+        'inference_pool': inference_pool.stats()
+    })
+
 @app.route("/logout")
 def logout():
     session.clear()
@@ -0,0 +1,480 @@
+"""
+Compatibility Scoring
+Scalar and batch (vectorized) roommate compatibility scoring
+"""
+
+import hashlib
+import json
+from datetime import date
+from functools import lru_cache
+import numpy as np
+from geo import geohash_encode, haversine_km, haversine_km_many, parse_coordinates, profile_coordinates
+
+# Known tag values offered by profile_setup.html, in a fixed bit order
+INTEREST_VOCABULARY = [
+    'Music', 'Sports', 'Gaming', 'Cooking', 'Reading', 'Travel',
+    'Fitness', 'Art', 'Movies', 'Photography', 'Technology', 'Nature'
+]
+
+LIFESTYLE_VOCABULARY = [
+    'Early Bird', 'Night Owl', 'Flexible',
+    'Very Social', 'Moderately Social', 'Quiet',
+    'Very Clean', 'Moderately Clean', 'Relaxed',
+    'Love Pets', 'Neutral', 'No Pets'
+]
+
+# Upper bound of the tie-breaking jitter added to every score
+JITTER_POINTS = 5
+
+def daily_jitter_seed(today=None):
+    """Jitter seed that changes once a day, so deck order reshuffles daily but is reproducible"""
+    return (today or date.today()).isoformat()
+
+def _jitter_seed(jitter):
+    """Resolve a jitter argument: True for the daily seed, a falsy value for none, else a seed"""
+    if jitter is True:
+        return daily_jitter_seed()
+    return str(jitter) if jitter else None
+
+_MASK64 = (1 << 64) - 1
+
+@lru_cache(maxsize=1 << 18)
+def id_hash(value):
+    """64-bit hash of a user ID, memoized since the same IDs are scored again and again"""
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+
+def _mix64(z):
+    """SplitMix64 finalizer over a 64-bit int"""
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+def _mix64_many(z):
+    """SplitMix64 finalizer over a uint64 array (multiplication wraps like the & _MASK64 above)"""
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def pair_jitter(user_id, match_id, seed):
+    """Deterministic jitter in [0, JITTER_POINTS) for an ordered pair of users and a seed
+
+    The viewer and seed hash is mixed with the match's ID hash, so
+    pair_jitters computes the same values for a whole block with array ops.
+    """
+    mixed = _mix64(id_hash(f"{seed}:{user_id}") ^ id_hash(match_id))
+    return (mixed >> 11) * 2.0 ** -53 * JITTER_POINTS
+
+def pair_jitters(user_id, match_hashes, seed):
+    """pair_jitter for one user against an array of id_hash values, bit for bit"""
+    mixed = _mix64_many(match_hashes ^ np.uint64(id_hash(f"{seed}:{user_id}")))
+    return (mixed >> np.uint64(11)).astype(np.float64) * 2.0 ** -53 * JITTER_POINTS
+
+def calculate_compatibility_score(user_profile, potential_match, jitter=True):
+    """Calculate compatibility score between two users with location priority
+
+    jitter is True for the daily seed, False for none, or an explicit seed.
+    """
+    score = 0
+
+    # Location compatibility (highest priority for nearby roommates)
+    location_score = calculate_profile_location_score(user_profile, potential_match)
+    score += location_score
+
+    # Budget compatibility
+    budget_diff = abs(user_profile['budget'] - potential_match['budget'])
+    if budget_diff <= 100:
+        score += 30
+    elif budget_diff <= 200:
+        score += 20
+    elif budget_diff <= 300:
+        score += 10
+
+    # Age compatibility
+    age_diff = abs(user_profile['age'] - potential_match['age'])
+    if age_diff <= 2:
+        score += 20
+    elif age_diff <= 5:
+        score += 15
+    elif age_diff <= 10:
+        score += 10
+
+    # Interests compatibility
+    user_interests = parse_tags(user_profile.get('interests'))
+    match_interests = parse_tags(potential_match.get('interests'))
+
+    if user_interests and match_interests:
+        common_interests = set(user_interests) & set(match_interests)
+        interest_score = (len(common_interests) / max(len(user_interests), len(match_interests))) * 25
+        score += interest_score
+
+    # Lifestyle preferences compatibility
+    user_lifestyle = parse_tags(user_profile.get('lifestyle_preferences'))
+    match_lifestyle = parse_tags(potential_match.get('lifestyle_preferences'))
+
+    if user_lifestyle and match_lifestyle:
+        common_lifestyle = set(user_lifestyle) & set(match_lifestyle)
+        lifestyle_score = (len(common_lifestyle) / max(len(user_lifestyle), len(match_lifestyle))) * 20
+        score += lifestyle_score
+
+    # Add some randomness, stable for the pair within a day
+    seed = _jitter_seed(jitter)
+    if seed is not None:
+        score += pair_jitter(user_profile.get('user_id'), potential_match.get('user_id'), seed)
+
+    return score
+
+# Direction and district words too generic to signal the same area
+LOCATION_STOPWORDS = frozenset({'downtown', 'midtown', 'uptown', 'east', 'west', 'north', 'south'})
+
+def location_terms(location):
+    """Normalized (key, city, tokens) of a location string
+
+    key is the lowercased location, city its first comma-separated part and
+    tokens its words minus LOCATION_STOPWORDS.
+    """
+    key = location.lower().strip()
+    city = key.split(',')[0].strip()
+    tokens = set(key.replace(',', ' ').split()) - LOCATION_STOPWORDS
+    return key, city, tokens
+
+def profile_location_terms(profile):
+    """Location terms stored on a profile, computed only for legacy records"""
+    if profile.get('location_key') is not None:
+        return profile['location_key'], profile.get('location_city', ''), set(profile.get('location_tokens') or ())
+    return location_terms(profile['location'])
+
+def calculate_location_score(user_location, match_location):
+    """Calculate location compatibility score with enhanced matching"""
+    user_terms = location_terms(user_location)
+    match_terms = location_terms(match_location)
+
+    # Exact match (highest score)
+    if user_terms[0] == match_terms[0]:
+        return 40
+
+    # Coordinate locations (e.g. from browser geolocation) score by real distance
+    user_coords = parse_coordinates(user_terms[0])
+    match_coords = parse_coordinates(match_terms[0])
+    if user_coords and match_coords:
+        return distance_score(haversine_km(*user_coords, *match_coords))
+
+    return _text_location_score(user_terms, match_terms)
+
+def _text_location_score(user_terms, match_terms):
+    """Location points from normalized (key, city, tokens) terms"""
+    user_key, user_city, user_tokens = user_terms
+    match_key, match_city, match_tokens = match_terms
+
+    # Exact match (highest score)
+    if user_key == match_key:
+        return 40
+
+    # Check for city-level matches
+    if user_city == match_city:
+        return 35
+
+    # Check for partial matches (same area/neighborhood), ignoring stopwords
+    common_words = user_tokens & match_tokens
+    if common_words:
+        return 25 + len(common_words) * 5
+
+    # No match
+    return 0
+
+# (max distance in km, points) tiers for coordinate locations
+DISTANCE_TIERS = [(1, 35), (5, 25), (10, 15)]
+DISTANCE_FLOOR_POINTS = 5
+
+def distance_score(distance_km):
+    """Location points for two coordinate locations distance_km apart"""
+    for max_distance, points in DISTANCE_TIERS:
+        if distance_km < max_distance:
+            return points
+    return DISTANCE_FLOOR_POINTS
+
+def calculate_profile_location_score(user_profile, match_profile):
+    """Location score using the coordinates stored on the profiles when available"""
+    user_coords = profile_coordinates(user_profile)
+    match_coords = profile_coordinates(match_profile)
+    if user_coords and match_coords:
+        if profile_location_terms(user_profile)[0] == profile_location_terms(match_profile)[0]:
+            return 40
+        return distance_score(haversine_km(*user_coords, *match_coords))
+    return _text_location_score(profile_location_terms(user_profile), profile_location_terms(match_profile))
+
+def normalize_location_fields(profile_data):
+    """Store the location's normalized terms, and coordinates as floats plus a geohash
+
+    Parsed once at write time so scoring and the candidate indexes never
+    re-parse the string. Text locations get the coordinate fields cleared
+    (None), which also removes stale coordinates on a partial update.
+    """
+    if 'location' in profile_data:
+        key, city, tokens = location_terms(profile_data['location'])
+        profile_data['location_key'] = key
+        profile_data['location_city'] = city
+        profile_data['location_tokens'] = sorted(tokens)
+        coords = parse_coordinates(profile_data['location'])
+        if coords:
+            profile_data['latitude'], profile_data['longitude'] = coords
+            profile_data['geohash'] = geohash_encode(*coords)
+        else:
+            profile_data['latitude'] = profile_data['longitude'] = profile_data['geohash'] = None
+    return profile_data
+
+def normalize_profile_fields(profile_data):
+    """Normalize every derived field of a profile before it is written"""
+    normalize_tag_fields(profile_data)
+    normalize_location_fields(profile_data)
+    return profile_data
+
+# Batch Scoring
+
+class TagVocabulary:
+    """Fixed bit position for each known tag value (at most 64 tags)
+
+    Built once and never changed, so it is safe to share between threads.
+    Tags outside it (profile_setup accepts custom ones) get no bit; scoring
+    compares them as sets instead.
+    """
+
+    MAX_TAGS = 64
+
+    def __init__(self, tags=()):
+        tags = list(dict.fromkeys(tags))
+        if len(tags) > self.MAX_TAGS:
+            raise ValueError(f"A tag vocabulary holds at most {self.MAX_TAGS} tags")
+        self.bits = {tag: bit for bit, tag in enumerate(tags)}
+
+    def split(self, tags):
+        """Bitmask of the known tags and the set of tags outside the vocabulary"""
+        mask = 0
+        custom = set()
+        for tag in tags:
+            bit = self.bits.get(tag)
+            if bit is None:
+                custom.add(tag)
+            else:
+                mask |= 1 << bit
+        return mask, frozenset(custom)
+
+    def encode_fixed(self, tags):
+        """Encode tags over the vocabulary, or None if any tag is outside it"""
+        mask, custom = self.split(tags)
+        return None if custom else mask
+
+interest_vocabulary = TagVocabulary(INTEREST_VOCABULARY)
+lifestyle_vocabulary = TagVocabulary(LIFESTYLE_VOCABULARY)
+
+# (tag list field, stored bitmask field, vocabulary)
+TAG_FIELDS = [
+    ('interests', 'interests_mask', interest_vocabulary),
+    ('lifestyle_preferences', 'lifestyle_mask', lifestyle_vocabulary)
+]
+
+def parse_tags(value):
+    """Parse a stored interests/lifestyle value into a list of tags
+
+    Profiles are stored with native lists; legacy records hold a JSON string.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value)
+
+def normalize_tag_fields(profile_data):
+    """Store interests/lifestyle as native lists plus fixed-vocabulary bitmasks
+
+    Only fields present in profile_data are touched, so this is safe for
+    partial updates. A mask is None when the list holds tags outside the fixed
+    vocabulary; scoring then encodes that list on the fly.
+    """
+    for field, mask_field, vocabulary in TAG_FIELDS:
+        if field in profile_data:
+            tags = parse_tags(profile_data[field])
+            profile_data[field] = tags
+            profile_data[mask_field] = vocabulary.encode_fixed(tags)
+    return profile_data
+
+def needs_tag_migration(profile_data):
+    """Check whether a stored profile still lacks the normalized tag fields"""
+    for field, mask_field, vocabulary in TAG_FIELDS:
+        value = profile_data.get(field)
+        if isinstance(value, str):
+            return True
+        if value and profile_data.get(mask_field) is None and vocabulary.encode_fixed(value) is not None:
+            return True
+    return False
+
+def _tag_encoding(profile, mask_field, vocabulary, tags):
+    """Bitmask of the known tags (the stored one when present) and the custom tags"""
+    mask = profile.get(mask_field)
+    if mask is None:
+        return vocabulary.split(tags)
+    return mask, frozenset()
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount(masks):
+        return np.bitwise_count(masks).astype(np.int64)
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+    def _popcount(masks):
+        as_bytes = masks.view(np.uint8).reshape(masks.shape + (8,))
+        return _POPCOUNT_TABLE[as_bytes].sum(axis=-1)
+
+class CandidateBlock:
+    """Columnar block of candidate profiles ready for batch scoring"""
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+        self.locations = [profile['location'] for profile in profiles]
+        coordinates = [profile_coordinates(profile) or (np.nan, np.nan) for profile in profiles]
+        self.latitudes = np.array([lat for lat, lng in coordinates], dtype=np.float64)
+        self.longitudes = np.array([lng for lat, lng in coordinates], dtype=np.float64)
+        self.budgets = np.array([profile['budget'] for profile in profiles], dtype=np.int64)
+        self.ages = np.array([profile['age'] for profile in profiles], dtype=np.int64)
+        self._id_hashes = None
+
+        (self.interest_masks, self.interest_counts, self.interest_custom), (
+            self.lifestyle_masks, self.lifestyle_counts, self.lifestyle_custom) = [
+            self._encode_column(profiles, field, mask_field, vocabulary)
+            for field, mask_field, vocabulary in TAG_FIELDS
+        ]
+
+    @staticmethod
+    def _encode_column(profiles, field, mask_field, vocabulary):
+        """Known-tag bitmasks, tag counts, and the custom tags of the rows that have any"""
+        masks = np.zeros(len(profiles), dtype=np.uint64)
+        counts = np.zeros(len(profiles), dtype=np.int64)
+        custom = {}
+        for i, profile in enumerate(profiles):
+            tags = parse_tags(profile.get(field))
+            masks[i], row_custom = _tag_encoding(profile, mask_field, vocabulary, tags)
+            counts[i] = len(tags)
+            if row_custom:
+                custom[i] = row_custom
+        return masks, counts, custom
+
+    @property
+    def id_hashes(self):
+        """id_hash of every candidate's user ID, computed on first use"""
+        if self._id_hashes is None:
+            self._id_hashes = np.array([id_hash(profile.get('user_id')) for profile in self.profiles], dtype=np.uint64)
+        return self._id_hashes
+
+    def __len__(self):
+        return len(self.profiles)
+
+# (max absolute difference, points) tiers, matching calculate_compatibility_score
+BUDGET_TIERS = [(100, 30), (200, 20), (300, 10)]
+AGE_TIERS = [(2, 20), (5, 15), (10, 10)]
+
+# Beyond these differences budget and age earn no points
+BUDGET_WINDOW = BUDGET_TIERS[-1][0]
+AGE_WINDOW = AGE_TIERS[-1][0]
+
+def _tiered(diffs, tiers):
+    """Map absolute differences to points using (max_diff, points) tiers"""
+    thresholds = [max_diff for max_diff, points in tiers]
+    points = np.array([points for max_diff, points in tiers] + [0], dtype=np.float64)
+    return points[np.searchsorted(thresholds, diffs, side='left')]
+
+def _overlap_scores(user_mask, user_custom, user_count, masks, counts, custom, weight):
+    """Shared-tag ratio scores for one user against a block of tag masks
+
+    Known tags are compared by bitmask; custom tags only for the few rows
+    that have any.
+    """
+    scores = np.zeros(len(masks), dtype=np.float64)
+    if user_count == 0:
+        return scores
+
+    common = _popcount(masks & np.uint64(user_mask))
+    if user_custom:
+        for i, row_custom in custom.items():
+            common[i] += len(user_custom & row_custom)
+    valid = counts > 0
+    scores[valid] = (common[valid] / np.maximum(user_count, counts[valid])) * weight
+    return scores
+
+def _location_scores(user_profile, block):
+    """Location points for one user against a CandidateBlock
+
+    Rows with coordinates are scored by vectorized haversine distance when the
+    user has coordinates too; text locations are scored once per distinct string.
+    """
+    scores = np.zeros(len(block), dtype=np.float64)
+    user_coords = profile_coordinates(user_profile)
+    if user_coords:
+        coordinate_rows = ~np.isnan(block.latitudes)
+    else:
+        coordinate_rows = np.zeros(len(block), dtype=bool)
+
+    if coordinate_rows.any():
+        distances = haversine_km_many(user_coords[0], user_coords[1],
+                                      block.latitudes[coordinate_rows], block.longitudes[coordinate_rows])
+        thresholds = [max_distance for max_distance, points in DISTANCE_TIERS]
+        points = np.array([points for max_distance, points in DISTANCE_TIERS] + [DISTANCE_FLOOR_POINTS], dtype=np.float64)
+        scores[coordinate_rows] = points[np.searchsorted(thresholds, distances, side='right')]
+
+    location_points = {}
+    user_terms = profile_location_terms(user_profile)
+    for i, (location, has_coordinates) in enumerate(zip(block.locations, coordinate_rows)):
+        if has_coordinates:
+            if location.lower().strip() == user_terms[0]:
+                scores[i] = 40
+            continue
+        if location not in location_points:
+            location_points[location] = _text_location_score(user_terms, location_terms(location))
+        scores[i] = location_points[location]
+    return scores
+
+def score_candidates(user_profile, block, jitter=True):
+    """Score every candidate in a CandidateBlock against one user in a single pass"""
+    if len(block) == 0:
+        return np.zeros(0, dtype=np.float64)
+
+    scores = _location_scores(user_profile, block)
+
+    scores += _tiered(np.abs(block.budgets - user_profile['budget']), BUDGET_TIERS)
+    scores += _tiered(np.abs(block.ages - user_profile['age']), AGE_TIERS)
+
+    columns = [
+        (block.interest_masks, block.interest_counts, block.interest_custom, 25),
+        (block.lifestyle_masks, block.lifestyle_counts, block.lifestyle_custom, 20)
+    ]
+    for (field, mask_field, vocabulary), (masks, counts, custom, weight) in zip(TAG_FIELDS, columns):
+        tags = parse_tags(user_profile.get(field))
+        user_mask, user_custom = _tag_encoding(user_profile, mask_field, vocabulary, tags)
+        scores += _overlap_scores(user_mask, user_custom, len(tags), masks, counts, custom, weight)
+
+    seed = _jitter_seed(jitter)
+    if seed is not None:
+        scores += pair_jitters(user_profile.get('user_id'), block.id_hashes, seed)
+
+    return scores
+
+def select_top_candidates(user_profile, candidates, k, jitter=True, score_cache=None):
+    """Select the k best-scoring candidates, best first, as (score, profile) pairs
+
+    Uses a partial selection (argpartition) so only the top k are sorted.
+    With a score_cache (see score_cache.PairScoreCache) only pairs it does
+    not hold are scored.
+    """
+    if not candidates or k <= 0:
+        return []
+
+    seed = _jitter_seed(jitter)
+    if score_cache is not None:
+        scores = score_cache.scores(user_profile, candidates, seed,
+                                    lambda subset: score_candidates(user_profile, CandidateBlock(subset), seed))
+    else:
+        scores = score_candidates(user_profile, CandidateBlock(candidates), seed)
+    if len(candidates) > k:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(candidates))
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return [(float(scores[i]), candidates[i]) for i in top]
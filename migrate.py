@@ -0,0 +1,179 @@
+"""
+Data Migrations
+Streaming, batched rewrites of existing Firebase records
+
+Usage:
+    python migrate.py {profiles,locations,swipes,users,matches} [--batch-size 500] [--dry-run] [--rest]
+"""
+
+import argparse
+from matching import TAG_FIELDS, needs_tag_migration, normalize_location_fields, normalize_tag_fields
+from firebase_paths import email_path, match_paths, swipe_paths, username_path
+
+def get_service(use_rest):
+    """Get the Firebase service to migrate through"""
+    if use_rest:
+        from firebase_rest_service import firebase_rest_service
+        return firebase_rest_service
+    from firebase_config import firebase_service
+    return firebase_service
+
+def migrate_profiles(service, batch_size=500, dry_run=False):
+    """Rewrite legacy JSON-string interests/lifestyle into lists plus bitmasks"""
+    scanned = 0
+    migrated = 0
+    for batch in service.iter_node('profiles', batch_size):
+        updates = {}
+        for user_id, profile_data in batch:
+            scanned += 1
+            if not profile_data or not needs_tag_migration(profile_data):
+                continue
+
+            fields = {field: profile_data.get(field) for field, mask_field, vocabulary in TAG_FIELDS}
+            for field, value in normalize_tag_fields(fields).items():
+                updates[f"profiles/{user_id}/{field}"] = value
+            migrated += 1
+
+        if updates and not dry_run and not service.multi_update(updates):
+            print(f"❌ Failed to write batch ending at profile {batch[-1][0]}")
+            return False
+        print(f"Scanned {scanned} profiles, migrated {migrated}")
+
+    print(f"✅ Profile migration complete: {migrated} of {scanned} profiles {'would be ' if dry_run else ''}rewritten")
+    return True
+
+def migrate_locations(service, batch_size=500, dry_run=False):
+    """Store normalized location terms, and coordinates as latitude/longitude plus a geohash"""
+    scanned = 0
+    migrated = 0
+    for batch in service.iter_node('profiles', batch_size):
+        updates = {}
+        for user_id, profile_data in batch:
+            scanned += 1
+            if not profile_data or not profile_data.get('location'):
+                continue
+
+            derived = normalize_location_fields({'location': profile_data['location']})
+            changed = {
+                field: value for field, value in derived.items()
+                if field != 'location' and profile_data.get(field) != value
+            }
+            # Firebase drops empty lists, so a missing token list is already up to date
+            if changed.get('location_tokens') == [] and 'location_tokens' not in profile_data:
+                del changed['location_tokens']
+            if not changed:
+                continue
+
+            for field, value in changed.items():
+                updates[f"profiles/{user_id}/{field}"] = value
+            migrated += 1
+
+        if updates and not dry_run and not service.multi_update(updates):
+            print(f"❌ Failed to write batch ending at profile {batch[-1][0]}")
+            return False
+        print(f"Scanned {scanned} profiles, migrated {migrated}")
+
+    print(f"✅ Location migration complete: {migrated} of {scanned} profiles {'would be ' if dry_run else ''}rewritten")
+    return True
+
+def backfill_swipe_indexes(service, batch_size=500, dry_run=False):
+    """Build the swipes_by_user and likes_received indexes from existing swipe records"""
+    scanned = 0
+    for batch in service.iter_node('swipes', batch_size):
+        updates = {}
+        for swipe_id, swipe_data in batch:
+            if not swipe_data or not swipe_data.get('swiper_id') or not swipe_data.get('swiped_id'):
+                continue
+            scanned += 1
+            # Push IDs sort chronologically, so the latest swipe on a user wins
+            paths = swipe_paths(swipe_id, swipe_data)
+            del paths[f"swipes/{swipe_id}"]
+            updates.update(paths)
+
+        if updates and not dry_run and not service.multi_update(updates):
+            print(f"❌ Failed to write batch ending at swipe {batch[-1][0]}")
+            return False
+        print(f"Indexed {scanned} swipes")
+
+    print(f"✅ Swipe index backfill complete: {scanned} swipes {'would be ' if dry_run else ''}indexed")
+    return True
+
+def backfill_user_indexes(service, batch_size=500, dry_run=False):
+    """Build the usernames and emails indexes from existing user records
+
+    The first account seen for a username or email keeps it; later
+    duplicates are reported and left out of the index.
+    """
+    claimed = {}
+    scanned = 0
+    duplicates = 0
+    for batch in service.iter_node('users', batch_size):
+        updates = {}
+        for user_id, user_data in batch:
+            if not user_data:
+                continue
+            scanned += 1
+            for path in (username_path(user_data.get('username', '')), email_path(user_data.get('email', ''))):
+                if path.endswith('/'):
+                    continue
+                owner = claimed.setdefault(path, user_id)
+                if owner == user_id:
+                    updates[path] = user_id
+                else:
+                    duplicates += 1
+                    print(f"⚠️  {path} is used by {owner} and {user_id}, keeping {owner}")
+
+        if updates and not dry_run and not service.multi_update(updates):
+            print(f"❌ Failed to write batch ending at user {batch[-1][0]}")
+            return False
+        print(f"Indexed {scanned} users")
+
+    print(f"✅ User index backfill complete: {scanned} users {'would be ' if dry_run else ''}indexed, {duplicates} duplicates skipped")
+    return True
+
+def backfill_match_indexes(service, batch_size=500, dry_run=False):
+    """Build the matches_by_user index from existing match records"""
+    scanned = 0
+    for batch in service.iter_node('matches', batch_size):
+        updates = {}
+        for match_id, match_data in batch:
+            if not match_data or not match_data.get('user1_id') or not match_data.get('user2_id'):
+                continue
+            scanned += 1
+            paths = match_paths(match_id, match_data)
+            del paths[f"matches/{match_id}"]
+            updates.update(paths)
+
+        if updates and not dry_run and not service.multi_update(updates):
+            print(f"❌ Failed to write batch ending at match {batch[-1][0]}")
+            return False
+        print(f"Indexed {scanned} matches")
+
+    print(f"✅ Match index backfill complete: {scanned} matches {'would be ' if dry_run else ''}indexed")
+    return True
+
+MIGRATIONS = {
+    'profiles': migrate_profiles,
+    'locations': migrate_locations,
+    'swipes': backfill_swipe_indexes,
+    'users': backfill_user_indexes,
+    'matches': backfill_match_indexes,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a data migration against Firebase")
+    parser.add_argument('migration', choices=sorted(MIGRATIONS))
+    parser.add_argument('--batch-size', type=int, default=500, help="records read and written per round trip")
+    parser.add_argument('--dry-run', action='store_true', help="scan and report without writing")
+    parser.add_argument('--rest', action='store_true', help="use the REST API service instead of the Admin SDK")
+    args = parser.parse_args()
+
+    service = get_service(args.rest)
+    if not service.is_connected():
+        print("❌ Firebase is not connected")
+        return 1
+
+    return 0 if MIGRATIONS[args.migration](service, args.batch_size, args.dry_run) else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,293 @@
+"""
+Profile Index
+In-process secondary indexes over every profile, used to generate swipe candidates
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from geo import GeoIndex, profile_coordinates
+from matching import AGE_WINDOW, BUDGET_WINDOW, profile_location_terms
+
+class InvertedIndex:
+    """Maps terms (e.g. location tokens) to the user IDs whose profiles contain them"""
+
+    def __init__(self):
+        self.postings = {}
+        self.terms = {}
+
+    def add(self, user_id, terms):
+        """Index (or re-index) a user's terms"""
+        self.remove(user_id)
+        terms = frozenset(term for term in terms if term)
+        for term in terms:
+            self.postings.setdefault(term, set()).add(user_id)
+        self.terms[user_id] = terms
+
+    def remove(self, user_id):
+        """Drop a user from the index"""
+        for term in self.terms.pop(user_id, ()):
+            members = self.postings.get(term)
+            if members is not None:
+                members.discard(user_id)
+                if not members:
+                    del self.postings[term]
+
+    def lookup(self, terms):
+        """User IDs matching any of the terms"""
+        user_ids = set()
+        for term in terms:
+            user_ids.update(self.postings.get(term, ()))
+        return user_ids
+
+    def __len__(self):
+        return len(self.postings)
+
+def text_field(profile, field):
+    """A profile's string field (e.g. an ISO timestamp), None when missing"""
+    value = profile.get(field)
+    return value if isinstance(value, str) else None
+
+def numeric_field(profile, field):
+    """A profile's numeric field, None when missing or not a number"""
+    value = profile.get(field)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return value
+
+class SortedIndex:
+    """A profile field kept sorted, for bisect range lookups"""
+
+    def __init__(self, field, value=numeric_field):
+        self.field = field
+        self.value = value
+        self.keys = []
+        self.user_ids = []
+        self.values = {}
+
+    def build(self, profiles):
+        """Index a batch of (user_id, profile) pairs with one sort"""
+        entries = []
+        for user_id, profile in profiles:
+            value = self.value(profile, self.field)
+            if value is not None:
+                entries.append((value, user_id))
+                self.values[user_id] = value
+        entries.sort()
+        self.keys = [value for value, user_id in entries]
+        self.user_ids = [user_id for value, user_id in entries]
+
+    def add(self, user_id, profile):
+        """Index (or move) a user's value"""
+        self.remove(user_id)
+        value = self.value(profile, self.field)
+        if value is None:
+            return
+        i = bisect_right(self.keys, value)
+        self.keys.insert(i, value)
+        self.user_ids.insert(i, user_id)
+        self.values[user_id] = value
+
+    def remove(self, user_id):
+        """Drop a user from the index"""
+        value = self.values.pop(user_id, None)
+        if value is None:
+            return
+        i = bisect_left(self.keys, value)
+        while i < len(self.keys) and self.keys[i] == value:
+            if self.user_ids[i] == user_id:
+                del self.keys[i]
+                del self.user_ids[i]
+                return
+            i += 1
+
+    def range(self, low, high):
+        """User IDs whose value lies in [low, high], in value order"""
+        return self.user_ids[bisect_left(self.keys, low):bisect_right(self.keys, high)]
+
+    def __len__(self):
+        return len(self.keys)
+
+class ProfileIndex:
+    """Snapshot of all profiles plus candidate indexes over their locations
+
+    Coordinates go into a geohash grid, text locations into inverted indexes
+    of their city and tokens (see matching.location_terms), budget, age and
+    created_at into sorted indexes for range lookups. The snapshot is
+    reloaded from storage once it is older than ttl seconds; profiles written
+    by this process are applied immediately with upsert().
+    """
+
+    def __init__(self, ttl=60, geo_precision=5, radius_km=50, clock=time.monotonic):
+        self.ttl = ttl
+        self.radius_km = radius_km
+        self.clock = clock
+        self.geo_precision = geo_precision
+        self.profiles = {}
+        self.geo = GeoIndex(geo_precision)
+        self.cities = InvertedIndex()
+        self.tokens = InvertedIndex()
+        self.budgets = SortedIndex('budget')
+        self.ages = SortedIndex('age')
+        self.created = SortedIndex('created_at', text_field)
+        self.loaded_at = None
+        self.lock = threading.RLock()
+        self.loads = 0
+        self.nearby_queries = 0
+        self.token_queries = 0
+        self.range_queries = 0
+
+    def is_stale(self):
+        """Whether the snapshot is missing or older than the TTL"""
+        return self.loaded_at is None or self.clock() - self.loaded_at >= self.ttl
+
+    def load(self, profiles):
+        """Replace the snapshot with a full list of profiles (each carrying user_id)"""
+        indexes = (GeoIndex(self.geo_precision), InvertedIndex(), InvertedIndex())
+        snapshot = {}
+        for profile in profiles:
+            user_id = str(profile['user_id'])
+            snapshot[user_id] = profile
+            self._index(indexes, user_id, profile)
+        sorted_indexes = (SortedIndex('budget'), SortedIndex('age'), SortedIndex('created_at', text_field))
+        for index in sorted_indexes:
+            index.build(snapshot.items())
+        with self.lock:
+            self.profiles = snapshot
+            self.geo, self.cities, self.tokens = indexes
+            self.budgets, self.ages, self.created = sorted_indexes
+            self.loaded_at = self.clock()
+            self.loads += 1
+
+    @staticmethod
+    def _index(indexes, user_id, profile):
+        """Add one profile to the geo index (coordinates) or the text indexes"""
+        geo, cities, tokens = indexes
+        coords = profile_coordinates(profile)
+        if coords:
+            geo.add(user_id, *coords)
+            cities.remove(user_id)
+            tokens.remove(user_id)
+        else:
+            geo.remove(user_id)
+            key, city, location_tokens = profile_location_terms(profile)
+            cities.add(user_id, [city])
+            tokens.add(user_id, location_tokens)
+
+    def upsert(self, user_id, profile):
+        """Add or replace one profile"""
+        user_id = str(user_id)
+        profile = dict(profile, user_id=user_id)
+        with self.lock:
+            self.profiles[user_id] = profile
+            self._index((self.geo, self.cities, self.tokens), user_id, profile)
+            self.budgets.add(user_id, profile)
+            self.ages.add(user_id, profile)
+            self.created.add(user_id, profile)
+
+    def remove(self, user_id):
+        """Drop one profile"""
+        user_id = str(user_id)
+        with self.lock:
+            self.profiles.pop(user_id, None)
+            self.geo.remove(user_id)
+            self.cities.remove(user_id)
+            self.tokens.remove(user_id)
+            self.budgets.remove(user_id)
+            self.ages.remove(user_id)
+            self.created.remove(user_id)
+
+    def invalidate(self):
+        """Force a reload on next use, e.g. after a bulk reset"""
+        with self.lock:
+            self.loaded_at = None
+
+    def nearby(self, lat, lng, radius_km):
+        """IDs of profiles within radius_km of a point, nearest first"""
+        with self.lock:
+            distances = self.geo.within(lat, lng, radius_km)
+        return sorted(distances, key=distances.get)
+
+    def sharing_location(self, user_profile):
+        """IDs of profiles whose text location shares the user's city or a location token"""
+        key, city, location_tokens = profile_location_terms(user_profile)
+        with self.lock:
+            return self.cities.lookup([city]) | self.tokens.lookup(location_tokens)
+
+    def location_pool(self, user_profile):
+        """IDs of profiles near the user, None when the location cannot be looked up
+
+        Users with coordinates get the profiles within radius_km from the
+        spatial index, users with a text location the profiles sharing its
+        city or a token.
+        """
+        coords = profile_coordinates(user_profile)
+        if coords:
+            if self.radius_km <= 0:
+                return None
+            self.nearby_queries += 1
+            return self.nearby(*coords, self.radius_km)
+        self.token_queries += 1
+        return self.sharing_location(user_profile)
+
+    def in_scoring_windows(self, user_profile):
+        """IDs of profiles within the budget and age windows that earn points
+
+        Returns None when the user's own budget or age is unusable.
+        """
+        budget = numeric_field(user_profile, 'budget')
+        age = numeric_field(user_profile, 'age')
+        if budget is None or age is None:
+            return None
+        self.range_queries += 1
+        with self.lock:
+            budget_ids = self.budgets.range(budget - BUDGET_WINDOW, budget + BUDGET_WINDOW)
+            age_ids = self.ages.range(age - AGE_WINDOW, age + AGE_WINDOW)
+        # Probe the smaller range against the larger one
+        if len(budget_ids) > len(age_ids):
+            budget_ids, age_ids = age_ids, budget_ids
+        age_ids = set(age_ids)
+        return {user_id for user_id in budget_ids if user_id in age_ids}
+
+    def recent_signups(self, count):
+        """IDs of the count most recently created profiles, newest first"""
+        if count <= 0:
+            return []
+        with self.lock:
+            return self.created.user_ids[-count:][::-1]
+
+    def user_ids(self):
+        """IDs of every indexed profile"""
+        with self.lock:
+            return list(self.profiles)
+
+    def profiles_by_id(self, user_ids):
+        """Indexed profiles for a collection of user IDs"""
+        with self.lock:
+            return [self.profiles[user_id] for user_id in user_ids if user_id in self.profiles]
+
+    def stats(self):
+        """Snapshot of the index counters"""
+        with self.lock:
+            return {
+                'profiles': len(self.profiles),
+                'geo_indexed': len(self.geo),
+                'geo_cells': len(self.geo.cells),
+                'location_cities': len(self.cities),
+                'location_tokens': len(self.tokens),
+                'budget_indexed': len(self.budgets),
+                'age_indexed': len(self.ages),
+                'age_seconds': None if self.loaded_at is None else self.clock() - self.loaded_at,
+                'loads': self.loads,
+                'nearby_queries': self.nearby_queries,
+                'token_queries': self.token_queries,
+                'range_queries': self.range_queries
+            }
+
+# Create instance
+profile_index = ProfileIndex(
+    ttl=float(os.getenv('PROFILE_INDEX_TTL', '60')),
+    geo_precision=int(os.getenv('GEO_INDEX_PRECISION', '5')),
+    radius_km=float(os.getenv('SWIPE_RADIUS_KM', '50'))
+)
@@ -0,0 +1,452 @@
+"""
+Firebase Replica
+In-memory mirror of the profile, swipe and match nodes, kept current by
+Realtime Database streaming listeners
+"""
+
+import sys
+import threading
+import time
+import uuid
+
+# Mirrored nodes and the depth of their records below the node:
+# profiles/{uid}, swipes_by_user/{swiper}/{swiped}, likes_received/{swiped}/{swiper}
+# and matches_by_user/{uid}/{match_id}
+MIRRORED_NODES = {
+    'profiles': 1,
+    'swipes_by_user': 2,
+    'likes_received': 2,
+    'matches_by_user': 2
+}
+
+HEARTBEAT_NODE = 'replica_heartbeats'
+
+class Record:
+    """A mirrored record: its field names are shared by every record with the same fields"""
+    __slots__ = ('shape', 'values')
+
+    def __init__(self, shape, values):
+        self.shape = shape
+        self.values = values
+
+class ShapeTable:
+    """Packs JSON records compactly and unpacks them into fresh dicts and lists
+
+    Each distinct set of field names is stored once and records keep only a
+    tuple of values; lists become tuples and short strings are interned, so
+    repeated values such as actions, cities and user IDs are shared.
+    """
+
+    def __init__(self):
+        self.shapes = {}
+
+    def pack(self, value):
+        if isinstance(value, dict):
+            keys = tuple(sorted(value))
+            shape = self.shapes.get(keys)
+            if shape is None:
+                shape = self.shapes[keys] = tuple(sys.intern(key) for key in keys)
+            return Record(shape, tuple(self.pack(value[key]) for key in keys))
+        if isinstance(value, list):
+            return tuple(self.pack(item) for item in value)
+        if isinstance(value, str) and len(value) <= 32:
+            return sys.intern(value)
+        return value
+
+    @classmethod
+    def unpack(cls, value):
+        if isinstance(value, Record):
+            return {key: cls.unpack(item) for key, item in zip(value.shape, value.values)}
+        if isinstance(value, tuple):
+            return [cls.unpack(item) for item in value]
+        return value
+
+def split_path(path):
+    """Path segments of a listener event or update path"""
+    return [part for part in path.strip('/').split('/') if part]
+
+def listener_alive(registration):
+    """Whether a listen() registration's stream thread is still running"""
+    thread = getattr(registration, '_thread', None)
+    return registration is not None and (thread is None or thread.is_alive())
+
+class Subscription:
+    """Handle returned by FirebaseReplica.subscribe"""
+
+    def __init__(self, replica, node, callback):
+        self.replica = replica
+        self.node = node
+        self.callback = callback
+
+    def close(self):
+        self.replica.unsubscribe(self.node, self.callback)
+
+class FirebaseReplica:
+    """Mirrors the nodes read on the request path and serves reads from memory
+
+    Each node is loaded by its listener's initial snapshot and then patched
+    by the stream's put/patch events. Staleness is bounded with a heartbeat:
+    the replica writes the time under replica_heartbeats/{replica_id} every
+    heartbeat_interval seconds and listens for it, so the newest echo shows
+    how far behind the streams can be. Reads are served only while every
+    node is loaded, every listener is running and that lag is within
+    max_staleness; otherwise callers read from Firebase. A dead listener or
+    a lag past resync_after restarts all listeners from fresh snapshots, as
+    does an event that failed to apply or a node still not loaded
+    resync_after seconds after the last (re)start.
+    """
+
+    def __init__(self, root, nodes=None, max_staleness=5.0, heartbeat_interval=1.0,
+                 resync_after=30.0, clock=time.time):
+        self.root = root
+        self.depths = dict(nodes or MIRRORED_NODES)
+        self.max_staleness = max_staleness
+        self.heartbeat_interval = heartbeat_interval
+        self.resync_after = resync_after
+        self.clock = clock
+        self.replica_id = uuid.uuid4().hex
+        self.shapes = ShapeTable()
+        self.trees = {node: {} for node in self.depths}
+        self.loaded = dict.fromkeys(self.depths, False)
+        self.events = dict.fromkeys(self.depths, 0)
+        self.last_event_at = dict.fromkeys(self.depths)
+        self.listeners = {}
+        self.heartbeat_listener = None
+        self.heartbeat_at = None
+        self.subscribers = {node: [] for node in self.depths}
+        self.lock = threading.RLock()
+        self.stop_event = threading.Event()
+        self.monitor = None
+        self.started_at = None
+        self.resyncs = 0
+        self.errors = 0
+        self.errors_seen = 0
+        self.reads_served = 0
+        self.reads_fallback = 0
+
+    # Lifecycle
+    def start(self):
+        """Open the listeners and start the heartbeat monitor"""
+        self.started_at = self.clock()
+        self.listen()
+        self.stop_event.clear()
+        self.monitor = threading.Thread(target=self.run_monitor, name='firebase-replica', daemon=True)
+        self.monitor.start()
+        print("✅ Firebase replica started")
+
+    def listen(self):
+        for node in self.depths:
+            self.listeners[node] = self.root.child(node).listen(self.event_handler(node))
+        self.heartbeat_listener = self.root.child(HEARTBEAT_NODE).child(self.replica_id).listen(self.on_heartbeat)
+
+    def close_listeners(self):
+        for registration in list(self.listeners.values()) + [self.heartbeat_listener]:
+            if registration is not None:
+                try:
+                    registration.close()
+                except Exception as e:
+                    print(f"Error closing replica listener: {e}")
+        self.listeners = {}
+        self.heartbeat_listener = None
+
+    def stop(self):
+        """Close the listeners and remove this replica's heartbeat"""
+        self.stop_event.set()
+        if self.monitor is not None:
+            self.monitor.join(timeout=5)
+            self.monitor = None
+        self.close_listeners()
+        try:
+            self.root.child(HEARTBEAT_NODE).child(self.replica_id).delete()
+        except Exception as e:
+            print(f"Error removing replica heartbeat: {e}")
+
+    def resync(self):
+        """Restart every listener; reads fall back to Firebase until the snapshots reload"""
+        with self.lock:
+            self.loaded = dict.fromkeys(self.depths, False)
+            self.heartbeat_at = None
+            self.resyncs += 1
+        self.close_listeners()
+        self.listen()
+
+    def run_monitor(self):
+        """Write heartbeats and resync when a listener died, an event failed or the streams fell behind"""
+        while not self.stop_event.is_set():
+            try:
+                self.root.child(HEARTBEAT_NODE).child(self.replica_id).set(self.clock())
+            except Exception as e:
+                print(f"Error writing replica heartbeat: {e}")
+
+            with self.lock:
+                # A failed event leaves its node unloaded and possibly wrong
+                failed_events = self.errors > self.errors_seen
+                self.errors_seen = self.errors
+                unloaded = not all(self.loaded.values())
+            lag = self.staleness()
+            listeners_down = not self.listening()
+            past_grace = self.clock() - self.started_at > self.resync_after
+            if listeners_down or failed_events or (lag is not None and lag > self.resync_after) or (
+                    (lag is None or unloaded) and past_grace):
+                print("❌ Firebase replica fell behind, resyncing")
+                try:
+                    self.resync()
+                    self.started_at = self.clock()
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Error resyncing replica: {e}")
+            self.stop_event.wait(self.heartbeat_interval)
+
+    # Stream events
+    def on_heartbeat(self, event):
+        if isinstance(event.data, (int, float)):
+            with self.lock:
+                self.heartbeat_at = max(self.heartbeat_at or 0, event.data)
+
+    def event_handler(self, node):
+        def handle_event(event):
+            try:
+                self.apply_event(node, event.event_type, event.path, event.data)
+            except Exception as e:
+                # An exception would end the listener thread; the monitor resyncs instead
+                with self.lock:
+                    self.errors += 1
+                    self.loaded[node] = False
+                print(f"Error applying replica event for {node}: {e}")
+        return handle_event
+
+    def apply_event(self, node, event_type, path, data):
+        """Apply one put/patch event from a node's stream"""
+        parts = split_path(path)
+        with self.lock:
+            reloaded = not parts and event_type == 'put'
+            first_load = reloaded and not self.loaded[node] and self.resyncs == 0
+            if event_type == 'patch' and isinstance(data, dict):
+                changed = set()
+                for key, value in data.items():
+                    child = parts + split_path(key)
+                    self.set_path(node, child, value)
+                    if child:
+                        changed.add(child[0])
+            else:
+                self.set_path(node, parts, data)
+                changed = {parts[0]} if parts else None
+            if reloaded:
+                self.loaded[node] = True
+            self.events[node] += 1
+            self.last_event_at[node] = self.clock()
+            subscribers = list(self.subscribers[node])
+
+        if first_load or not subscribers:
+            # The initial snapshot is not a change
+            return
+        for callback in subscribers:
+            if changed is None:
+                callback(None)
+            else:
+                for key in changed:
+                    callback(key)
+
+    def apply_update(self, updates):
+        """Apply a multi-path write locally so the writer reads its own write at once
+
+        The stream delivers the same write shortly after; paths outside the
+        mirrored nodes are ignored.
+        """
+        with self.lock:
+            for path, value in updates.items():
+                parts = split_path(path)
+                if parts and parts[0] in self.depths:
+                    self.set_path(parts[0], parts[1:], value)
+
+    def set_path(self, node, parts, data):
+        """Replace the value at a path below a node (None deletes it)"""
+        depth = self.depths[node]
+        if not parts:
+            self.trees[node] = self.build(data, depth) or {}
+            return
+
+        if len(parts) < depth:
+            value = self.build(data, depth - len(parts))
+        else:
+            parent = self.container(node, parts[:depth - 1])
+            key = parts[depth - 1]
+            rest = parts[depth:]
+            if rest:
+                # A field inside a record: rebuild the record around it
+                record = ShapeTable.unpack(parent.get(key)) if parent is not None else None
+                if not isinstance(record, dict):
+                    record = {}
+                set_nested(record, rest, data)
+                data = record or None
+            value = self.shapes.pack(data) if data is not None else None
+            parts = parts[:depth]
+
+        if value is None:
+            parent = self.container(node, parts[:-1])
+            if parent is not None:
+                parent.pop(parts[-1], None)
+                self.prune(node, parts[:-1])
+        else:
+            self.container(node, parts[:-1], create=True)[sys.intern(parts[-1])] = value
+
+    def build(self, data, levels):
+        """Compact tree for data holding records levels below it, None when empty"""
+        if data is None:
+            return None
+        if levels == 0:
+            return self.shapes.pack(data)
+        if not isinstance(data, dict):
+            return None
+        tree = {}
+        for key, value in data.items():
+            child = self.build(value, levels - 1)
+            if child is not None:
+                tree[sys.intern(key)] = child
+        return tree or None
+
+    def container(self, node, parts, create=False):
+        tree = self.trees[node]
+        for part in parts:
+            child = tree.get(part)
+            if not isinstance(child, dict):
+                if not create:
+                    return None
+                child = tree[sys.intern(part)] = {}
+            tree = child
+        return tree
+
+    def prune(self, node, parts):
+        """Drop containers left empty by a delete, as Firebase does"""
+        while parts:
+            parent = self.container(node, parts[:-1])
+            if parent is None or parent.get(parts[-1]) != {}:
+                return
+            del parent[parts[-1]]
+            parts = parts[:-1]
+
+    # Reads
+    def get(self, node, *keys):
+        """Value at node/keys as fresh dicts and lists, None when absent"""
+        with self.lock:
+            value = self.trees[node]
+            for key in keys:
+                if not isinstance(value, dict):
+                    return None
+                value = value.get(str(key))
+                if value is None:
+                    return None
+            return unpack_tree(value) or None
+
+    def keys(self, node, *keys):
+        """Child keys at node/keys, like a shallow read"""
+        with self.lock:
+            value = self.trees[node]
+            for key in keys:
+                value = value.get(str(key)) if isinstance(value, dict) else None
+            return list(value) if isinstance(value, dict) else []
+
+    def items(self, node):
+        """(key, value) pairs for every child of a node"""
+        with self.lock:
+            return [(key, unpack_tree(value)) for key, value in self.trees[node].items()]
+
+    def subscribe(self, node, callback):
+        """Call callback(key) after each change below node, callback(None) after a reload"""
+        with self.lock:
+            self.subscribers[node].append(callback)
+        return Subscription(self, node, callback)
+
+    def unsubscribe(self, node, callback):
+        with self.lock:
+            if callback in self.subscribers[node]:
+                self.subscribers[node].remove(callback)
+
+    # Health
+    def listening(self):
+        if len(self.listeners) < len(self.depths):
+            return False
+        return all(listener_alive(registration) for registration in self.listeners.values()) and \
+            listener_alive(self.heartbeat_listener)
+
+    def staleness(self):
+        """Seconds since the newest heartbeat seen through the streams, None before the first"""
+        with self.lock:
+            if self.heartbeat_at is None:
+                return None
+            return max(0.0, self.clock() - self.heartbeat_at)
+
+    def is_fresh(self):
+        """Whether reads can be served from memory within the staleness bound"""
+        lag = self.staleness()
+        with self.lock:
+            loaded = all(self.loaded.values())
+        return loaded and lag is not None and lag <= self.max_staleness and self.listening()
+
+    def serving(self):
+        """is_fresh, counted as a served or fallen-back read"""
+        fresh = self.is_fresh()
+        with self.lock:
+            if fresh:
+                self.reads_served += 1
+            else:
+                self.reads_fallback += 1
+        return fresh
+
+    def health(self):
+        """State, staleness and per-node counters"""
+        lag = self.staleness()
+        fresh = self.is_fresh()
+        now = self.clock()
+        with self.lock:
+            if self.monitor is None:
+                state = 'stopped'
+            elif fresh:
+                state = 'fresh'
+            elif not all(self.loaded.values()):
+                state = 'loading'
+            else:
+                state = 'stale'
+            nodes = {}
+            for node, depth in self.depths.items():
+                last_event_at = self.last_event_at[node]
+                nodes[node] = {
+                    'loaded': self.loaded[node],
+                    'listening': listener_alive(self.listeners.get(node)),
+                    'records': count_records(self.trees[node], depth),
+                    'events': self.events[node],
+                    'last_event_age_seconds': None if last_event_at is None else now - last_event_at
+                }
+            return {
+                'state': state,
+                'staleness_seconds': lag,
+                'max_staleness_seconds': self.max_staleness,
+                'nodes': nodes,
+                'shapes': len(self.shapes.shapes),
+                'reads_served': self.reads_served,
+                'reads_fallback': self.reads_fallback,
+                'resyncs': self.resyncs,
+                'errors': self.errors
+            }
+
+def set_nested(record, parts, data):
+    """Set (or with None, delete) a value at a path inside a plain dict"""
+    for part in parts[:-1]:
+        child = record.get(part)
+        if not isinstance(child, dict):
+            child = record[part] = {}
+        record = child
+    if data is None:
+        record.pop(parts[-1], None)
+    else:
+        record[parts[-1]] = data
+
+def unpack_tree(value):
+    if isinstance(value, dict):
+        return {key: unpack_tree(child) for key, child in value.items()}
+    return ShapeTable.unpack(value)
+
+def count_records(tree, depth):
+    if depth <= 1:
+        return len(tree)
+    return sum(count_records(child, depth - 1) for child in tree.values())
@@ -0,0 +1,369 @@
+"""
+Realtime Database Stub
+Local HTTP server emulating the Firebase Realtime Database REST API, for offline testing
+
+Supports GET (shallow, orderBy/equalTo/startAt/endAt/limitToFirst/limitToLast),
+PUT, PATCH (multi-path), POST, DELETE, ETag conditional writes and the
+.indexOn rules from database.rules.json.
+
+Usage:
+    python rtdb_stub.py [--port 9000] [--rules database.rules.json] [--data seed.json]
+    FIREBASE_DATABASE_URL=http://127.0.0.1:9000 STORAGE_BACKEND=firebase_rest python main.py
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from firebase_paths import generate_push_id
+
+class QueryError(Exception):
+    """Raised for a query the real database would reject with 400"""
+
+def split_path(path):
+    """Split a database path into its keys"""
+    return [unquote(part) for part in path.strip('/').split('/') if part]
+
+def normalize(value):
+    """Store values the way the database does: empty objects and nulls vanish"""
+    if isinstance(value, list):
+        value = {str(index): item for index, item in enumerate(value)}
+    if isinstance(value, dict):
+        children = {}
+        for key, child in value.items():
+            child = normalize(child)
+            if child is not None:
+                children[str(key)] = child
+        return children or None
+    return value
+
+def export(value):
+    """Return objects whose keys are 0..n-1 as arrays, as the database does"""
+    if isinstance(value, dict):
+        children = {key: export(child) for key, child in value.items()}
+        if children and all(key.isdigit() for key in children) and len(children) == int(max(children, key=int)) + 1:
+            return [children[str(index)] for index in range(len(children))]
+        return children
+    return value
+
+def sort_value(value):
+    """Ordering key following the database's rules: null, false, true, numbers, strings, objects"""
+    if value is None:
+        return (0, 0)
+    if value is False:
+        return (1, 0)
+    if value is True:
+        return (2, 0)
+    if isinstance(value, (int, float)):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, 0)
+
+def sort_key_name(key):
+    """Ordering key for $key: 32-bit integer keys first, numerically, then strings"""
+    try:
+        number = int(key)
+        if -2 ** 31 <= number < 2 ** 31 and str(number) == key:
+            return (0, number, '')
+    except ValueError:
+        pass
+    return (1, 0, key)
+
+def etag_for(value):
+    """Opaque ETag for the value stored at a path"""
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+class RTDBStub:
+    """In-memory JSON tree served over the Realtime Database REST protocol"""
+
+    def __init__(self, rules=None, data=None):
+        self.rules = (rules or {}).get('rules', {})
+        self.root = normalize(data)
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+        self.request_log = []
+
+    # -- tree ---------------------------------------------------------------
+
+    def get(self, keys):
+        """Value stored at a path, or None"""
+        node = self.root
+        for key in keys:
+            if not isinstance(node, dict):
+                return None
+            node = node.get(key)
+        return node
+
+    def set(self, keys, value):
+        """Replace the value at a path, pruning objects left empty"""
+        value = normalize(value)
+        if not keys:
+            self.root = value
+            return
+
+        parents = []
+        node = self.root if isinstance(self.root, dict) else {}
+        self.root = node
+        for key in keys[:-1]:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                child = {}
+                node[key] = child
+            parents.append((node, key))
+            node = child
+
+        if value is None:
+            node.pop(keys[-1], None)
+        else:
+            node[keys[-1]] = value
+
+        for parent, key in reversed(parents):
+            if parent[key]:
+                break
+            del parent[key]
+        if not self.root:
+            self.root = None
+
+    def update(self, keys, children):
+        """Apply a PATCH: each child key may itself be a multi-segment path"""
+        for path, value in children.items():
+            self.set(keys + split_path(path), value)
+
+    # -- queries ------------------------------------------------------------
+
+    def index_defined(self, keys, order_by):
+        """Whether the rules declare an .indexOn for order_by at this path"""
+        node = self.rules
+        for key in keys:
+            if key in node:
+                node = node[key]
+            else:
+                wildcard = next((name for name in node if name.startswith('$')), None)
+                if wildcard is None:
+                    return False
+                node = node[wildcard]
+        index_on = node.get('.indexOn', [])
+        if isinstance(index_on, str):
+            index_on = [index_on]
+        return order_by in index_on
+
+    def query(self, keys, params):
+        """Evaluate orderBy/equalTo/startAt/endAt/limitToFirst/limitToLast"""
+        node = self.get(keys)
+        filters = ('equalTo', 'startAt', 'endAt', 'limitToFirst', 'limitToLast')
+        if 'orderBy' not in params:
+            if any(name in params for name in filters):
+                raise QueryError("orderBy must be defined when other query parameters are defined")
+            return node
+
+        try:
+            order_by = json.loads(params['orderBy'])
+            bounds = {name: json.loads(params[name]) for name in ('equalTo', 'startAt', 'endAt') if name in params}
+            limit_first = int(params['limitToFirst']) if 'limitToFirst' in params else None
+            limit_last = int(params['limitToLast']) if 'limitToLast' in params else None
+        except ValueError:
+            raise QueryError("Invalid query parameter")
+        if limit_first is not None and limit_last is not None:
+            raise QueryError("Cannot specify both limitToFirst and limitToLast")
+
+        if order_by not in ('$key', '$priority'):
+            index_name = '.value' if order_by == '$value' else order_by
+            if not self.index_defined(keys, index_name):
+                path = '/' + '/'.join(keys)
+                raise QueryError(f"Index not defined, add \".indexOn\": \"{index_name}\", for path \"{path}\", to the rules")
+        if not isinstance(node, dict):
+            return {}
+
+        if order_by == '$key':
+            if any(not isinstance(value, str) for value in bounds.values()):
+                raise QueryError("orderBy $key requires string bounds")
+            rank = sort_key_name
+        else:
+            rank = sort_value
+
+        def order_value(key, child):
+            if order_by == '$key':
+                return key
+            if order_by == '$value':
+                return child
+            if order_by == '$priority':
+                return None
+            value = child
+            for part in split_path(order_by):
+                value = value.get(part) if isinstance(value, dict) else None
+            return value
+
+        # Ties on the ordered value are broken by key
+        ordered = sorted(
+            ((rank(order_value(key, child)), sort_key_name(key), key, child) for key, child in node.items()),
+            key=lambda item: item[:2]
+        )
+        selected = []
+        for own, _, key, child in ordered:
+            if 'equalTo' in bounds and own != rank(bounds['equalTo']):
+                continue
+            if 'startAt' in bounds and own < rank(bounds['startAt']):
+                continue
+            if 'endAt' in bounds and own > rank(bounds['endAt']):
+                continue
+            selected.append((key, child))
+
+        if limit_first is not None:
+            selected = selected[:limit_first]
+        if limit_last is not None:
+            selected = selected[-limit_last:] if limit_last else []
+        return dict(selected)
+
+    # -- server -------------------------------------------------------------
+
+    def start(self, host='127.0.0.1', port=0):
+        """Serve in a background thread; returns the database URL"""
+        self.server = ThreadingHTTPServer((host, port), make_handler(self))
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        """Shut the server down"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+def make_handler(stub):
+    """Request handler class bound to a stub instance"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        quiet = True
+
+        def log_message(self, format, *args):
+            if not self.quiet:
+                super().log_message(format, *args)
+
+        def parse(self):
+            parts = urlsplit(self.path)
+            if not parts.path.endswith('.json'):
+                return None, None
+            params = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+            return split_path(parts.path[:-len('.json')]), params
+
+        def read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b'null')
+
+        def reply(self, status, value, params=None, etag=None):
+            silent = params is not None and params.get('print') == 'silent'
+            body = b'' if silent and status < 400 else json.dumps(export(value)).encode()
+            self.send_response(204 if silent and status < 400 else status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            if etag is not None:
+                self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def handle_write(self, method):
+            keys, params = self.parse()
+            if keys is None:
+                return self.reply(404, {'error': 'Not found'})
+            try:
+                body = self.read_body() if method != 'DELETE' else None
+            except ValueError:
+                return self.reply(400, {'error': 'Invalid data; couldn\'t parse JSON object'})
+
+            with stub.lock:
+                stub.request_log.append((method, '/'.join(keys), params))
+                current = stub.get(keys)
+                expected = self.headers.get('if-match')
+                if expected is not None and expected != etag_for(current):
+                    return self.reply(412, copy.deepcopy(current), etag=etag_for(current))
+
+                if method == 'PUT':
+                    stub.set(keys, body)
+                    result = body
+                elif method == 'PATCH':
+                    if not isinstance(body, dict):
+                        return self.reply(400, {'error': 'Invalid data; couldn\'t parse JSON object'})
+                    stub.update(keys, body)
+                    result = body
+                elif method == 'POST':
+                    name = generate_push_id()
+                    stub.set(keys + [name], body)
+                    result = {'name': name}
+                else:
+                    stub.set(keys, None)
+                    result = None
+                etag = etag_for(stub.get(keys))
+            self.reply(200, result, params, etag=etag)
+
+        def do_GET(self):
+            keys, params = self.parse()
+            if keys is None:
+                return self.reply(404, {'error': 'Not found'})
+            with stub.lock:
+                stub.request_log.append(('GET', '/'.join(keys), params))
+                try:
+                    value = stub.query(keys, params)
+                except QueryError as e:
+                    return self.reply(400, {'error': str(e)})
+                if params.get('shallow') == 'true' and isinstance(value, dict):
+                    value = {key: True for key in value}
+                value = copy.deepcopy(value)
+                etag = etag_for(stub.get(keys)) if self.headers.get('X-Firebase-ETag') == 'true' else None
+            self.reply(200, value, etag=etag)
+
+        def do_PUT(self):
+            self.handle_write('PUT')
+
+        def do_PATCH(self):
+            self.handle_write('PATCH')
+
+        def do_POST(self):
+            self.handle_write('POST')
+
+        def do_DELETE(self):
+            self.handle_write('DELETE')
+
+    return Handler
+
+def load_json(path):
+    """Read a JSON file, or None when no path is given"""
+    if not path:
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local Realtime Database REST stub")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--rules', default='database.rules.json', help="rules file whose .indexOn entries are enforced")
+    parser.add_argument('--data', help="JSON file to seed the database with")
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    args = parser.parse_args()
+
+    stub = RTDBStub(rules=load_json(args.rules), data=load_json(args.data))
+    stub.server = ThreadingHTTPServer((args.host, args.port), make_handler(stub))
+    stub.server.RequestHandlerClass.quiet = not args.verbose
+    print(f"✅ Realtime Database stub listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,63 @@
+"""
+Pair Score Cache
+Bounded cache of compatibility scores keyed by both profiles' version stamps
+"""
+
+import os
+import numpy as np
+from cache import TTLCache
+from swipe_deck import profile_version
+
+class PairScoreCache:
+    """Caches the score of (user, candidate) pairs across deck builds
+
+    Keys include both profiles' version stamps and the jitter seed, so an
+    edit to either profile (or the daily reseed) makes the old entry
+    unreachable; it then ages out of the LRU. Pairs where either profile has
+    no version stamp are always rescored.
+    """
+
+    def __init__(self, maxsize=100000, ttl=86400):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def key(user_profile, match_profile, seed):
+        user_version = profile_version(user_profile)
+        match_version = profile_version(match_profile)
+        if user_version is None or match_version is None:
+            return None
+        return (user_profile.get('user_id'), user_version, match_profile.get('user_id'), match_version, seed)
+
+    def scores(self, user_profile, candidates, seed, compute):
+        """Scores for every candidate, calling compute(profiles) only for the uncached ones"""
+        scores = np.empty(len(candidates), dtype=np.float64)
+        keys = [self.key(user_profile, candidate, seed) for candidate in candidates]
+        missing = []
+        for i, key in enumerate(keys):
+            score = self.cache.get(key) if key is not None else None
+            if score is None:
+                missing.append(i)
+            else:
+                scores[i] = score
+
+        if missing:
+            computed = compute([candidates[i] for i in missing])
+            scores[missing] = computed
+            for i, score in zip(missing, computed):
+                if keys[i] is not None:
+                    self.cache.set(keys[i], float(score))
+        return scores
+
+    def clear(self):
+        """Drop every cached score"""
+        self.cache.clear()
+
+    def stats(self):
+        """Snapshot of the cache counters"""
+        return self.cache.stats()
+
+# Create instance
+pair_scores = PairScoreCache(
+    maxsize=int(os.getenv('PAIR_SCORE_CACHE_SIZE', '100000')),
+    ttl=float(os.getenv('PAIR_SCORE_CACHE_TTL', '86400'))
+)
@@ -0,0 +1,604 @@
+"""
+SQLite Storage Service
+Local, indexed implementation of the storage backend for offline use and benchmarks
+"""
+
+import itertools
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from matching import normalize_profile_fields
+from firebase_paths import build_user_matches, generate_push_id, matched_user_ids, normalize_email, pair_match_id
+from storage_backend import StorageBackend
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    email TEXT NOT NULL UNIQUE,  -- normalized, see normalize_email
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id TEXT PRIMARY KEY,
+    budget INTEGER,
+    age INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_profiles_budget ON profiles (budget);
+CREATE INDEX IF NOT EXISTS idx_profiles_age ON profiles (age);
+
+-- Append-only log of profile writes, tailed by the change feed; a NULL
+-- user_id asks readers to reload everything (e.g. after a bulk load)
+CREATE TABLE IF NOT EXISTS profile_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    changed_at TEXT NOT NULL
+);
+
+-- Full swipe history
+CREATE TABLE IF NOT EXISTS swipes (
+    swipe_id TEXT PRIMARY KEY,
+    swiper_id TEXT NOT NULL,
+    swiped_id TEXT NOT NULL,
+    action TEXT NOT NULL,
+    created_at TEXT
+);
+
+-- Latest action per pair, the equivalent of swipes_by_user and likes_received
+CREATE TABLE IF NOT EXISTS swipe_state (
+    swiper_id TEXT NOT NULL,
+    swiped_id TEXT NOT NULL,
+    action TEXT NOT NULL,
+    created_at TEXT,
+    swipe_id TEXT,
+    PRIMARY KEY (swiper_id, swiped_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS matches (
+    match_id TEXT PRIMARY KEY,
+    user1_id TEXT NOT NULL,
+    user2_id TEXT NOT NULL,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_matches_user1 ON matches (user1_id);
+CREATE INDEX IF NOT EXISTS idx_matches_user2 ON matches (user2_id);
+"""
+
+# Distinguishes the shared-cache in-memory databases of separate instances
+_memory_database_ids = itertools.count()
+
+class ChangeLogWatch:
+    """Background reader of the profile_changes table, see SQLiteService.watch_profiles"""
+
+    TRIM_EVERY = 600
+
+    def __init__(self, service, on_change, interval, batch_size):
+        self.service = service
+        self.on_change = on_change
+        self.interval = interval
+        self.batch_size = batch_size
+        self.seq = service.latest_profile_change()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='sqlite-change-log', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        last_trim = time.monotonic()
+        while not self.stopped.wait(self.interval):
+            try:
+                while not self.stopped.is_set():
+                    changes = self.service.profile_changes_since(self.seq, self.batch_size)
+                    for seq, user_id in changes:
+                        if seq != self.seq + 1:
+                            # Entries were trimmed before this reader saw them
+                            user_id = None
+                        self.on_change(user_id)
+                        self.seq = seq
+                    if len(changes) < self.batch_size:
+                        break
+                if time.monotonic() - last_trim >= self.TRIM_EVERY:
+                    self.service.trim_profile_changes()
+                    last_trim = time.monotonic()
+            except Exception as e:
+                print(f"Error reading profile changes: {e}")
+
+    def close(self):
+        """Stop tailing the change log"""
+        self.stopped.set()
+        self.thread.join(timeout=5)
+
+class SQLiteService(StorageBackend):
+    def __init__(self, database_path='roomiematch.db'):
+        self.database_path = database_path
+        if database_path == ':memory:':
+            # Named shared-cache database so every thread's connection sees the same data
+            self.database_uri = f"file:roomiematch-{next(_memory_database_ids)}?mode=memory&cache=shared"
+        else:
+            self.database_uri = None
+        self.local = threading.local()
+        self.db = None
+        self.initialize_database()
+
+    def initialize_database(self):
+        """Open the database and create the schema"""
+        try:
+            # Also keeps an in-memory database alive for the service's lifetime
+            self.db = self.connection()
+            self.db.executescript(SCHEMA)
+            print(f"✅ SQLite database ready at {self.database_path}")
+        except Exception as e:
+            print(f"❌ SQLite initialization failed: {e}")
+            self.db = None
+
+    def connection(self):
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            if self.database_uri:
+                conn = sqlite3.connect(self.database_uri, uri=True, isolation_level=None)
+            else:
+                conn = sqlite3.connect(self.database_path, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run statements in one write transaction, rolled back on error"""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def is_connected(self):
+        """Check if the database is open"""
+        return self.db is not None
+
+    def bulk_load(self, users):
+        """Insert (user_data, profile_data) pairs in one transaction, returning the new user IDs
+
+        Meant for seeding large local datasets such as benchmark fixtures.
+        """
+        user_ids = []
+        now = datetime.now().isoformat()
+        with self.transaction() as conn:
+            for user_data, profile_data in users:
+                user_id = generate_push_id()
+                conn.execute(
+                    "INSERT INTO users (user_id, username, email, data) VALUES (?, ?, ?, ?)",
+                    (user_id, user_data['username'], normalize_email(user_data['email']), json.dumps(user_data))
+                )
+                profile_data.setdefault('created_at', now)
+                self.write_profile(conn, user_id, normalize_profile_fields(profile_data), log_change=False)
+                user_ids.append(user_id)
+            # One reload marker instead of a change entry per profile
+            self.log_profile_change(conn, None)
+        return user_ids
+
+    # User Management
+    def create_user(self, user_data):
+        """Create a new user, None if the username or email is taken"""
+        if not self.is_connected():
+            return None
+
+        try:
+            user_id = generate_push_id()
+            with self.transaction() as conn:
+                conn.execute(
+                    "INSERT INTO users (user_id, username, email, data) VALUES (?, ?, ?, ?)",
+                    (user_id, user_data['username'], normalize_email(user_data['email']), json.dumps(user_data))
+                )
+            return user_id
+        except sqlite3.IntegrityError:
+            print("User not created, username or email is already taken")
+            return None
+        except Exception as e:
+            print(f"Error creating user: {e}")
+            return None
+
+    def is_identity_taken(self, username, email):
+        """Check whether a username or email is already registered"""
+        if not self.is_connected():
+            return False
+
+        try:
+            row = self.connection().execute(
+                "SELECT 1 FROM users WHERE username = ? UNION ALL SELECT 1 FROM users WHERE email = ? LIMIT 1",
+                (username, normalize_email(email))
+            ).fetchone()
+            return row is not None
+        except Exception as e:
+            print(f"Error checking username and email: {e}")
+            return False
+
+    def get_user(self, user_id):
+        """Get user by ID"""
+        if not self.is_connected():
+            return None
+
+        try:
+            row = self.connection().execute("SELECT data FROM users WHERE user_id = ?", (str(user_id),)).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            print(f"Error getting user: {e}")
+            return None
+
+    def get_user_by_username(self, username):
+        """Get user by username"""
+        if not self.is_connected():
+            return None, None
+
+        try:
+            row = self.connection().execute("SELECT user_id, data FROM users WHERE username = ?", (username,)).fetchone()
+            if row:
+                return row[0], json.loads(row[1])
+            return None, None
+        except Exception as e:
+            print(f"Error getting user by username: {e}")
+            return None, None
+
+    def update_user(self, user_id, user_data):
+        """Update user data"""
+        if not self.is_connected():
+            return False
+
+        try:
+            with self.transaction() as conn:
+                row = conn.execute("SELECT data FROM users WHERE user_id = ?", (str(user_id),)).fetchone()
+                if not row:
+                    return False
+                merged = json.loads(row[0])
+                merged.update(user_data)
+                conn.execute(
+                    "UPDATE users SET username = ?, email = ?, data = ? WHERE user_id = ?",
+                    (merged['username'], normalize_email(merged['email']), json.dumps(merged), str(user_id))
+                )
+            return True
+        except Exception as e:
+            print(f"Error updating user: {e}")
+            return False
+
+    # Profile Management
+    def create_profile(self, user_id, profile_data):
+        """Create user profile"""
+        if not self.is_connected():
+            return False
+
+        try:
+            profile_data['created_at'] = datetime.now().isoformat()
+            normalize_profile_fields(profile_data)
+            with self.transaction() as conn:
+                self.write_profile(conn, str(user_id), profile_data)
+            return True
+        except Exception as e:
+            print(f"Error creating profile: {e}")
+            return False
+
+    def write_profile(self, conn, user_id, profile_data, log_change=True):
+        """Insert or replace a profile row, recording it in the change log"""
+        conn.execute(
+            "INSERT OR REPLACE INTO profiles (user_id, budget, age, data) VALUES (?, ?, ?, ?)",
+            (user_id, profile_data.get('budget'), profile_data.get('age'), json.dumps(profile_data))
+        )
+        if log_change:
+            self.log_profile_change(conn, user_id)
+
+    def log_profile_change(self, conn, user_id):
+        """Append a profile write (or, for None, a reload marker) to the change log"""
+        conn.execute(
+            "INSERT INTO profile_changes (user_id, changed_at) VALUES (?, ?)",
+            (user_id, datetime.now().isoformat())
+        )
+
+    def get_profile(self, user_id):
+        """Get user profile"""
+        if not self.is_connected():
+            return None
+
+        try:
+            row = self.connection().execute("SELECT data FROM profiles WHERE user_id = ?", (str(user_id),)).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            print(f"Error getting profile: {e}")
+            return None
+
+    def get_profiles(self, user_ids):
+        """Get several profiles in one query"""
+        if not self.is_connected():
+            return {}
+
+        try:
+            user_ids = list({str(user_id) for user_id in user_ids})
+            profiles = {}
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(user_ids), 500):
+                chunk = user_ids[i:i + 500]
+                rows = self.connection().execute(
+                    f"SELECT user_id, data FROM profiles WHERE user_id IN ({','.join('?' * len(chunk))})", chunk
+                )
+                profiles.update((user_id, json.loads(data)) for user_id, data in rows)
+            return profiles
+        except Exception as e:
+            print(f"Error getting profiles: {e}")
+            return {}
+
+    def get_all_profiles(self, exclude_user_id=None):
+        """Get all profiles except the specified user"""
+        if not self.is_connected():
+            return []
+
+        try:
+            rows = self.connection().execute(
+                "SELECT user_id, data FROM profiles WHERE user_id IS NOT ?",
+                (str(exclude_user_id) if exclude_user_id else None,)
+            )
+            profile_list = []
+            for user_id, data in rows:
+                profile_data = json.loads(data)
+                profile_data['user_id'] = user_id
+                profile_list.append(profile_data)
+            return profile_list
+        except Exception as e:
+            print(f"Error getting all profiles: {e}")
+            return []
+
+    def update_profile(self, user_id, profile_data):
+        """Update user profile"""
+        if not self.is_connected():
+            return False
+
+        try:
+            profile_data['updated_at'] = datetime.now().isoformat()
+            normalize_profile_fields(profile_data)
+            with self.transaction() as conn:
+                row = conn.execute("SELECT data FROM profiles WHERE user_id = ?", (str(user_id),)).fetchone()
+                merged = json.loads(row[0]) if row else {}
+                merged.update(profile_data)
+                self.write_profile(conn, str(user_id), merged)
+            return True
+        except Exception as e:
+            print(f"Error updating profile: {e}")
+            return False
+
+    # Change Feed
+    def profile_changes_since(self, seq, limit=500):
+        """(seq, user_id) change log entries after seq, oldest first"""
+        return self.connection().execute(
+            "SELECT seq, user_id FROM profile_changes WHERE seq > ? ORDER BY seq LIMIT ?", (seq, limit)
+        ).fetchall()
+
+    def latest_profile_change(self):
+        """Sequence number of the newest change log entry, 0 when empty"""
+        row = self.connection().execute("SELECT MAX(seq) FROM profile_changes").fetchone()
+        return row[0] or 0
+
+    def trim_profile_changes(self, keep=10000):
+        """Delete all but the newest keep change log entries"""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM profile_changes WHERE seq <= (SELECT MAX(seq) FROM profile_changes) - ?", (keep,))
+
+    def watch_profiles(self, on_change, interval=0.5, batch_size=500):
+        """Tail the profile change log from a background thread
+
+        Polling waits for on_change to return, so a slow consumer slows the
+        reader down instead of building an unbounded backlog.
+        """
+        if not self.is_connected():
+            return None
+        return ChangeLogWatch(self, on_change, interval, batch_size)
+
+    # Swipes Management
+    def write_swipe(self, conn, swipe_data):
+        """Append a swipe to the history and make it the pair's latest action"""
+        swipe_id = swipe_data.get('swipe_id') or generate_push_id()
+        conn.execute(
+            "INSERT OR REPLACE INTO swipes (swipe_id, swiper_id, swiped_id, action, created_at) VALUES (?, ?, ?, ?, ?)",
+            (swipe_id, swipe_data['swiper_id'], swipe_data['swiped_id'], swipe_data['action'], swipe_data['created_at'])
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO swipe_state (swiper_id, swiped_id, action, created_at, swipe_id) VALUES (?, ?, ?, ?, ?)",
+            (swipe_data['swiper_id'], swipe_data['swiped_id'], swipe_data['action'], swipe_data['created_at'], swipe_id)
+        )
+
+    def create_swipe(self, swiper_id, swiped_id, action):
+        """Create a swipe record"""
+        if not self.is_connected():
+            return False
+
+        try:
+            swipe_data = {
+                'swiper_id': str(swiper_id),
+                'swiped_id': str(swiped_id),
+                'action': action,
+                'created_at': datetime.now().isoformat()
+            }
+            with self.transaction() as conn:
+                self.write_swipe(conn, swipe_data)
+            return True
+        except Exception as e:
+            print(f"Error creating swipe: {e}")
+            return False
+
+    def record_swipe(self, swiper_id, swiped_id, action):
+        """Record a swipe and, for a returned like, the match in one transaction"""
+        if not self.is_connected():
+            return False, False
+
+        try:
+            swiper_id_str = str(swiper_id)
+            swiped_id_str = str(swiped_id)
+            now = datetime.now().isoformat()
+            swipe_data = {
+                'swiper_id': swiper_id_str,
+                'swiped_id': swiped_id_str,
+                'action': action,
+                'created_at': now
+            }
+            with self.transaction() as conn:
+                self.write_swipe(conn, swipe_data)
+                matched = action == 'like' and conn.execute(
+                    "SELECT 1 FROM swipe_state WHERE swiper_id = ? AND swiped_id = ? AND action = 'like'",
+                    (swiped_id_str, swiper_id_str)
+                ).fetchone() is not None
+                if matched:
+                    self.write_match(conn, swiper_id_str, swiped_id_str, now,
+                                     match_id=pair_match_id(swiper_id_str, swiped_id_str))
+            return True, matched
+        except Exception as e:
+            print(f"Error recording swipe: {e}")
+            return False, False
+
+    def record_swipes(self, swipes):
+        """Record a batch of swipes and the matches they complete in one transaction
+
+        Swipes are keyed by their ID and matches by the user pair, so a
+        replayed batch rewrites the same rows.
+        """
+        if not self.is_connected():
+            return None
+
+        try:
+            matched = []
+            last_index = {(str(swipe['swiper_id']), str(swipe['swiped_id'])): i for i, swipe in enumerate(swipes)}
+            with self.transaction() as conn:
+                for i, swipe in enumerate(swipes):
+                    swipe_data = {
+                        'swipe_id': swipe['swipe_id'],
+                        'swiper_id': str(swipe['swiper_id']),
+                        'swiped_id': str(swipe['swiped_id']),
+                        'action': swipe['action'],
+                        'created_at': swipe['created_at']
+                    }
+                    self.write_swipe(conn, swipe_data)
+                    # As in batch_swipe_paths, a like returned later in the batch settles the match
+                    later = last_index.get((swipe_data['swiped_id'], swipe_data['swiper_id']), -1)
+                    returned_later = later > i and swipes[later]['action'] == 'like'
+                    is_match = swipe_data['action'] == 'like' and not returned_later and conn.execute(
+                        "SELECT 1 FROM swipe_state WHERE swiper_id = ? AND swiped_id = ? AND action = 'like'",
+                        (swipe_data['swiped_id'], swipe_data['swiper_id'])
+                    ).fetchone() is not None
+                    if is_match:
+                        self.write_match(conn, swipe_data['swiper_id'], swipe_data['swiped_id'],
+                                         swipe_data['created_at'],
+                                         match_id=pair_match_id(swipe_data['swiper_id'], swipe_data['swiped_id']))
+                    matched.append(is_match)
+            return matched
+        except Exception as e:
+            print(f"Error recording swipes: {e}")
+            return None
+
+    def get_user_swipes(self, user_id):
+        """Get all swipes made by a user"""
+        if not self.is_connected():
+            return []
+
+        try:
+            rows = self.connection().execute(
+                "SELECT swiper_id, swiped_id, action, created_at FROM swipe_state WHERE swiper_id = ?", (str(user_id),)
+            )
+            return [
+                {'swiper_id': swiper_id, 'swiped_id': swiped_id, 'action': action, 'created_at': created_at}
+                for swiper_id, swiped_id, action, created_at in rows
+            ]
+        except Exception as e:
+            print(f"Error getting user swipes: {e}")
+            return []
+
+    def get_swiped_users(self, user_id):
+        """Get list of user IDs that the user has swiped on"""
+        if not self.is_connected():
+            return []
+
+        try:
+            rows = self.connection().execute("SELECT swiped_id FROM swipe_state WHERE swiper_id = ?", (str(user_id),))
+            return [swiped_id for (swiped_id,) in rows]
+        except Exception as e:
+            print(f"Error getting swiped users: {e}")
+            return []
+
+    def check_mutual_like(self, user1_id, user2_id):
+        """Check if two users have liked each other"""
+        if not self.is_connected():
+            return False
+
+        try:
+            row = self.connection().execute(
+                "SELECT COUNT(*) FROM swipe_state WHERE action = 'like' AND "
+                "((swiper_id = ? AND swiped_id = ?) OR (swiper_id = ? AND swiped_id = ?))",
+                (str(user1_id), str(user2_id), str(user2_id), str(user1_id))
+            ).fetchone()
+            return row[0] == 2
+        except Exception as e:
+            print(f"Error checking mutual like: {e}")
+            return False
+
+    def has_liked(self, liker_id, liked_id):
+        """Check if one user's latest swipe on another is a like"""
+        if not self.is_connected():
+            return False
+
+        try:
+            return self.connection().execute(
+                "SELECT 1 FROM swipe_state WHERE swiper_id = ? AND swiped_id = ? AND action = 'like'",
+                (str(liker_id), str(liked_id))
+            ).fetchone() is not None
+        except Exception as e:
+            print(f"Error checking like: {e}")
+            return False
+
+    # Matches Management
+    def write_match(self, conn, user1_id, user2_id, created_at, match_id=None):
+        """Insert or rewrite a match row, keyed by the user pair unless match_id is given"""
+        conn.execute(
+            "INSERT OR REPLACE INTO matches (match_id, user1_id, user2_id, created_at) VALUES (?, ?, ?, ?)",
+            (match_id or pair_match_id(user1_id, user2_id), user1_id, user2_id, created_at)
+        )
+
+    def create_match(self, user1_id, user2_id):
+        """Create a match between two users"""
+        if not self.is_connected():
+            return False
+
+        try:
+            with self.transaction() as conn:
+                self.write_match(conn, str(user1_id), str(user2_id), datetime.now().isoformat())
+            return True
+        except Exception as e:
+            print(f"Error creating match: {e}")
+            return False
+
+    def get_user_matches(self, user_id):
+        """Get all matches for a user"""
+        if not self.is_connected():
+            return []
+
+        try:
+            user_id_str = str(user_id)
+            rows = self.connection().execute(
+                "SELECT match_id, user1_id, user2_id, created_at FROM matches WHERE user1_id = ? "
+                "UNION ALL "
+                "SELECT match_id, user1_id, user2_id, created_at FROM matches WHERE user2_id = ? AND user1_id != ?",
+                (user_id_str, user_id_str, user_id_str)
+            )
+            matches = {
+                match_id: {'user1_id': user1_id, 'user2_id': user2_id, 'created_at': created_at}
+                for match_id, user1_id, user2_id, created_at in rows
+            }
+            if not matches:
+                return []
+
+            profiles = self.get_profiles(matched_user_ids(matches))
+            return build_user_matches(matches, profiles)
+        except Exception as e:
+            print(f"Error getting user matches: {e}")
+            return []
@@ -0,0 +1,16 @@
+"""
+Stats
+Percentiles over the rolling timing windows reported at /metrics
+"""
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers, None when it is empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+def percentile_ms(seconds, fraction):
+    """percentile of durations in seconds, in milliseconds"""
+    value = percentile(seconds, fraction)
+    return None if value is None else value * 1000
@@ -0,0 +1,286 @@
+"""
+Storage Backend
+Common interface for the Firebase, Firebase REST and SQLite storage services
+"""
+
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+class StorageBackend(ABC):
+    """Users, profiles, swipes and matches storage used by the app"""
+
+    @abstractmethod
+    def is_connected(self):
+        """Check if the backend is reachable"""
+
+    def cache_stats(self):
+        """Hit/miss/eviction counters for the backend's caches"""
+        return {}
+
+    def pool_stats(self):
+        """Connection pool counters for network backends"""
+        return {}
+
+    def replica_stats(self):
+        """Health of an in-memory read replica, None when the backend has none"""
+        return None
+
+    # User Management
+    @abstractmethod
+    def create_user(self, user_data):
+        """Create a user with a unique username and email, returning its ID or None"""
+
+    @abstractmethod
+    def is_identity_taken(self, username, email):
+        """Check whether a username or email is already registered"""
+
+    @abstractmethod
+    def get_user(self, user_id):
+        """Get user by ID"""
+
+    @abstractmethod
+    def get_user_by_username(self, username):
+        """Get (user_id, user_data) by username, or (None, None)"""
+
+    @abstractmethod
+    def update_user(self, user_id, user_data):
+        """Update user data"""
+
+    # Profile Management
+    @abstractmethod
+    def create_profile(self, user_id, profile_data):
+        """Create or replace a user's profile"""
+
+    @abstractmethod
+    def get_profile(self, user_id):
+        """Get user profile"""
+
+    def get_profiles(self, user_ids):
+        """Get several profiles at once as a dict of user ID to profile"""
+        profiles = {}
+        for user_id in {str(user_id) for user_id in user_ids}:
+            profile = self.get_profile(user_id)
+            if profile:
+                profiles[user_id] = profile
+        return profiles
+
+    @abstractmethod
+    def get_all_profiles(self, exclude_user_id=None):
+        """Get all profiles except the specified user"""
+
+    @abstractmethod
+    def update_profile(self, user_id, profile_data):
+        """Update user profile"""
+
+    # Swipes Management
+    @abstractmethod
+    def create_swipe(self, swiper_id, swiped_id, action):
+        """Create a swipe record"""
+
+    @abstractmethod
+    def record_swipe(self, swiper_id, swiped_id, action):
+        """Record a swipe and any resulting match, returning (success, matched)"""
+
+    def record_swipes(self, swipes):
+        """Record a batch of swipes, each with its own swipe_id and created_at
+
+        Returns one matched flag per swipe, or None when nothing was written.
+        Replaying a batch must not duplicate records. This default records
+        them one at a time; backends override it with a single write.
+        """
+        matched = []
+        for swipe in swipes:
+            success, is_match = self.record_swipe(swipe['swiper_id'], swipe['swiped_id'], swipe['action'])
+            if not success:
+                return None
+            matched.append(is_match)
+        return matched
+
+    @abstractmethod
+    def get_user_swipes(self, user_id):
+        """Get the latest swipe a user made on each other user"""
+
+    @abstractmethod
+    def get_swiped_users(self, user_id):
+        """Get list of user IDs that the user has swiped on"""
+
+    @abstractmethod
+    def check_mutual_like(self, user1_id, user2_id):
+        """Check if two users have liked each other"""
+
+    def has_liked(self, liker_id, liked_id):
+        """Check if one user's latest swipe on another is a like"""
+        return any(
+            swipe.get('swiped_id') == str(liked_id) and swipe.get('action') == 'like'
+            for swipe in self.get_user_swipes(liker_id)
+        )
+
+    # Matches Management
+    @abstractmethod
+    def create_match(self, user1_id, user2_id):
+        """Create a match between two users"""
+
+    @abstractmethod
+    def get_user_matches(self, user_id):
+        """Get all matches for a user, joined with both users' profiles"""
+
+    # Change Feed
+    def watch_profiles(self, on_change):
+        """Subscribe to profile writes from any process
+
+        on_change(user_id) is called for each written or deleted profile, and
+        on_change(None) when changes were missed and everything must be
+        reloaded. Returns a handle with close(), or None when the backend has
+        no change feed.
+        """
+        return None
+
+    # Sample Data
+    def add_sample_data(self):
+        """Add sample users and profiles"""
+        if not self.is_connected():
+            return False
+        
+        try:
+            # Sample users
+            sample_users = [
+                {
+                    'username': 'alex_smith',
+                    'email': 'alex@example.com',
+                    'password_hash': 'pbkdf2:sha256:260000$...',  # You'll need to generate real hashes
+                    'created_at': datetime.now().isoformat()
+                },
+                {
+                    'username': 'maya_johnson',
+                    'email': 'maya@example.com',
+                    'password_hash': 'pbkdf2:sha256:260000$...',
+                    'created_at': datetime.now().isoformat()
+                },
+                {
+                    'username': 'sam_wilson',
+                    'email': 'sam@example.com',
+                    'password_hash': 'pbkdf2:sha256:260000$...',
+                    'created_at': datetime.now().isoformat()
+                },
+                {
+                    'username': 'jessica_brown',
+                    'email': 'jessica@example.com',
+                    'password_hash': 'pbkdf2:sha256:260000$...',
+                    'created_at': datetime.now().isoformat()
+                },
+                {
+                    'username': 'mike_davis',
+                    'email': 'mike@example.com',
+                    'password_hash': 'pbkdf2:sha256:260000$...',
+                    'created_at': datetime.now().isoformat()
+                },
+                {
+                    'username': 'sarah_miller',
+                    'email': 'sarah@example.com',
+                    'password_hash': 'pbkdf2:sha256:260000$...',
+                    'created_at': datetime.now().isoformat()
+                }
+            ]
+            
+            # Add users
+            for user_data in sample_users:
+                user_id = self.create_user(user_data)
+                if user_id:
+                    print(f"Created user: {user_data['username']} with ID: {user_id}")
+            
+            # Sample profiles
+            sample_profiles = [
+                {
+                    'user_id': 'alex_smith',
+                    'name': 'Alex Smith',
+                    'age': 22,
+                    'budget': 600,
+                    'location': 'Downtown',
+                    'bio': 'Love music, gaming, and cooking!',
+                    'interests': '["Music", "Gaming", "Cooking", "Movies"]',
+                    'lifestyle_preferences': '["Night Owl", "Very Social", "Moderately Clean", "Love Pets"]',
+                    'created_at': datetime.now().isoformat()
+                },
+                {
+                    'user_id': 'maya_johnson',
+                    'name': 'Maya Johnson',
+                    'age': 25,
+                    'budget': 750,
+                    'location': 'Midtown',
+                    'bio': 'Fitness enthusiast and nature lover.',
+                    'interests': '["Fitness", "Nature", "Reading", "Photography"]',
+                    'lifestyle_preferences': '["Early Bird", "Quiet", "Very Clean", "Neutral"]',
+                    'created_at': datetime.now().isoformat()
+                },
+                {
+                    'user_id': 'sam_wilson',
+                    'name': 'Sam Wilson',
+                    'age': 23,
+                    'budget': 650,
+                    'location': 'Uptown',
+                    'bio': 'Artist and photographer.',
+                    'interests': '["Art", "Photography", "Travel", "Cooking"]',
+                    'lifestyle_preferences': '["Flexible", "Moderately Social", "Moderately Clean", "Love Pets"]',
+                    'created_at': datetime.now().isoformat()
+                },
+                {
+                    'user_id': 'jessica_brown',
+                    'name': 'Jessica Brown',
+                    'age': 24,
+                    'budget': 700,
+                    'location': 'Downtown',
+                    'bio': 'Tech professional who loves coding.',
+                    'interests': '["Technology", "Gaming", "Movies", "Music"]',
+                    'lifestyle_preferences': '["Night Owl", "Moderately Social", "Moderately Clean", "Neutral"]',
+                    'created_at': datetime.now().isoformat()
+                },
+                {
+                    'user_id': 'mike_davis',
+                    'name': 'Mike Davis',
+                    'age': 26,
+                    'budget': 800,
+                    'location': 'Midtown',
+                    'bio': 'Sports fanatic and outdoor enthusiast.',
+                    'interests': '["Sports", "Fitness", "Nature", "Travel"]',
+                    'lifestyle_preferences': '["Early Bird", "Very Social", "Very Clean", "No Pets"]',
+                    'created_at': datetime.now().isoformat()
+                },
+                {
+                    'user_id': 'sarah_miller',
+                    'name': 'Sarah Miller',
+                    'age': 21,
+                    'budget': 550,
+                    'location': 'Uptown',
+                    'bio': 'Student studying art history.',
+                    'interests': '["Art", "Reading", "Movies", "Nature"]',
+                    'lifestyle_preferences': '["Flexible", "Quiet", "Very Clean", "Neutral"]',
+                    'created_at': datetime.now().isoformat()
+                }
+            ]
+            
+            # Add profiles
+            for profile_data in sample_profiles:
+                if self.create_profile(profile_data['user_id'], profile_data):
+                    print(f"Created profile for: {profile_data['name']}")
+            
+            print("✅ Sample data added successfully")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Error adding sample data: {e}")
+            return False
+
+def get_storage_backend(name=None):
+    """Get the storage backend selected by STORAGE_BACKEND (firebase, firebase_rest or sqlite)"""
+    name = name or os.getenv('STORAGE_BACKEND', 'firebase')
+    if name == 'firebase':
+        from firebase_config import firebase_service
+        return firebase_service
+    if name == 'firebase_rest':
+        from firebase_rest_service import firebase_rest_service
+        return firebase_rest_service
+    if name == 'sqlite':
+        from sqlite_service import SQLiteService
+        return SQLiteService(os.getenv('SQLITE_DATABASE_PATH', 'roomiematch.db'))
+    raise ValueError(f"Unknown storage backend: {name}")
@@ -0,0 +1,174 @@
+"""
+Swipe Deck
+Per-user ranked decks of candidate profiles, consumed one card at a time
+"""
+
+import os
+import threading
+from collections import deque
+
+def profile_version(profile):
+    """Version stamp of a profile, changes whenever the profile is written"""
+    return profile.get('updated_at') or profile.get('created_at')
+
+class SwipeDeck:
+    """A ranked queue of (score, profile) cards for one user"""
+
+    def __init__(self, version, cards, complete, owner_profile=None):
+        self.version = version
+        # The profile the deck was ranked for, used to rescore single cards
+        self.owner_profile = owner_profile
+        # complete means the deck held every remaining candidate when built
+        self.complete = complete
+        self.cards = deque(cards)
+        self.user_ids = {profile['user_id'] for score, profile in cards}
+
+    def __len__(self):
+        return len(self.cards)
+
+    def peek(self):
+        """Get the best remaining card's profile without consuming it"""
+        return self.cards[0][1] if self.cards else None
+
+    def discard(self, user_id):
+        """Remove a candidate from the deck, O(1) when it is the front card"""
+        if user_id not in self.user_ids:
+            return
+        self.user_ids.discard(user_id)
+        if self.cards and self.cards[0][1]['user_id'] == user_id:
+            self.cards.popleft()
+        else:
+            self.cards = deque(card for card in self.cards if card[1]['user_id'] != user_id)
+
+    def replace(self, user_id, score, profile):
+        """Re-rank a candidate already in the deck with a new score and profile"""
+        if user_id not in self.user_ids:
+            return False
+        cards = [card for card in self.cards if card[1]['user_id'] != user_id]
+        position = next((i for i, card in enumerate(cards) if card[0] < score), len(cards))
+        cards.insert(position, (score, profile))
+        self.cards = deque(cards)
+        return True
+
+class SwipeDeckStore:
+    """In-process store of swipe decks, rebuilt lazily when low or stale
+
+    Decks are local to the worker process; a rebuild always starts from the
+    stored swipe history, so cards swiped elsewhere drop out on the next fill.
+    """
+
+    def __init__(self, size=50, refill_at=5):
+        self.size = size
+        self.refill_at = refill_at
+        self.decks = {}
+        # Candidate ID to the IDs of the users whose decks hold that candidate
+        self.holders = {}
+        self.lock = threading.Lock()
+        self.rescored_cards = 0
+
+    def needs_refill(self, user_id, user_profile=None):
+        """Check whether a user's deck is missing, running low, or built for an old profile
+
+        Without user_profile only the deck itself is checked, which lets
+        callers decide whether to fetch candidates before the profile arrives.
+        """
+        with self.lock:
+            deck = self.decks.get(str(user_id))
+            if deck is None:
+                return True
+            if user_profile is not None and deck.version != profile_version(user_profile):
+                return True
+            if deck.complete:
+                return len(deck) == 0
+            return len(deck) < self.refill_at
+
+    def fill(self, user_id, user_profile, cards):
+        """Replace a user's deck with freshly ranked (score, profile) cards"""
+        user_id = str(user_id)
+        deck = SwipeDeck(profile_version(user_profile), cards, len(cards) < self.size,
+                         dict(user_profile, user_id=user_id))
+        with self.lock:
+            self._drop(user_id)
+            self.decks[user_id] = deck
+            for candidate_id in deck.user_ids:
+                self.holders.setdefault(candidate_id, set()).add(user_id)
+
+    def _drop(self, user_id):
+        """Remove a user's deck and its holder entries; the lock must be held"""
+        deck = self.decks.pop(user_id, None)
+        if deck is None:
+            return
+        for candidate_id in deck.user_ids:
+            self._release(candidate_id, user_id)
+
+    def _release(self, candidate_id, user_id):
+        holders = self.holders.get(candidate_id)
+        if holders is not None:
+            holders.discard(user_id)
+            if not holders:
+                del self.holders[candidate_id]
+
+    def peek(self, user_id):
+        """Get the profile at the front of a user's deck, or None if it is empty"""
+        with self.lock:
+            deck = self.decks.get(str(user_id))
+            return deck.peek() if deck else None
+
+    def discard(self, user_id, swiped_id):
+        """Consume a swiped card from a user's deck"""
+        with self.lock:
+            deck = self.decks.get(str(user_id))
+            if deck:
+                deck.discard(str(swiped_id))
+                self._release(str(swiped_id), str(user_id))
+
+    def invalidate(self, user_id):
+        """Drop a user's deck so the next request rebuilds it"""
+        with self.lock:
+            self._drop(str(user_id))
+
+    def clear(self):
+        """Drop every deck, e.g. after a full resync"""
+        with self.lock:
+            self.decks.clear()
+            self.holders.clear()
+
+    def rescore(self, candidate_id, candidate_profile, score):
+        """Re-rank one candidate in every deck that holds it
+
+        score(owner_profile, candidate_profile) computes the new pair score;
+        a candidate_profile of None (profile deleted) removes the card.
+        Returns the number of decks patched.
+        """
+        candidate_id = str(candidate_id)
+        with self.lock:
+            owners = [(owner_id, self.decks[owner_id]) for owner_id in self.holders.get(candidate_id, ())]
+
+        patched = 0
+        for owner_id, deck in owners:
+            if candidate_profile is None:
+                self.discard(owner_id, candidate_id)
+                patched += 1
+                continue
+            # Score outside the lock, the deck is only touched under it
+            new_score = score(deck.owner_profile, candidate_profile)
+            with self.lock:
+                if self.decks.get(owner_id) is deck and deck.replace(candidate_id, new_score, candidate_profile):
+                    patched += 1
+        with self.lock:
+            self.rescored_cards += patched
+        return patched
+
+    def stats(self):
+        """Deck counters"""
+        with self.lock:
+            return {
+                'decks': len(self.decks),
+                'cards': sum(len(deck) for deck in self.decks.values()),
+                'rescored_cards': self.rescored_cards
+            }
+
+swipe_decks = SwipeDeckStore(
+    size=int(os.getenv('SWIPE_DECK_SIZE', '50')),
+    refill_at=int(os.getenv('SWIPE_DECK_REFILL_AT', '5'))
+)
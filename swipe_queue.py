@@ -0,0 +1,428 @@
+"""
+Swipe Write-Behind Queue
+Acknowledges swipes once they are in a local write-ahead log and flushes them
+to the storage backend in batches
+"""
+
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from stats import percentile_ms
+from firebase_paths import generate_push_id
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks (Windows): logs of other processes are never adopted
+    fcntl = None
+
+# Fields of a queued swipe that are written to the log
+LOGGED_FIELDS = ('seq', 'swipe_id', 'swiper_id', 'swiped_id', 'action', 'created_at')
+
+class SwipeLog:
+    """Append-only JSON-lines write-ahead log of queued swipes
+
+    Each swipe line carries a sequence number; a {"flushed": seq} line marks
+    every swipe up to seq as written to the backend. Once nothing is pending
+    the file is truncated, and under constant load it is rewritten with just
+    the unflushed tail every compact_after lines. Its owner holds an
+    exclusive lock on path + '.lock' while the log is open, so other
+    processes can tell a live log from one left by a crash.
+    """
+
+    def __init__(self, path, fsync=False, compact_after=100000):
+        self.path = path
+        self.fsync = fsync
+        self.compact_after = compact_after
+        self.lock = threading.Lock()
+        self.file = None
+        self.lock_file = None
+        self.lines = 0
+
+    @staticmethod
+    def siblings(base_path):
+        """Every per-process log for a base path, plus a log at the base path itself"""
+        paths = [
+            path for path in glob.glob(glob.escape(base_path) + '.*')
+            if not path.endswith(('.lock', '.tmp'))
+        ]
+        if os.path.exists(base_path):
+            paths.append(base_path)
+        return sorted(paths)
+
+    def acquire(self):
+        """Take the log's lock; False when another live process holds it"""
+        if fcntl is None:
+            return True
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self.lock_file = open(self.path + '.lock', 'a')
+        try:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.lock_file.close()
+            self.lock_file = None
+            return False
+        return True
+
+    def release(self):
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def remove(self):
+        """Delete the log and its lock file, then drop the lock"""
+        self.close()
+        for path in (self.path, self.path + '.lock'):
+            if os.path.exists(path):
+                os.remove(path)
+        self.release()
+
+    def replay(self):
+        """Swipes logged but not marked flushed, in order, and the highest sequence number in the log
+
+        The highest sequence number counts flushed markers too, so numbering
+        resumes above every swipe the log has seen. A torn last line is skipped.
+        """
+        if not os.path.exists(self.path):
+            return [], 0
+        swipes = []
+        flushed = 0
+        last_seq = 0
+        with open(self.path, encoding='utf-8') as log:
+            for line in log:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'flushed' in record:
+                    flushed = max(flushed, record['flushed'])
+                    last_seq = max(last_seq, record['flushed'])
+                else:
+                    swipes.append(record)
+                    last_seq = max(last_seq, record['seq'])
+        return [swipe for swipe in swipes if swipe['seq'] > flushed], last_seq
+
+    def open(self):
+        if not self.acquire():
+            raise RuntimeError(f"Swipe log {self.path} is already open in another process")
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.lines += 1
+
+    def append(self, swipe):
+        self.write({key: swipe[key] for key in LOGGED_FIELDS})
+
+    def mark_flushed(self, seq):
+        self.write({'flushed': seq})
+
+    def truncate(self):
+        """Drop the log once every swipe in it has been flushed"""
+        with self.lock:
+            self.file.truncate(0)
+            self.file.flush()
+            self.lines = 0
+
+    def rewrite(self, swipes):
+        """Replace the log with only the given (still unflushed) swipes"""
+        with self.lock:
+            temporary = self.path + '.tmp'
+            with open(temporary, 'w', encoding='utf-8') as log:
+                for swipe in swipes:
+                    log.write(json.dumps({key: swipe[key] for key in LOGGED_FIELDS}, separators=(',', ':')) + '\n')
+                log.flush()
+                os.fsync(log.fileno())
+            self.file.close()
+            os.replace(temporary, self.path)
+            self.file = open(self.path, 'a', encoding='utf-8')
+            self.lines = len(swipes)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+class SwipeWriteBehind:
+    """Write-behind recording of swipes
+
+    record_swipe appends the swipe to the write-ahead log and returns at
+    once; a background flusher drains the queue with the backend's batched
+    record_swipes (one multi-path update for Firebase) every flush_interval
+    seconds or as soon as batch_size swipes are waiting. A like whose target
+    already liked the swiper (or has such a like queued) would complete a
+    match, so it is flushed immediately and the caller waits for the match
+    result, up to match_timeout seconds. Each process logs to its own file,
+    wal_path plus its PID, so no process truncates or replaces another's
+    log. On start, swipes never flushed from this path's logs whose owners
+    are gone (no lock held) are adopted and replayed. When disabled, swipes
+    are recorded synchronously as before.
+    """
+
+    def __init__(self, storage, wal_path='swipes.wal', enabled=True, batch_size=200,
+                 flush_interval=0.2, max_pending=10000, match_timeout=2.0, retry_interval=1.0,
+                 fsync=False, clock=time.monotonic):
+        self.storage = storage
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.match_timeout = match_timeout
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self.wal_path = wal_path
+        self.log = SwipeLog(f"{wal_path}.{os.getpid()}", fsync=fsync)
+        self.pending = deque()
+        self.results = {}
+        self.urgent = set()
+        self.seq = 0
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        self.running = False
+        self.batch_sizes = deque(maxlen=1024)
+        self.flush_times = deque(maxlen=1024)
+        self.queued = 0
+        self.replayed = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.coalesced = 0
+        self.urgent_flushes = 0
+        self.matches = 0
+        self.failures = 0
+        self.backpressure = 0
+
+    def start(self):
+        """Adopt unflushed swipes from logs whose process is gone and start the flusher"""
+        if not self.enabled or self.running:
+            return
+        self.log.open()
+        replayed, last_seq = self.log.replay()
+        adopted = []
+        for path in SwipeLog.siblings(self.wal_path):
+            if path == self.log.path or (fcntl is None and path != self.wal_path):
+                continue
+            orphan = SwipeLog(path)
+            if not orphan.acquire():
+                # Its process is still running and flushing it
+                continue
+            swipes, _ = orphan.replay()
+            replayed.extend(swipes)
+            adopted.append(orphan)
+        # Renumber into this process's log before the adopted files go away
+        for seq, swipe in enumerate(replayed, start=1):
+            swipe['seq'] = seq
+        self.log.rewrite(replayed)
+        for orphan in adopted:
+            orphan.remove()
+        with self.condition:
+            for swipe in replayed:
+                # Replayed swipes are due at once
+                swipe['queued_at'] = float('-inf')
+                self.pending.append(swipe)
+            self.seq = len(replayed)
+            self.replayed = len(replayed)
+            self.running = True
+        self.thread = threading.Thread(target=self.run, name='swipe-write-behind', daemon=True)
+        self.thread.start()
+        if replayed:
+            print(f"✅ Replaying {len(replayed)} unflushed swipes from {self.log.path}")
+
+    def stop(self):
+        """Flush what is queued and stop the flusher"""
+        if not self.running:
+            return
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=10)
+            self.thread = None
+        while self.pending and self.flush():
+            pass
+        if self.pending:
+            # Left for the next process on this path to adopt
+            self.log.close()
+            self.log.release()
+        else:
+            self.log.remove()
+
+    def record_swipe(self, swiper_id, swiped_id, action):
+        """Record a swipe, returning (success, matched) like StorageBackend.record_swipe"""
+        if not self.running:
+            return self.storage.record_swipe(swiper_id, swiped_id, action)
+
+        swipe = {
+            'swipe_id': generate_push_id(),
+            'swiper_id': str(swiper_id),
+            'swiped_id': str(swiped_id),
+            'action': action,
+            'created_at': datetime.now().isoformat()
+        }
+        urgent = action == 'like' and self.might_match(swipe['swiper_id'], swipe['swiped_id'])
+
+        with self.condition:
+            if len(self.pending) >= self.max_pending:
+                # The backend is not keeping up: wait for the flusher to make room
+                self.backpressure += 1
+                deadline = self.clock() + self.match_timeout
+                while len(self.pending) >= self.max_pending and self.running:
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if len(self.pending) >= self.max_pending:
+                    return False, False
+            self.seq += 1
+            swipe['seq'] = self.seq
+            self.log.append(swipe)
+            swipe['queued_at'] = self.clock()
+            self.pending.append(swipe)
+            self.queued += 1
+            if urgent:
+                self.urgent.add(swipe['seq'])
+                self.results[swipe['seq']] = None
+            self.condition.notify_all()
+
+            if not urgent:
+                return True, False
+
+            # Wait for the flush that settles the match
+            deadline = self.clock() + self.match_timeout
+            while self.results.get(swipe['seq']) is None and self.running:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            matched = self.results.pop(swipe['seq'], None)
+        # Still queued after the timeout: the flusher records the match later
+        return True, bool(matched)
+
+    def might_match(self, swiper_id, swiped_id):
+        """Whether a like from swiper to swiped could complete a match"""
+        with self.condition:
+            for queued in reversed(self.pending):
+                if queued['swiper_id'] == swiped_id and queued['swiped_id'] == swiper_id:
+                    return queued['action'] == 'like'
+        return self.storage.has_liked(swiped_id, swiper_id)
+
+    def pending_swiped(self, user_id):
+        """IDs the user swiped on whose swipes are still queued"""
+        user_id = str(user_id)
+        with self.condition:
+            return {swipe['swiped_id'] for swipe in self.pending if swipe['swiper_id'] == user_id}
+
+    def run(self):
+        """Flusher loop: flush when a batch is full, the oldest swipe is due, or a match is waiting"""
+        while True:
+            with self.condition:
+                while self.running and not self.due():
+                    self.condition.wait(self.flush_interval)
+                if not self.running:
+                    return
+            if not self.flush():
+                # Backend unavailable: keep the queue and retry later
+                time.sleep(self.retry_interval)
+
+    def due(self):
+        return bool(self.pending) and (
+            self.urgent or len(self.pending) >= self.batch_size or
+            self.clock() - self.pending[0]['queued_at'] >= self.flush_interval
+        )
+
+    def flush(self):
+        """Write one batch from the head of the queue; False when the backend rejected it"""
+        with self.flush_lock:
+            with self.condition:
+                batch = [self.pending[i] for i in range(min(self.batch_size, len(self.pending)))]
+            if not batch:
+                return True
+
+            started = self.clock()
+            matched = self.storage.record_swipes([
+                {key: swipe[key] for key in ('swipe_id', 'swiper_id', 'swiped_id', 'action', 'created_at')}
+                for swipe in batch
+            ])
+            if matched is None:
+                with self.condition:
+                    self.failures += 1
+                return False
+
+            self.log.mark_flushed(batch[-1]['seq'])
+            with self.condition:
+                for _ in batch:
+                    self.pending.popleft()
+                pairs = {(swipe['swiper_id'], swipe['swiped_id']) for swipe in batch}
+                self.coalesced += len(batch) - len(pairs)
+                urgent_in_batch = False
+                for swipe, is_match in zip(batch, matched):
+                    if swipe['seq'] in self.urgent:
+                        self.urgent.discard(swipe['seq'])
+                        urgent_in_batch = True
+                    if swipe['seq'] in self.results:
+                        # A caller is still waiting for this match result
+                        self.results[swipe['seq']] = is_match
+                    if is_match:
+                        self.matches += 1
+                if urgent_in_batch:
+                    self.urgent_flushes += 1
+                self.flushed += len(batch)
+                self.flushes += 1
+                self.batch_sizes.append(len(batch))
+                self.flush_times.append(self.clock() - started)
+                if not self.pending:
+                    self.log.truncate()
+                elif self.log.lines >= self.log.compact_after:
+                    self.log.rewrite(self.pending)
+                self.condition.notify_all()
+            return True
+
+    def stats(self):
+        """Queue depth, batching and flush timing counters"""
+        with self.condition:
+            batch_sizes = list(self.batch_sizes)
+            flush_times = list(self.flush_times)
+            return {
+                'enabled': self.running,
+                'pending': len(self.pending),
+                'queued': self.queued,
+                'replayed': self.replayed,
+                'flushed': self.flushed,
+                'flushes': self.flushes,
+                'coalesced': self.coalesced,
+                'urgent_flushes': self.urgent_flushes,
+                'matches': self.matches,
+                'failures': self.failures,
+                'backpressure': self.backpressure,
+                'wal_lines': self.log.lines,
+                'mean_batch_size': None if not batch_sizes else sum(batch_sizes) / len(batch_sizes),
+                'flush_p50_ms': percentile_ms(flush_times, 0.50),
+                'flush_p99_ms': percentile_ms(flush_times, 0.99)
+            }
+
+def create_swipe_writer(storage):
+    """Create the swipe writer for a backend, write-behind when SWIPE_WRITE_BEHIND=on"""
+    writer = SwipeWriteBehind(
+        storage,
+        wal_path=os.getenv('SWIPE_WAL_PATH', 'swipes.wal'),
+        enabled=os.getenv('SWIPE_WRITE_BEHIND', 'off').lower() in ('on', '1', 'true'),
+        batch_size=int(os.getenv('SWIPE_FLUSH_BATCH', '200')),
+        flush_interval=float(os.getenv('SWIPE_FLUSH_INTERVAL', '0.2')),
+        max_pending=int(os.getenv('SWIPE_QUEUE_MAX', '10000')),
+        match_timeout=float(os.getenv('SWIPE_MATCH_TIMEOUT', '2')),
+        fsync=os.getenv('SWIPE_WAL_FSYNC', 'off').lower() in ('on', '1', 'true')
+    )
+    writer.start()
+    atexit.register(writer.stop)
+    return writer
@@ -0,0 +1,4 @@
+"""
+Tests
+Regression tests for scoring and swipe recording, run with python -m pytest
+"""
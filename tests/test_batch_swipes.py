@@ -0,0 +1,59 @@
+"""
+Batched Swipe Tests
+Matches completed by a batch of swipes, for the Firebase layout and SQLite
+"""
+
+from firebase_paths import batch_swipe_paths, pair_match_id
+from sqlite_service import SQLiteService
+
+def swipe(swipe_id, swiper_id, swiped_id, action):
+    return {'swipe_id': swipe_id, 'swiper_id': swiper_id, 'swiped_id': swiped_id,
+            'action': action, 'created_at': f"2025-01-01T00:00:0{swipe_id[-1]}"}
+
+def match_keys(updates):
+    return sorted(path for path in updates if path.startswith('matches/'))
+
+def test_like_answered_by_a_later_pass_keeps_the_like_from_before_the_batch():
+    # B liked A before the batch
+    swipes = [swipe('s1', 'A', 'B', 'like'), swipe('s2', 'B', 'A', 'pass')]
+    updates, matched = batch_swipe_paths(swipes, [True, False])
+    assert matched == [True, False]
+    assert match_keys(updates) == [f"matches/{pair_match_id('A', 'B')}"]
+    assert updates['likes_received/A/B'] is None
+
+def test_mutual_likes_within_a_batch_match_once_on_the_later_like():
+    swipes = [swipe('s1', 'A', 'B', 'like'), swipe('s2', 'B', 'A', 'like')]
+    updates, matched = batch_swipe_paths(swipes, [False, False])
+    assert matched == [False, True]
+    assert match_keys(updates) == [f"matches/{pair_match_id('A', 'B')}"]
+
+def test_replayed_batch_rewrites_the_same_match():
+    swipes = [swipe('s1', 'A', 'B', 'like'), swipe('s2', 'B', 'A', 'like')]
+    # On replay both likes are already stored
+    updates, matched = batch_swipe_paths(swipes, [True, True])
+    assert matched == [False, True]
+    assert match_keys(updates) == [f"matches/{pair_match_id('A', 'B')}"]
+
+def test_sqlite_batch_keeps_the_like_from_before_the_batch():
+    service = SQLiteService(':memory:')
+    assert service.record_swipe('B', 'A', 'like') == (True, False)
+    matched = service.record_swipes([swipe('s1', 'A', 'B', 'like'), swipe('s2', 'B', 'A', 'pass')])
+    assert matched == [True, False]
+    assert service.check_mutual_like('A', 'B') is False
+    assert service.db.execute("SELECT COUNT(*) FROM matches").fetchone()[0] == 1
+
+def test_sqlite_replayed_batch_creates_one_match():
+    service = SQLiteService(':memory:')
+    swipes = [swipe('s1', 'A', 'B', 'like'), swipe('s2', 'B', 'A', 'like')]
+    assert service.record_swipes(swipes) == [False, True]
+    assert service.record_swipes(swipes) == [False, True]
+    assert service.db.execute("SELECT COUNT(*) FROM matches").fetchone()[0] == 1
+
+def test_sqlite_liking_again_after_a_pass_keeps_one_match():
+    service = SQLiteService(':memory:')
+    service.record_swipe('B', 'A', 'like')
+    assert service.record_swipe('A', 'B', 'like') == (True, True)
+    service.record_swipe('A', 'B', 'pass')
+    assert service.record_swipe('A', 'B', 'like') == (True, True)
+    assert service.create_match('B', 'A')
+    assert service.db.execute("SELECT match_id FROM matches").fetchall() == [(pair_match_id('A', 'B'),)]
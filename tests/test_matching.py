@@ -0,0 +1,59 @@
+"""
+Scoring Tests
+The vectorized batch scorer agrees with the scalar compatibility score
+"""
+
+import copy
+import numpy as np
+from benchmarks.synthetic import SyntheticData
+from matching import (
+    JITTER_POINTS, CandidateBlock, calculate_compatibility_score, id_hash, interest_vocabulary,
+    lifestyle_vocabulary, normalize_profile_fields, pair_jitter, pair_jitters, score_candidates
+)
+
+def generated_profiles(count, seed=7, normalized=True):
+    profiles = []
+    for index, (user_data, profile) in enumerate(SyntheticData(seed).users(count)):
+        profile['user_id'] = f"user{index}"
+        profiles.append(normalize_profile_fields(profile) if normalized else profile)
+    return profiles
+
+def assert_batch_matches_scalar(profiles, jitter):
+    block = CandidateBlock(profiles)
+    for user_profile in profiles[:25]:
+        expected = [calculate_compatibility_score(user_profile, candidate, jitter=jitter) for candidate in profiles]
+        np.testing.assert_allclose(score_candidates(user_profile, block, jitter=jitter), expected, atol=1e-9)
+
+def test_batch_scores_equal_scalar_scores_without_jitter():
+    assert_batch_matches_scalar(generated_profiles(300), jitter=False)
+
+def test_batch_scores_equal_scalar_scores_with_a_fixed_seed():
+    assert_batch_matches_scalar(generated_profiles(300), jitter='2025-01-01')
+
+def test_legacy_profiles_without_derived_fields_score_the_same():
+    profiles = generated_profiles(200, normalized=False)
+    normalized = [normalize_profile_fields(copy.deepcopy(profile)) for profile in profiles]
+    block = CandidateBlock(profiles)
+    for user_profile, normalized_user in zip(profiles[:10], normalized[:10]):
+        np.testing.assert_allclose(score_candidates(user_profile, block, jitter=False),
+                                   score_candidates(normalized_user, CandidateBlock(normalized), jitter=False),
+                                   atol=1e-9)
+
+def test_custom_tags_score_like_the_scalar_scorer_and_leave_the_vocabulary_alone():
+    profiles = generated_profiles(50)
+    for index, profile in enumerate(profiles):
+        # Far more custom tags than a 64-bit mask could hold
+        custom = [f"Custom {tag}" for tag in range(index % 7 * 15)]
+        profile['interests'] = profile['interests'] + custom
+        profile['lifestyle_preferences'] = profile['lifestyle_preferences'] + custom[:3]
+        normalize_profile_fields(profile)
+    known = dict(interest_vocabulary.bits), dict(lifestyle_vocabulary.bits)
+    assert_batch_matches_scalar(profiles, jitter=False)
+    assert (interest_vocabulary.bits, lifestyle_vocabulary.bits) == known
+
+def test_vectorized_jitter_is_bit_identical_to_pair_jitter():
+    match_ids = [f"user{index}" for index in range(1000)] + [None, 17]
+    hashes = np.array([id_hash(match_id) for match_id in match_ids], dtype=np.uint64)
+    jitters = pair_jitters('viewer', hashes, '2025-01-01')
+    assert jitters.tolist() == [pair_jitter('viewer', match_id, '2025-01-01') for match_id in match_ids]
+    assert 0 <= jitters.min() and jitters.max() < JITTER_POINTS
@@ -0,0 +1,59 @@
+"""
+REST Service Tests
+FirebaseRestService against the local Realtime Database stub and the shipped rules
+"""
+
+import json
+import os
+import pytest
+from firebase_rest_service import FirebaseRestService
+from rtdb_stub import RTDBStub
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database.rules.json')
+
+@pytest.fixture
+def stub():
+    with open(RULES_PATH) as f:
+        stub = RTDBStub(rules=json.load(f))
+    stub.start()
+    yield stub
+    stub.stop()
+
+@pytest.fixture
+def service(stub, monkeypatch):
+    monkeypatch.setenv('FIREBASE_DATABASE_URL', stub.url)
+    monkeypatch.setenv('REST_MAX_RETRIES', '0')
+    service = FirebaseRestService()
+    yield service
+    service.session.close()
+    service.fetch_executor.shutdown()
+
+def user(username, email):
+    return {'username': username, 'email': email, 'password_hash': 'x'}
+
+def test_create_user_rejects_a_taken_username(service):
+    user_id = service.create_user(user('alice', 'alice@example.com'))
+    assert user_id is not None
+    assert service.create_user(user('alice', 'other@example.com')) is None
+    assert service.create_user(user('bob', 'Alice@Example.com')) is None
+    assert service.get_user_by_username('alice')[0] == user_id
+    # The failed signups released their claims
+    assert service.create_user(user('bob', 'bob@example.com')) is not None
+
+def test_mutual_like_is_matched(service):
+    assert service.record_swipe('a', 'b', 'like') == (True, False)
+    assert service.record_swipe('b', 'a', 'like') == (True, True)
+    assert service.check_mutual_like('a', 'b')
+    matches = service.session.get(f"{service.database_url}/matches_by_user/a.json").json()
+    assert list(matches) == ['a:b']
+
+def test_iter_node_pages_through_every_child_in_key_order(service, stub):
+    stub.set(['profiles'], {f"user{index:03d}": {'age': 20 + index % 30} for index in range(25)})
+    batches = list(service.iter_node('profiles', batch_size=10))
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert [key for batch in batches for key, value in batch] == [f"user{index:03d}" for index in range(25)]
+
+def test_query_filters_on_an_indexed_child_and_rejects_others(service, stub):
+    stub.set(['users'], {'u1': user('alice', 'a@example.com'), 'u2': user('bob', 'b@example.com')})
+    assert list(service.query('users', 'username', equal_to='bob')) == ['u2']
+    assert service.query('users', 'password_hash', equal_to='x') is None
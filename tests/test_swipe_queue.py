@@ -0,0 +1,99 @@
+"""
+Swipe Queue Tests
+Write-ahead log replay, sequence numbering and adoption of other processes' logs
+"""
+
+import json
+import os
+import pytest
+from swipe_queue import SwipeLog, SwipeWriteBehind
+
+class RecordingStorage:
+    """Backend double that stores batches, or rejects them while unavailable"""
+
+    def __init__(self, available=True):
+        self.available = available
+        self.batches = []
+
+    def record_swipes(self, swipes):
+        if not self.available:
+            return None
+        self.batches.append(swipes)
+        return [False] * len(swipes)
+
+    def has_liked(self, liker_id, liked_id):
+        return False
+
+def write_log(path, records):
+    with open(path, 'w', encoding='utf-8') as log:
+        for record in records:
+            log.write(json.dumps(record) + '\n')
+
+def logged_swipe(seq, swiper_id='a', swiped_id='b', action='pass'):
+    return {'seq': seq, 'swipe_id': f"s{seq}", 'swiper_id': swiper_id, 'swiped_id': swiped_id,
+            'action': action, 'created_at': '2025-01-01T00:00:00'}
+
+def test_replay_skips_flushed_swipes_and_reports_the_highest_seq(tmp_path):
+    path = str(tmp_path / 'swipes.wal')
+    write_log(path, [logged_swipe(1), logged_swipe(2), {'flushed': 2}, logged_swipe(3)])
+    swipes, last_seq = SwipeLog(path).replay()
+    assert [swipe['seq'] for swipe in swipes] == [3]
+    assert last_seq == 3
+
+def test_swipes_acknowledged_after_a_restart_survive_the_next_replay(tmp_path):
+    # A crash between the flushed marker and truncating the log leaves this behind
+    path = str(tmp_path / 'swipes.wal')
+    write_log(path, [logged_swipe(1), logged_swipe(2), logged_swipe(3), {'flushed': 3}])
+
+    writer = SwipeWriteBehind(RecordingStorage(available=False), wal_path=path, retry_interval=0.01)
+    writer.start()
+    try:
+        assert writer.record_swipe('c', 'd', 'pass') == (True, False)
+    finally:
+        writer.stop()
+
+    # The flushed swipes are dropped when the old log is adopted
+    assert not os.path.exists(path)
+    swipes, last_seq = SwipeLog(writer.log.path).replay()
+    assert [(swipe['swiper_id'], swipe['swiped_id'], swipe['seq']) for swipe in swipes] == [('c', 'd', 1)]
+    assert last_seq == 1
+
+def test_unflushed_swipes_are_written_once_after_a_restart(tmp_path):
+    path = str(tmp_path / 'swipes.wal')
+    write_log(path, [logged_swipe(1), {'flushed': 1}, logged_swipe(2, 'a', 'c'), logged_swipe(3, 'b', 'c')])
+
+    storage = RecordingStorage()
+    writer = SwipeWriteBehind(storage, wal_path=path)
+    writer.start()
+    writer.stop()
+
+    assert [swipe['swipe_id'] for batch in storage.batches for swipe in batch] == ['s2', 's3']
+    assert SwipeLog.siblings(path) == []
+
+def test_logs_of_running_processes_are_left_alone(tmp_path):
+    path = str(tmp_path / 'swipes.wal')
+    live = SwipeLog(path + '.1')
+    live.open()
+    live.append(logged_swipe(1, 'a', 'b'))
+    write_log(path + '.2', [logged_swipe(1, 'a', 'c'), {'flushed': 1}, logged_swipe(2, 'b', 'c')])
+
+    storage = RecordingStorage()
+    writer = SwipeWriteBehind(storage, wal_path=path)
+    try:
+        writer.start()
+        writer.stop()
+        assert [swipe['swipe_id'] for batch in storage.batches for swipe in batch] == ['s2']
+        assert SwipeLog.siblings(path) == [path + '.1']
+        assert [swipe['swipe_id'] for swipe in live.replay()[0]] == ['s1']
+    finally:
+        live.remove()
+
+def test_a_log_cannot_be_opened_twice(tmp_path):
+    path = str(tmp_path / 'swipes.wal.1')
+    log = SwipeLog(path)
+    log.open()
+    try:
+        with pytest.raises(RuntimeError):
+            SwipeLog(path).open()
+    finally:
+        log.remove()